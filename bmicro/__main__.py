@@ -4,13 +4,28 @@ def main():
     import sys
     import logging
 
-    from PyQt6 import QtGui, QtWidgets
+    from PyQt6 import QtCore, QtGui, QtWidgets
 
-    from bmicro.gui.main import BMicro
+    from bmicro import profiling
+    from bmicro.workers import WorkerPool
     from bmicro._version import version as __version__
     """
     Starts the BMicro application and handles its life cycle.
     """
+    # Profiling has to be set up before the
+    # instrumented classes are instantiated
+    trace_path = None
+    for arg in sys.argv:
+        if arg == '--profile':
+            trace_path = profiling.default_trace_path()
+        elif arg.startswith('--profile='):
+            trace_path = arg[10:]
+    if trace_path is not None:
+        profiling.instrument()
+        profiling.Profiler.get_instance().enable()
+
+    from bmicro.gui.main import BMicro
+
     app = QtWidgets.QApplication(sys.argv)
     # set window icon
     ref = resources.files('bmicro') / 'img'
@@ -30,10 +45,22 @@ def main():
             log_level = arg[6:]
             logging.basicConfig(level=log_level)
 
+    # The workers start while the user opens a file
+    QtCore.QTimer.singleShot(0, window.start_workers)
+    app.aboutToQuit.connect(WorkerPool.get_instance().shutdown)
+
     if sys.argv[-1].endswith('.h5'):
         window.open_file(sys.argv[-1])
 
-    sys.exit(app.exec())
+    exit_code = app.exec()
+
+    if trace_path is not None:
+        profiler = profiling.Profiler.get_instance()
+        trace_path, summary_path = profiler.write(trace_path)
+        print(profiler.format_summary())
+        print(f'Profile written to {trace_path} and {summary_path}')
+
+    sys.exit(exit_code)
 
 
 if __name__ == '__main__':
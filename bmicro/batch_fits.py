@@ -0,0 +1,449 @@
+"""
+Batched Lorentzian fits of many spectra at once.
+
+Fitting the spectra one by one with `scipy.optimize.least_squares`
+makes the Python call overhead dominate for large maps. Here, the
+region of all spectra is fitted together with a Levenberg-Marquardt
+algorithm operating on an array of parameter vectors, so every
+iteration only takes a few NumPy operations for the whole stack.
+Spectra that converged are dropped from the following iterations.
+
+The model, initial parameters, bounds and cost function are the ones
+of `bmlab.fits`, so the results agree with the sequential fits within
+the fit tolerance.
+"""
+import numpy as np
+from scipy.signal import find_peaks
+
+# The largest number of iterations per fit parameter, like the
+# largest number of function evaluations of `scipy.optimize.least_squares`.
+# Fits not converged by then fail.
+MAX_ITERATIONS_PER_PARAMETER = 100
+
+# The relative change of the parameters at which a fit converged,
+# the same as the default of `scipy.optimize.least_squares`
+TOLERANCE = 1e-8
+
+# The damping parameter of the first iteration and the range it may take
+INITIAL_DAMPING = 1e-3
+MIN_DAMPING = 1e-12
+MAX_DAMPING = 1e16
+
+
+def get_region_data(region, frequencies, spectra):
+    """
+    Returns the data of the given region of all spectra,
+    padded to a common length.
+
+    The region is selected like in `bmlab.fits.fit_lorentz_region`.
+
+    Parameters
+    ----------
+    region: tuple
+        The section of the data to fit
+    frequencies: list
+        The x-data of every spectrum
+    spectra: list
+        The y-data of every spectrum
+
+    Returns
+    -------
+    x: np.ndarray
+        The x-data with the shape (nr_spectra, length)
+    y: np.ndarray
+        The y-data with the shape (nr_spectra, length)
+    valid: np.ndarray
+        Which values of x and y belong to the data,
+        the data of every spectrum starts at the first column
+    """
+    selected = []
+    for xdata, ydata in zip(frequencies, spectra):
+        xdata = np.ravel(np.asarray(xdata, dtype=float))
+        ydata = np.ravel(np.asarray(ydata, dtype=float))
+        if np.isnan(xdata).all():
+            selected.append((xdata[:0], ydata[:0]))
+            continue
+        idx_l = np.nanargmin(np.abs(xdata - region[0]))
+        idx_r = np.nanargmin(np.abs(xdata - region[1]))
+        x = xdata[idx_l:idx_r]
+        y = ydata[idx_l:idx_r]
+        # Mask all NaN values
+        mask = ~(np.isnan(x) | np.isnan(y))
+        selected.append((x[mask], y[mask]))
+
+    length = max([len(x) for x, _ in selected], default=0)
+    x = np.zeros((len(selected), length))
+    y = np.zeros((len(selected), length))
+    valid = np.zeros((len(selected), length), dtype=bool)
+    for idx, (xs, ys) in enumerate(selected):
+        x[idx, :len(xs)] = xs
+        # Keep the padding finite and within the region
+        x[idx, len(xs):] = xs[-1] if len(xs) else 0
+        y[idx, :len(ys)] = ys
+        valid[idx, :len(xs)] = True
+    return x, y, valid
+
+
+def get_initial_parameters(x, y, valid, nr_peaks=1,
+                           bounds_w0=None, bounds_fwhm=None):
+    """
+    Estimates the initial parameters and creates the bounds
+    of the fits like `bmlab.fits`.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        The x-data as returned by `get_region_data`
+    y: np.ndarray
+        The y-data as returned by `get_region_data`
+    valid: np.ndarray
+        The mask as returned by `get_region_data`
+    nr_peaks: int
+        The number of peaks to fit, 1, 2 or 4
+    bounds_w0: np.ndarray
+        The lower and upper bound of every peak center with the
+        shape (nr_spectra, nr_peaks, 2), only used for multi-peak fits
+    bounds_fwhm: np.ndarray
+        The lower and upper bound of every peak width with the
+        shape (nr_spectra, nr_peaks, 2), only used for multi-peak fits
+
+    Returns
+    -------
+    params: np.ndarray
+        The initial parameters with the shape (nr_spectra, 3 * nr_peaks + 1)
+        ordered as center, full-width-half-maximum and intensity of every
+        peak followed by the offset, NaN if they cannot be estimated
+    lower: np.ndarray
+        The lower bounds of the parameters
+    upper: np.ndarray
+        The upper bounds of the parameters
+    """
+    nr_spectra = x.shape[0]
+    nr_params = 3 * nr_peaks + 1
+    params = np.nan * np.ones((nr_spectra, nr_params))
+    lower = -np.inf * np.ones((nr_spectra, nr_params))
+    upper = np.inf * np.ones((nr_spectra, nr_params))
+
+    length = np.count_nonzero(valid, axis=1)
+    fittable = length > 0
+    if not fittable.any():
+        return params, lower, upper
+
+    rows = np.arange(nr_spectra)
+    last = np.maximum(length - 1, 0)
+    x_first, x_last = x[:, 0], x[rows, last]
+    offset = (y[:, 0] + y[rows, last]) / 2.
+    y_masked = np.where(valid, y, -np.inf)
+    y_max = np.max(y_masked, axis=1)
+    intensity = y_max - offset
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = (x_last - x_first) / length
+
+    if nr_peaks == 1:
+        w0 = x[rows, np.argmax(y_masked, axis=1)]
+        # This is the position of the first value higher than
+        # offset + intensity / 2, like in bmlab
+        above = valid & (y > (offset + intensity / 2)[:, np.newaxis])
+        fwhm = 2 * np.abs(w0 - x[rows, np.argmax(above, axis=1)])
+        fwhm = np.where(fwhm <= 0, 2 * step, fwhm)
+
+        params[:] = np.column_stack((w0, fwhm, intensity, offset))
+        lower[:] = np.column_stack(
+            (x_first, step, np.zeros(nr_spectra), np.zeros(nr_spectra)))
+        upper[:] = np.column_stack(
+            (x_last, x_last - x_first, 2 * y_max, 2 * y_max))
+    else:
+        w0 = np.nan * np.ones((nr_spectra, nr_peaks))
+        for idx in np.flatnonzero(fittable):
+            # We use the peaks with the highest prominence
+            peaks, properties = find_peaks(y[idx, :length[idx]],
+                                           prominence=1)
+            if len(peaks) < nr_peaks:
+                continue
+            order = np.argsort(properties['prominences'])[::-1]
+            w0[idx] = x[idx, np.sort(peaks[order[0:nr_peaks]])]
+        fwhm = 10 * step[:, np.newaxis] * np.ones(nr_peaks)
+
+        # Like bmlab, we only constrain the fit if bounds are given
+        if bounds_w0 is not None or bounds_fwhm is not None:
+            # The instrument width is far higher than the step size
+            lower[:, 1:-1:3] = step[:, np.newaxis]
+            # intensities and offset
+            lower[:, 2::3] = 0
+            lower[:, -1] = 0
+
+            if bounds_w0 is not None:
+                bounds_w0 = np.asarray(bounds_w0, dtype=float)
+                lower[:, 0:-1:3] = bounds_w0[..., 0]
+                upper[:, 0:-1:3] = bounds_w0[..., 1]
+                if nr_peaks == 2:
+                    # Sort the guesses to the bounds
+                    center = np.mean(np.clip(
+                        bounds_w0, x_first[:, np.newaxis, np.newaxis],
+                        x_last[:, np.newaxis, np.newaxis]), axis=2)
+                    reverse = center[:, 0] > center[:, 1]
+                    w0[reverse] = w0[reverse, ::-1]
+                w0 = np.clip(w0, bounds_w0[..., 0], bounds_w0[..., 1])
+
+            if bounds_fwhm is not None:
+                bounds_fwhm = np.asarray(bounds_fwhm, dtype=float)
+                lower[:, 1:-1:3] = bounds_fwhm[..., 0]
+                upper[:, 1:-1:3] = bounds_fwhm[..., 1]
+                fwhm = np.clip(fwhm, bounds_fwhm[..., 0],
+                               bounds_fwhm[..., 1])
+
+        params[:, 0:-1:3] = w0
+        params[:, 1:-1:3] = fwhm
+        params[:, 2:-1:3] = intensity[:, np.newaxis]
+        params[:, -1] = offset
+
+    params[~fittable] = np.nan
+    return params, lower, upper
+
+
+def multi_lorentz(x, params, nr_peaks):
+    """
+    Evaluates the sum of Lorentzian peaks plus offset and its
+    derivatives with respect to the parameters for every spectrum.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        The x-data with the shape (nr_spectra, length)
+    params: np.ndarray
+        The parameters with the shape (nr_spectra, 3 * nr_peaks + 1)
+    nr_peaks: int
+        The number of peaks
+
+    Returns
+    -------
+    model: np.ndarray
+        The model with the shape (nr_spectra, length)
+    jacobian: np.ndarray
+        The derivatives with the shape (nr_spectra, length, nr_params)
+    """
+    model = params[:, -1:] * np.ones(x.shape)
+    jacobian = np.empty((*x.shape, params.shape[1]))
+    for peak in range(nr_peaks):
+        w0, fwhm, intensity = [params[:, 3 * peak + idx, np.newaxis]
+                               for idx in range(3)]
+        dx = x - w0
+        denominator = dx ** 2 + (fwhm / 2) ** 2
+        shape = (fwhm / 2) ** 2 / denominator
+        model += intensity * shape
+        jacobian[..., 3 * peak] = 2 * intensity * shape * dx / denominator
+        jacobian[..., 3 * peak + 1] =\
+            intensity * fwhm / 2 * dx ** 2 / denominator ** 2
+        jacobian[..., 3 * peak + 2] = shape
+    jacobian[..., -1] = 1
+    return model, jacobian
+
+
+def levenberg_marquardt(x, y, valid, nr_peaks, params, lower, upper,
+                        max_iterations=None, tolerance=TOLERANCE):
+    """
+    Fits the sum of Lorentzian peaks plus offset to all spectra at once.
+
+    Like in `bmlab.fits`, the residuals are the squared differences
+    between data and model, so the cost is the sum of the fourth power
+    of the differences. Steps leaving the bounds are projected back
+    onto them.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        The x-data with the shape (nr_spectra, length)
+    y: np.ndarray
+        The y-data with the shape (nr_spectra, length)
+    valid: np.ndarray
+        Which values of x and y belong to the data
+    nr_peaks: int
+        The number of peaks
+    params: np.ndarray
+        The initial parameters with the shape (nr_spectra, nr_params)
+    lower: np.ndarray
+        The lower bounds of the parameters
+    upper: np.ndarray
+        The upper bounds of the parameters
+    max_iterations: int
+        The largest number of iterations, depends on the
+        number of parameters if not given
+    tolerance: float
+        The relative change of the parameters at which a fit converged
+
+    Returns
+    -------
+    params: np.ndarray
+        The fitted parameters
+    converged: np.ndarray
+        Which fits converged
+    """
+    weights = valid.astype(float)
+    params = np.clip(params, lower, upper)
+    nr_spectra, nr_params = params.shape
+    if max_iterations is None:
+        max_iterations = MAX_ITERATIONS_PER_PARAMETER * nr_params
+    converged = np.zeros(nr_spectra, dtype=bool)
+    damping = INITIAL_DAMPING * np.ones(nr_spectra)
+
+    def linearize(rows):
+        model, jacobian = multi_lorentz(x[rows], params[rows], nr_peaks)
+        error = weights[rows] * (y[rows] - model)
+        jacobian = weights[rows][..., np.newaxis] * jacobian
+        # The cost is the sum of error ** 4. Its Hessian is approximated by
+        # 12 * error ** 2 * J^T J, which converges faster than the
+        # Gauss-Newton approximation 8 * error ** 2 * J^T J of the squared
+        # residuals, since it is the exact Hessian for a linear model.
+        return (np.sum(error ** 4, axis=1),
+                12 * np.einsum('nk,nki,nkj->nij', error ** 2,
+                               jacobian, jacobian),
+                -4 * np.einsum('nk,nki->ni', error ** 3, jacobian))
+
+    active = np.arange(nr_spectra)
+    cost, hessian, gradient = linearize(active)
+    identity = np.eye(nr_params)
+    for _ in range(max_iterations):
+        if not active.size:
+            break
+        # Marquardt's scaling of the damping by the diagonal
+        diagonal = np.diagonal(hessian, axis1=1, axis2=2)
+        diagonal = np.maximum(
+            diagonal, 1e-12 * np.max(diagonal, axis=1, keepdims=True))
+        diagonal = np.where(diagonal > 0, diagonal, 1)
+        system = hessian + (damping[active, np.newaxis] * diagonal)[
+            ..., np.newaxis] * identity
+        try:
+            step = np.linalg.solve(system, -gradient[..., np.newaxis])[..., 0]
+        except np.linalg.LinAlgError:
+            step = np.einsum('nij,nj->ni', np.linalg.pinv(system), -gradient)
+
+        current = params[active]
+        trial = np.clip(current + step, lower[active], upper[active])
+        model, _ = multi_lorentz(x[active], trial, nr_peaks)
+        trial_cost = np.sum(
+            (weights[active] * (y[active] - model)) ** 4, axis=1)
+
+        improved = trial_cost < cost
+        step_norm = np.linalg.norm(trial - current, axis=1)
+        done = improved & (
+            (step_norm <= tolerance * (tolerance + np.linalg.norm(
+                current, axis=1))) |
+            (cost - trial_cost <= tolerance * cost) |
+            (trial_cost == 0))
+        damping[active] = np.where(
+            improved, np.maximum(damping[active] / 10, MIN_DAMPING),
+            damping[active] * 10)
+        # If no step reduces the cost, we are at the minimum
+        done |= damping[active] > MAX_DAMPING
+
+        params[active[improved]] = trial[improved]
+        converged[active[done]] = True
+
+        keep = ~done
+        recompute = improved & keep
+        cost, hessian, gradient = cost[keep], hessian[keep], gradient[keep]
+        # Only linearize again where the parameters changed
+        if recompute.any():
+            rows = recompute[keep]
+            (cost[rows], hessian[rows],
+             gradient[rows]) = linearize(active[recompute])
+        active = active[keep]
+
+    return params, converged
+
+
+def fit_lorentz_regions(region, frequencies, spectra, nr_peaks=1,
+                        bounds_w0=None, bounds_fwhm=None, guesses=None):
+    """
+    Fits one or several Lorentzian peaks to the given region
+    of all spectra, like `bmlab.fits.fit_lorentz_region`
+    does for a single spectrum.
+
+    Parameters
+    ----------
+    region: tuple
+        The section of the data to fit
+    frequencies: list
+        The x-data of every spectrum
+    spectra: list
+        The y-data of every spectrum
+    nr_peaks: int
+        The number of peaks to fit, 1, 2 or 4
+    bounds_w0: np.ndarray
+        The lower and upper bound of every peak center with the
+        shape (nr_spectra, nr_peaks, 2), only used for multi-peak fits
+    bounds_fwhm: np.ndarray
+        The lower and upper bound of every peak width with the
+        shape (nr_spectra, nr_peaks, 2), only used for multi-peak fits
+    guesses: np.ndarray
+        Initial parameters with the shape (nr_spectra, 3 * nr_peaks + 1)
+        as described in `get_initial_parameters`, e.g. of a neighbouring
+        fit. They are estimated from the spectrum where not finite.
+
+    Returns
+    -------
+    w0: np.ndarray
+        The centers with the shape (nr_spectra, nr_peaks)
+    fwhm: np.ndarray
+        The full-width-half-maxima with the shape (nr_spectra, nr_peaks)
+    intensity: np.ndarray
+        The intensities with the shape (nr_spectra, nr_peaks)
+    offset: np.ndarray
+        The offsets with the shape (nr_spectra,)
+    All values are NaN where the fit failed.
+    """
+    x, y, valid = get_region_data(region, frequencies, spectra)
+    if nr_peaks == 1:
+        bounds_w0 = bounds_fwhm = None
+    params, lower, upper = get_initial_parameters(
+        x, y, valid, nr_peaks, bounds_w0, bounds_fwhm)
+    with np.errstate(invalid='ignore'):
+        # Like `scipy.optimize.least_squares`, we need valid bounds
+        # and initial parameters within them
+        feasible = np.all((lower < upper) & (params >= lower) &
+                          (params <= upper), axis=1)
+        if guesses is not None:
+            guesses = np.asarray(guesses, dtype=float)
+            seeded = np.isfinite(guesses).all(axis=1) &\
+                np.all(lower < upper, axis=1) & valid.any(axis=1)
+            params[seeded] = np.clip(guesses[seeded], lower[seeded],
+                                     upper[seeded])
+            feasible |= seeded
+
+    # Scale the data of every spectrum to the order of one,
+    # so the damping treats all parameters alike
+    x_first = x[:, 0]
+    x_last = x[np.arange(x.shape[0]),
+               np.maximum(np.count_nonzero(valid, axis=1) - 1, 0)]
+    shift = np.zeros(params.shape)
+    scale = np.ones(params.shape)
+    shift[:, 0:-1:3] = ((x_first + x_last) / 2)[:, np.newaxis]
+    x_scale = (x_last - x_first) / 2
+    scale[:, 0:-1:3] = scale[:, 1:-1:3] =\
+        np.where(x_scale > 0, x_scale, 1)[:, np.newaxis]
+    y_scale = np.max(np.abs(np.where(valid, y, 0)), axis=1, initial=0)
+    # intensities and offset
+    scale[:, 2::3] = scale[:, -1:] =\
+        np.where(y_scale > 0, y_scale, 1)[:, np.newaxis]
+
+    w0 = np.nan * np.ones((x.shape[0], nr_peaks))
+    fwhm, intensity = w0.copy(), w0.copy()
+    offset = np.nan * np.ones(x.shape[0])
+    rows = np.flatnonzero(feasible)
+    if rows.size:
+        fitted, converged = levenberg_marquardt(
+            (x[rows] - shift[rows, 0:1]) / scale[rows, 0:1],
+            y[rows] / scale[rows, -1:],
+            valid[rows],
+            nr_peaks,
+            (params[rows] - shift[rows]) / scale[rows],
+            (lower[rows] - shift[rows]) / scale[rows],
+            (upper[rows] - shift[rows]) / scale[rows],
+        )
+        fitted = fitted * scale[rows] + shift[rows]
+        fitted[~converged] = np.nan
+        w0[rows] = fitted[:, 0:-1:3]
+        fwhm[rows] = fitted[:, 1:-1:3]
+        intensity[rows] = fitted[:, 2:-1:3]
+        offset[rows] = fitted[:, -1]
+    return w0, fwhm, intensity, offset
@@ -0,0 +1,359 @@
+"""
+Benchmark suite for the BMicro evaluation pipeline.
+
+Every stage BMicro drives when evaluating a file is timed on synthetic
+data sets of increasing map size. The results are stored as JSON and
+can be compared against a previously stored baseline to catch
+performance regressions. Run it from the console via
+
+    python -m bmicro.benchmark --sizes 4 8 16 --output results.json
+
+and compare against a baseline with
+
+    python -m bmicro.benchmark --baseline baseline.json
+"""
+import argparse
+import datetime
+import json
+import logging
+import pathlib
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from bmlab import __version__ as bmlabversion
+from bmlab.controllers import ExtractionController, CalibrationController, \
+    PeakSelectionController, ExportController
+from bmlab.models.setup import AVAILABLE_SETUPS
+from bmlab.session import Session
+
+from bmicro import __version__ as bmicroversion
+from bmicro import export, hdf5, prefetch
+from bmicro.evaluation import ChunkedEvaluationController, FIT_ENGINES
+from bmicro.synthetic import write_dataset
+
+logger = logging.getLogger(__name__)
+
+# The pipeline stages in the order BMicro runs them
+STAGES = ['open', 'read_images', 'find_points_all', 'calibrate_all',
+          'peak_selection', 'evaluate', 'export', 'save']
+
+# Stages faster than this [s] are too noisy to compare reliably
+MIN_DURATION = 0.05
+
+
+def run_pipeline(path, nr_workers=1, engine='sequential', chunk_cache=None,
+                 read_ahead=hdf5.READ_AHEAD, cold=False,
+                 prefetch_depth=prefetch.PREFETCH_DEPTH):
+    """
+    Evaluates the given file the same way the batch evaluation does
+    and measures the time every stage takes.
+
+    Parameters
+    ----------
+    path: pathlib.Path
+        The source file to evaluate
+    nr_workers: int
+        The number of processes to evaluate in
+    engine: str
+        The fit engine to evaluate with
+    chunk_cache: float
+        The size of the HDF5 chunk cache [MiB],
+        the HDF5 default if not given
+    read_ahead: int
+        The number of images to read ahead during the evaluation
+    cold: bool
+        Drop the file from the page cache of the operating system
+        before opening and evaluating it, so the images are read
+        from the storage
+    prefetch_depth: int
+        The number of measurement points whose spectra are extracted
+        ahead on a separate thread during the evaluation
+
+    Returns
+    -------
+    durations: dict
+        The duration [s] of every stage in `STAGES`
+    brillouin_shift: dict
+        The evaluated Brillouin shift [Hz] of every repetition
+    """
+    session = Session.get_instance()
+    durations = dict.fromkeys(STAGES, 0.0)
+    brillouin_shift = {}
+
+    def timed(stage, func, *args, **kwargs):
+        start = time.perf_counter()
+        func(*args, **kwargs)
+        durations[stage] += time.perf_counter() - start
+
+    def read_images():
+        # Read all images in the order the evaluation does
+        image_keys = session.get_image_keys(True)
+        images_ahead = hdf5.ReadAhead(
+            session.file, session.current_repetition().payload,
+            image_keys, read_ahead)
+        try:
+            for image_key in image_keys:
+                images_ahead(image_key)
+                session.get_payload_image(image_key)
+        finally:
+            images_ahead.close()
+
+    def calibrate_all():
+        cc = CalibrationController()
+        for calib_key in session.get_calib_keys():
+            cc.find_peaks(calib_key)
+            cc.calibrate(calib_key)
+
+    def select_peaks():
+        psc = PeakSelectionController()
+        for region in [(4e9, 6e9), (9e9, 11e9)]:
+            psc.add_brillouin_region_frequency(region)
+        for region in [(-2e9, 2e9), (13e9, 17e9)]:
+            psc.add_rayleigh_region_frequency(region)
+
+    def open_file():
+        session.set_file(path)
+        hdf5.set_chunk_cache(session.file, chunk_cache)
+
+    try:
+        if cold:
+            hdf5.evict(path)
+        timed('open', open_file)
+        for rep_key in session.file.repetition_keys():
+            session.set_current_repetition(rep_key)
+            session.set_setup(AVAILABLE_SETUPS[0])
+            session.set_rotation(0)
+            session.set_reflection(vertically=False, horizontally=True)
+
+            if cold:
+                hdf5.evict(path)
+            timed('read_images', read_images)
+            timed('find_points_all',
+                  ExtractionController().find_points_all)
+            timed('calibrate_all', calibrate_all)
+            timed('peak_selection', select_peaks)
+            evc = ChunkedEvaluationController()
+            if cold:
+                hdf5.evict(path)
+            timed('evaluate', evc.evaluate, nr_workers=nr_workers,
+                  engine=engine, read_ahead=read_ahead,
+                  prefetch_depth=prefetch_depth)
+            # get_data scales the shift to GHz
+            brillouin_shift[rep_key] =\
+                1e9 * evc.get_data('brillouin_shift_f')[0]
+            timed('export', export.export,
+                  ExportController.get_configuration())
+        timed('save', session.save)
+    finally:
+        session.clear()
+
+    return durations, brillouin_shift
+
+
+def run_benchmark(sizes=(4, 8, 16), nr_frames=2, nr_workers=1,
+                  directory=None, engine='sequential', chunk_cache=None,
+                  read_ahead=hdf5.READ_AHEAD, cold=False,
+                  prefetch_depth=prefetch.PREFETCH_DEPTH):
+    """
+    Runs the pipeline benchmark on square maps of the given sizes.
+
+    Parameters
+    ----------
+    sizes: list of int
+        The number of measurement points along x and y
+    nr_frames: int
+        Number of images per measurement point
+    nr_workers: int
+        The number of processes to evaluate in
+    directory: pathlib.Path
+        Where to put the synthetic data sets,
+        a temporary directory is used if not given
+    engine: str
+        The fit engine to evaluate with
+    chunk_cache: float
+        The size of the HDF5 chunk cache [MiB],
+        the HDF5 default if not given
+    read_ahead: int
+        The number of images to read ahead during the evaluation
+    cold: bool
+        Read the images from the storage instead of the page cache
+    prefetch_depth: int
+        The number of measurement points whose spectra are extracted
+        ahead on a separate thread during the evaluation
+
+    Returns
+    -------
+    results: dict
+        The benchmark results with the timings of every map size
+        and the maximum deviation [Hz] of the evaluated Brillouin
+        shift from the ground truth
+    """
+    results = {
+        'metadata': {
+            'date': datetime.datetime.now().isoformat(),
+            'bmicro': bmicroversion,
+            'bmlab': bmlabversion,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'runs': [],
+    }
+
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        if directory is None:
+            directory = tmp_dir
+        for size in sizes:
+            resolution = (size, size, 1)
+            path = pathlib.Path(directory) / f'benchmark_{size}x{size}.h5'
+            ground_truth = write_dataset(path, resolution,
+                                         nr_frames=nr_frames)
+            durations, brillouin_shift = run_pipeline(
+                path, nr_workers, engine, chunk_cache, read_ahead, cold,
+                prefetch_depth)
+            logger.info(f'Map {size}x{size}: {durations}')
+            error = max(float(np.nanmax(np.abs(
+                brillouin_shift[rep_key] - truth['brillouin_shift_f'])))
+                for rep_key, truth in ground_truth.items())
+            results['runs'].append({
+                'resolution': list(resolution),
+                'nr_frames': nr_frames,
+                'nr_workers': nr_workers,
+                'engine': engine,
+                'chunk_cache': chunk_cache,
+                'read_ahead': read_ahead,
+                'cold': cold,
+                'prefetch_depth': prefetch_depth,
+                'stages': durations,
+                'error': error,
+            })
+
+    return results
+
+
+def compare_results(results, baseline, tolerance=0.25):
+    """
+    Compares benchmark results against a baseline.
+
+    Parameters
+    ----------
+    results: dict
+        The current benchmark results
+    baseline: dict
+        The stored benchmark results to compare to
+    tolerance: float
+        Relative slowdown that is still accepted
+
+    Returns
+    -------
+    regressions: list of dict
+        All stages that got slower than allowed
+    """
+    def run_key(run):
+        return (tuple(run['resolution']), run['nr_frames'],
+                run.get('nr_workers', 1),
+                run.get('engine', 'sequential'),
+                run.get('chunk_cache'),
+                run.get('read_ahead', hdf5.READ_AHEAD),
+                run.get('cold', False),
+                run.get('prefetch_depth', prefetch.PREFETCH_DEPTH))
+
+    baseline_runs = {run_key(run): run for run in baseline['runs']}
+
+    regressions = []
+    for run in results['runs']:
+        reference = baseline_runs.get(run_key(run))
+        if reference is None:
+            continue
+        for stage, duration in run['stages'].items():
+            expected = reference['stages'].get(stage)
+            if expected is None or expected < MIN_DURATION:
+                continue
+            ratio = duration / expected
+            if ratio > 1 + tolerance:
+                regressions.append({
+                    'resolution': run['resolution'],
+                    'stage': stage,
+                    'baseline': expected,
+                    'duration': duration,
+                    'ratio': ratio,
+                })
+    return regressions
+
+
+def print_results(results):
+    header = f"{'map':>12}" + ''.join(f'{stage:>17}' for stage in STAGES)
+    print(header + f"{'error [MHz]':>17}")
+    for run in results['runs']:
+        size = 'x'.join(str(r) for r in run['resolution'])
+        print(f'{size:>12}' + ''.join(
+            f"{run['stages'].get(stage, np.nan):>17.3f}"
+            for stage in STAGES) + f"{1e-6 * run.get('error', np.nan):>17.1f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bmicro.benchmark',
+        description='Time the BMicro evaluation pipeline '
+                    'on synthetic data sets.')
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4, 8, 16],
+                        help='number of measurement points along x and y')
+    parser.add_argument('--frames', type=int, default=2,
+                        help='number of images per measurement point')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='number of processes to evaluate in')
+    parser.add_argument('--engine', choices=FIT_ENGINES,
+                        default='sequential',
+                        help='fit engine to evaluate with')
+    parser.add_argument('--chunk-cache', type=float,
+                        help='size of the HDF5 chunk cache [MiB]')
+    parser.add_argument('--read-ahead', type=int, default=hdf5.READ_AHEAD,
+                        help='number of images to read ahead during '
+                             'the evaluation, 0 to disable')
+    parser.add_argument('--prefetch', type=int,
+                        default=prefetch.PREFETCH_DEPTH,
+                        help='number of measurement points extracted ahead '
+                             'during the evaluation, 0 to disable')
+    parser.add_argument('--cold', action='store_true',
+                        help='drop the data sets from the page cache before '
+                             'opening and evaluating them')
+    parser.add_argument('--output', type=pathlib.Path,
+                        help='store the results as JSON in this file')
+    parser.add_argument('--baseline', type=pathlib.Path,
+                        help='compare the results to this JSON file')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='relative slowdown accepted before a stage '
+                             'counts as regression')
+    args = parser.parse_args(argv)
+
+    results = run_benchmark(args.sizes, nr_frames=args.frames,
+                            nr_workers=args.workers, engine=args.engine,
+                            chunk_cache=args.chunk_cache,
+                            read_ahead=args.read_ahead, cold=args.cold,
+                            prefetch_depth=args.prefetch)
+    print_results(results)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_results(results, baseline, args.tolerance)
+        for regression in regressions:
+            size = 'x'.join(str(r) for r in regression['resolution'])
+            print(f"Regression in '{regression['stage']}' for map {size}: "
+                  f"{regression['duration']:.3f} s instead of "
+                  f"{regression['baseline']:.3f} s "
+                  f"({regression['ratio']:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,221 @@
+"""
+Checkpoints of running evaluations.
+
+Evaluating a large map takes hours, and a crash would lose all fits done
+so far. While evaluating, the fit results of the completed measurement
+points are therefore appended to a sidecar file next to the session file
+at a configurable interval. When the evaluation of the same repetition
+is started again with the same configuration, the points stored in the
+checkpoint are not fitted again. The checkpoint is removed once the
+evaluation finished.
+
+The sidecar file is only ever appended to. The results of new points are
+written first and their keys last, so the points of an interrupted write
+are ignored when the checkpoint is read.
+"""
+import hashlib
+import logging
+import os
+import pathlib
+import time
+
+import h5py
+import numpy as np
+
+from bmlab.session import get_session_file_path
+
+logger = logging.getLogger(__name__)
+
+# How often the completed points are written to the checkpoint [s]
+CHECKPOINT_INTERVAL = 60
+
+
+def get_checkpoint_path(file_path, rep_key):
+    """
+    Returns the path of the checkpoint of a repetition,
+    which is stored next to the session file.
+    """
+    session_file = get_session_file_path(file_path, create_folder=True)
+    return pathlib.Path(session_file).with_suffix(
+        f'.checkpoint-{rep_key}.h5')
+
+
+def _update_hash(hash_object, value):
+    if isinstance(value, (list, tuple)):
+        hash_object.update(f'[{len(value)}'.encode())
+        for item in value:
+            _update_hash(hash_object, item)
+        hash_object.update(b']')
+    elif isinstance(value, np.ndarray):
+        hash_object.update(f'{value.dtype}{value.shape}'.encode())
+        hash_object.update(np.ascontiguousarray(value).tobytes())
+    else:
+        hash_object.update(repr(value).encode())
+
+
+def get_configuration(evaluation_context, shape):
+    """
+    Returns a hash of everything the fit results depend on.
+
+    Parameters
+    ----------
+    evaluation_context: bmicro.context.EvaluationContext
+        The context of the evaluation
+    shape: tuple
+        The shape of the results arrays, which contains the
+        payload resolution and the number of images
+
+    Returns
+    -------
+    configuration: str
+        The hash
+    """
+    hash_object = hashlib.sha256()
+    # The token differs for every context
+    _update_hash(hash_object, evaluation_context[1:])
+    _update_hash(hash_object, tuple(shape))
+    return hash_object.hexdigest()
+
+
+class Checkpoint(object):
+    """
+    Append-only store of the fit results of the measurement
+    points completed by an evaluation.
+    """
+
+    def __init__(self, path, configuration, interval=CHECKPOINT_INTERVAL):
+        """
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            The sidecar file
+        configuration: str
+            The configuration of the evaluation as returned by
+            `get_configuration`. A checkpoint written for
+            another configuration is discarded.
+        interval: float
+            How often the completed points are written [s],
+            0 writes them immediately
+        """
+        self.path = pathlib.Path(path)
+        self.configuration = configuration
+        self.interval = interval
+        # The keys of the points written to the file
+        self.stored = set()
+        # The points not written yet as (image_keys, values)
+        self.pending = []
+        self.last_flush = time.monotonic()
+
+    def load(self, results, resolution):
+        """
+        Reads the results of the points stored in the checkpoint.
+
+        Parameters
+        ----------
+        results: dict
+            The results arrays by parameter as in the evaluation
+            model, the stored points are written to them
+        resolution: tuple
+            The payload resolution
+
+        Returns
+        -------
+        image_keys: list
+            The keys of the stored points
+        """
+        self.stored = set()
+        if not self.path.exists():
+            return []
+        try:
+            with h5py.File(self.path, 'r') as file:
+                if file.attrs.get('configuration') != self.configuration:
+                    logger.info('Discarding the checkpoint of another '
+                                'evaluation configuration')
+                    keys = None
+                else:
+                    keys = file['keys'][()]
+                    # The image keys enumerate the points in Fortran order
+                    ind = np.unravel_index(keys, resolution, order='F')
+                    for parameter, array in results.items():
+                        array[ind] = file[parameter][:len(keys)]
+        except (OSError, KeyError, ValueError) as error:
+            logger.warning(f"Discarding the unreadable checkpoint "
+                           f"'{self.path}': {error}")
+            keys = None
+        if keys is None:
+            self.remove()
+            return []
+        self.stored = {str(key) for key in keys}
+        return [str(key) for key in keys]
+
+    def append(self, image_keys, values):
+        """
+        Adds completed points to the checkpoint and writes
+        them if the checkpoint interval passed.
+
+        Parameters
+        ----------
+        image_keys: list
+            The keys of the points
+        values: dict
+            The results of the points by parameter,
+            stacked along the first axis
+        """
+        new = [idx for idx, image_key in enumerate(image_keys)
+               if image_key not in self.stored]
+        if new:
+            self.pending.append((
+                [image_keys[idx] for idx in new],
+                {parameter: np.asarray(value)[new]
+                 for parameter, value in values.items()}))
+        if time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self):
+        """ Writes the pending points to the checkpoint """
+        self.last_flush = time.monotonic()
+        if not self.pending:
+            return
+        image_keys = [image_key for keys, _ in self.pending
+                      for image_key in keys]
+        values = {parameter: np.concatenate(
+                      [chunk[parameter] for _, chunk in self.pending])
+                  for parameter in self.pending[0][1]}
+        try:
+            with h5py.File(self.path, 'a') as file:
+                if file.attrs.get('configuration') != self.configuration:
+                    file.clear()
+                    file.attrs['configuration'] = self.configuration
+                if 'keys' not in file:
+                    file.create_dataset('keys', shape=(0,), dtype='i8',
+                                        maxshape=(None,), chunks=True)
+                nr_stored = len(file['keys'])
+                nr_points = nr_stored + len(image_keys)
+                for parameter, value in values.items():
+                    if parameter not in file:
+                        file.create_dataset(
+                            parameter, shape=(0, *value.shape[1:]),
+                            dtype=value.dtype,
+                            maxshape=(None, *value.shape[1:]), chunks=True)
+                    dataset = file[parameter]
+                    dataset.resize(nr_points, axis=0)
+                    dataset[nr_stored:] = value
+                # The points only count when their keys are written
+                file['keys'].resize((nr_points,))
+                file['keys'][nr_stored:] = np.array(image_keys, dtype=int)
+        except OSError as error:
+            # The evaluation goes on without checkpoint
+            logger.warning(f"Could not write the checkpoint "
+                           f"'{self.path}': {error}")
+            return
+        self.stored.update(image_keys)
+        self.pending = []
+
+    def remove(self):
+        """ Removes the checkpoint """
+        self.stored = set()
+        self.pending = []
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
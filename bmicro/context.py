@@ -0,0 +1,172 @@
+"""
+Compact description of an evaluation for the worker processes.
+
+The session holds the open raw data file and the models of all
+repetitions, so it cannot be sent to the worker processes. Instead, the
+`EvaluationContext` holds only what is needed to evaluate measurement
+points of a single repetition: the path of the raw data file, the
+repetition, the image orientation, the extraction arcs, the frequency
+axes of the calibration and the fit settings. It consists of plain
+values and NumPy arrays only, so it pickles quickly.
+
+`apply_context` sets up the session of a worker process from a context.
+The worker can then fit any measurement point of the repetition, and
+extract it after opening the raw data file with `open_file`.
+"""
+import collections
+import contextlib
+import uuid
+
+import numpy as np
+
+from bmlab.file import BrillouinFile
+from bmlab.models.calibration_model import CalibrationModel
+from bmlab.models.evaluation_model import EvaluationModel
+from bmlab.models.extraction_model import ExtractionModel
+from bmlab.models.orientation import Orientation
+from bmlab.session import Session
+
+EvaluationContext = collections.namedtuple('EvaluationContext', [
+    # Identifies the context, so a worker only sets up its session
+    # when it gets a new one
+    'token',
+    'file_path',
+    'rep_key',
+    # The rotation and whether the images are
+    # reflected vertically and horizontally
+    'orientation',
+    # The times and positions of the extraction arcs of every calibration
+    'arc_times',
+    'arcs',
+    # The times and frequency axes of every calibration
+    'calib_times',
+    'frequencies',
+    # The evaluation settings as used by
+    # `bmicro.evaluation.ChunkedEvaluationController`
+    'settings',
+])
+
+# The token of the context the session of this process was set up
+# with and the evaluation model created for it
+_applied = (None, None)
+
+
+def _frozen(value):
+    """ Returns a read-only copy of an array or a list of arrays """
+    if isinstance(value, (list, tuple)):
+        return tuple(_frozen(item) for item in value)
+    array = np.array(value)
+    array.flags.writeable = False
+    return array
+
+
+def create_context(settings):
+    """
+    Creates the context of the current repetition of the session.
+
+    Parameters
+    ----------
+    settings: dict
+        The evaluation settings
+
+    Returns
+    -------
+    context: EvaluationContext
+        The context
+    """
+    session = Session.get_instance()
+    em = session.extraction_model()
+    cm = session.calibration_model()
+    orientation = session.orientation
+    # The session does not expose the key of the current repetition
+    rep_key = next(key for key, model in session.extraction_models.items()
+                   if model is em)
+    return EvaluationContext(
+        token=uuid.uuid4().hex,
+        file_path=str(session.file.path),
+        rep_key=rep_key,
+        orientation=(orientation.rotation,
+                     orientation.reflection['vertically'],
+                     orientation.reflection['horizontally']),
+        arc_times=tuple(em.calib_times.items()),
+        arcs=tuple((calib_key, _frozen(positions))
+                   for calib_key, positions in em.positions.items()),
+        calib_times=tuple(cm.calib_times.items()),
+        frequencies=tuple((calib_key, _frozen(frequencies))
+                          for calib_key, frequencies
+                          in cm.frequencies.items()),
+        settings=tuple(settings.items()),
+    )
+
+
+def get_settings(context):
+    """ Returns the evaluation settings of a context as dictionary """
+    return dict(context.settings)
+
+
+def apply_context(context):
+    """
+    Sets up the models of the session of this process
+    from a context, unless they already are.
+
+    Parameters
+    ----------
+    context: EvaluationContext
+        The context
+    """
+    global _applied
+    session = Session.get_instance()
+    token, evm = _applied
+    if token == context.token and\
+            session.evaluation_models.get(context.rep_key) is evm:
+        return
+
+    rotation, vertically, horizontally = context.orientation
+    session.orientation = Orientation(
+        rotation, {'vertically': vertically, 'horizontally': horizontally})
+
+    em = ExtractionModel()
+    em.calib_times = dict(context.arc_times)
+    em.positions = {calib_key: np.array(positions)
+                    for calib_key, positions in context.arcs}
+    em.refresh_positions_interpolation()
+
+    cm = CalibrationModel()
+    cm.calib_times = dict(context.calib_times)
+    cm.frequencies = {calib_key: [np.array(axis) for axis in frequencies]
+                      for calib_key, frequencies in context.frequencies}
+    cm.refresh_frequency_interpolators()
+
+    settings = get_settings(context)
+    evm = EvaluationModel()
+    evm.nr_brillouin_peaks = settings['nr_brillouin_peaks']
+    evm.bounds_w0 = settings['bounds_w0']
+    evm.bounds_fwhm = settings['bounds_fwhm']
+
+    session.extraction_models = {context.rep_key: em}
+    session.calibration_models = {context.rep_key: cm}
+    session.evaluation_models = {context.rep_key: evm}
+    session.set_current_repetition(context.rep_key)
+    _applied = (context.token, evm)
+
+
+@contextlib.contextmanager
+def open_file(context):
+    """
+    Opens the raw data file of a context in the session of this process.
+
+    The file is closed again afterwards. HDF5 locks open files, so a
+    worker process keeping it open would prevent writing to it.
+
+    Yields
+    ------
+    file: bmlab.file.BrillouinFile
+        The opened file
+    """
+    session = Session.get_instance()
+    session.file = BrillouinFile(context.file_path)
+    try:
+        yield session.file
+    finally:
+        session.file.close()
+        session.file = None
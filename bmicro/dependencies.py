@@ -0,0 +1,87 @@
+"""
+Dependencies of the evaluation results on the evaluation settings.
+
+Every region is fitted in a separate stage, and each stage only
+depends on part of the settings:
+
+- the Rayleigh fit of a region depends on the region
+- the single-peak Brillouin fit of a region depends on the region
+- the multi-peak Brillouin fit of a region depends on the region,
+  the number of peaks and the bounds. Since the bounds are relative to
+  the Rayleigh peaks, it also depends on all Rayleigh regions.
+
+All stages further depend on the fit engine and, for every measurement
+point, on its spectra and frequency axes. After a change, only the
+stages whose inputs changed have to be fitted again.
+"""
+import json
+
+# The fit stages in the order they are done
+STAGES = ('rayleigh', 'brillouin', 'multi_peak')
+
+
+def _region(region):
+    return [float(limit) for limit in region]
+
+
+def get_inputs(settings):
+    """
+    Returns the inputs of every stage of every region.
+
+    Parameters
+    ----------
+    settings: dict
+        The evaluation settings as used by
+        `bmicro.evaluation.ChunkedEvaluationController`
+
+    Returns
+    -------
+    inputs: dict
+        The inputs of the stages of every region for every stage
+        in `STAGES`, encoded as strings, so they can be compared
+        and stored in the session file
+    """
+    fit = [settings['engine']]
+    rayleigh_regions = [_region(region)
+                        for region in settings['rayleigh_regions']]
+
+    inputs = {
+        'rayleigh': [[region, *fit] for region in rayleigh_regions],
+        'brillouin': [[_region(region), *fit]
+                      for region in settings['brillouin_regions']],
+        'multi_peak': [],
+    }
+    if settings['nr_brillouin_peaks'] > 1:
+        inputs['multi_peak'] = [
+            [_region(region), settings['nr_brillouin_peaks'],
+             settings['bounds_w0'], settings['bounds_fwhm'],
+             rayleigh_regions, *fit]
+            for region in settings['brillouin_regions']]
+    return {stage: [json.dumps(value, default=str) for value in values]
+            for stage, values in inputs.items()}
+
+
+def get_reusable(previous, inputs):
+    """
+    Returns which region of a previous evaluation has the
+    same inputs as every region of the current evaluation.
+
+    Parameters
+    ----------
+    previous: dict
+        The inputs of the previous evaluation as returned by `get_inputs`
+    inputs: dict
+        The inputs of the current evaluation as returned by `get_inputs`
+
+    Returns
+    -------
+    reusable: dict
+        The index of the previous region whose results can be reused
+        for every region and stage, None if it has to be fitted again
+    """
+    reusable = {}
+    for stage in STAGES:
+        old = list(previous.get(stage, [])) if previous else []
+        reusable[stage] = [old.index(value) if value in old else None
+                           for value in inputs[stage]]
+    return reusable
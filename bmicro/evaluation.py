@@ -0,0 +1,1618 @@
+"""
+Multi-process evaluation of Brillouin maps.
+
+The measurement points are split into chunks of image keys. The spectra
+of every chunk are extracted in the calling process and fitted in a pool
+of worker processes, so the evaluation scales with the number of
+available CPU cores. The results are identical to the ones of
+`bmlab.controllers.EvaluationController.evaluate`.
+
+Alternatively, all spectra of a chunk are fitted at once with the
+batched fits of `bmicro.batch_fits`, which agree with the sequential
+fits within the fit tolerance.
+"""
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import math
+import os
+import warnings
+
+import numpy as np
+from scipy import ndimage
+
+from bmlab.controllers import EvaluationController, calculate_derived_values
+from bmlab.image import extract_lines_along_arc
+
+from bmicro import (batch_fits, checkpoint, context, dependencies, fits,
+                    hdf5, out_of_core, prefetch, progress, quick_look,
+                    transport, workers)
+
+logger = logging.getLogger(__name__)
+
+# The fit parameters in the order the fits return them
+BRILLOUIN_PARAMETERS = ['brillouin_peak_position_f', 'brillouin_peak_fwhm_f',
+                        'brillouin_peak_intensity', 'brillouin_peak_offset']
+RAYLEIGH_PARAMETERS = ['rayleigh_peak_position_f', 'rayleigh_peak_fwhm_f',
+                       'rayleigh_peak_intensity', 'rayleigh_peak_offset']
+
+# The results stored in the checkpoint of an evaluation,
+# from which all other results are derived
+CHECKPOINT_PARAMETERS = ['time', *BRILLOUIN_PARAMETERS, *RAYLEIGH_PARAMETERS]
+
+# The fit engines, fitting the spectra one by one, all spectra
+# of a chunk at once, or only estimating the peaks quickly
+FIT_ENGINES = ('sequential', 'batched', 'quick-look')
+
+# The names of the fit engines to show
+FIT_ENGINE_NAMES = {
+    'sequential': 'Sequential',
+    'batched': 'Batched',
+    'quick-look': 'Quick-look (approximate)',
+}
+
+# The engines whose results are only approximate
+APPROXIMATE_ENGINES = ('quick-look',)
+
+# Upper limit of measurement points per chunk,
+# so that the progress is still reported regularly
+MAX_CHUNK_SIZE = 50
+
+# The grid spacings of the progressive evaluation, from coarse to fine
+PROGRESSIVE_STRIDES = (8, 4, 2)
+
+# The largest distance [points] of the neighbour a fit is started from
+MAX_SEED_DISTANCE = PROGRESSIVE_STRIDES[0]
+
+# The number of points of a map shown at most, larger maps are decimated
+MAX_PLOT_POINTS = 2 ** 20
+
+# The memory the results read at once for a map may take [MiB]
+SLAB_MEMORY = 64
+
+
+def get_nr_cpus():
+    """ Returns the number of CPU cores we may use """
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0))
+    return os.cpu_count() or 1
+
+
+def get_chunk_size(nr_keys, nr_workers):
+    """
+    Returns a chunk size giving every worker several chunks,
+    so the load stays balanced if some points take longer to fit.
+    """
+    chunk_size = math.ceil(nr_keys / (8 * max(nr_workers, 1)))
+    return int(np.clip(chunk_size, 1, MAX_CHUNK_SIZE))
+
+
+def get_progressive_order(image_keys, resolution,
+                          strides=PROGRESSIVE_STRIDES):
+    """
+    Sorts the image keys from coarse to fine, so that a map
+    covering the whole area is available early on.
+
+    The points on a grid with the coarsest spacing come first,
+    followed by the points added by every finer grid.
+    Within a grid, the given order of the keys is kept.
+
+    Parameters
+    ----------
+    image_keys: list
+        The image keys to sort
+    resolution: tuple
+        The payload resolution
+    strides: tuple
+        The grid spacings from coarse to fine
+
+    Returns
+    -------
+    image_keys: list
+        The sorted image keys
+    """
+    ind = np.unravel_index(np.array(image_keys, dtype=int),
+                           resolution, order='F')
+    level = len(strides) * np.ones(len(image_keys), dtype=int)
+    # Start with the finest grid, so the coarse grids take precedence
+    for idx in reversed(range(len(strides))):
+        on_grid = np.all([i % strides[idx] == 0 for i in ind], axis=0)
+        level[on_grid] = idx
+    return [image_keys[i] for i in np.argsort(level, kind='stable')]
+
+
+def fill_nearest(data, mask=None):
+    """
+    Fills the points without a value with the value
+    of the nearest point that has one.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        The map to fill
+    mask: np.ndarray
+        Only the points inside the mask are filled if given
+
+    Returns
+    -------
+    data: np.ndarray
+        The filled map
+    """
+    invalid = np.isnan(data)
+    if invalid.all() or not invalid.any():
+        return data
+    indices = ndimage.distance_transform_edt(
+        invalid, return_distances=False, return_indices=True)
+    filled = data[tuple(indices)]
+    if mask is not None:
+        filled[~mask] = np.nan
+    return filled
+
+
+def get_decimation(resolution, max_points=MAX_PLOT_POINTS):
+    """
+    Returns how many points to skip along every axis,
+    so that a map has at most the given number of points.
+
+    Parameters
+    ----------
+    resolution: tuple
+        The payload resolution
+    max_points: int
+        The number of points to keep at most, all are kept if None
+
+    Returns
+    -------
+    steps: tuple
+        The step along every axis
+    """
+    axes = [dim > 1 for dim in resolution]
+    if max_points is None or not any(axes):
+        return (1,) * len(resolution)
+    step = max(1, math.floor(
+        (np.prod(resolution) / max_points) ** (1 / sum(axes))))
+
+    def get_steps(step):
+        return tuple(step if axis else 1 for axis in axes)
+
+    while np.prod([math.ceil(dim / step) for dim, step
+                   in zip(resolution, get_steps(step))]) > max_points:
+        step += 1
+    return get_steps(step)
+
+
+def average_peaks(data, weight, brillouin_peak_index=0):
+    """
+    Selects a Brillouin peak of the results of a parameter and
+    averages them over all images and regions, the same way as
+    `bmlab.controllers.EvaluationController.get_data`.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        The results of the parameter for some points
+    weight: callable
+        Returns the weight of the multi-peak fits of the points,
+        only called for the weighted average
+    brillouin_peak_index: int
+        The peak to show, see `EvaluationController.get_data`
+
+    Returns
+    -------
+    data: np.ndarray
+        The averaged results of the points
+    """
+    sliced = data
+    if data.ndim >= 6:
+        nr_peaks_stored = data.shape[5]
+        sliced = data[..., 0]
+        if nr_peaks_stored > 1\
+                and brillouin_peak_index < nr_peaks_stored + 2:
+            if brillouin_peak_index < nr_peaks_stored:
+                sliced = data[..., brillouin_peak_index]
+            # Average all multi-peak fits
+            if brillouin_peak_index == nr_peaks_stored:
+                sliced = data[..., 1:]
+            # Weighted average of all multi-peak fits
+            if brillouin_peak_index == nr_peaks_stored + 1:
+                weights = weight()
+                with warnings.catch_warnings():
+                    warnings.filterwarnings(
+                        action='ignore',
+                        message='invalid value encountered in divide')
+                    sliced = np.nansum(data[..., 1:] * weights, axis=5) /\
+                        np.nansum(weights, axis=5)
+    with warnings.catch_warnings():
+        warnings.filterwarnings(action='ignore',
+                                message='Mean of empty slice')
+        return np.nanmean(sliced, axis=tuple(range(3, sliced.ndim)))
+
+
+def get_neighbour_offsets(resolution, max_distance=MAX_SEED_DISTANCE):
+    """
+    Returns the index offsets of all neighbours up to the given
+    distance along every dimension, sorted by their distance.
+    """
+    ranges = [np.arange(-max_distance, max_distance + 1) if dim > 1
+              else np.zeros(1, dtype=int) for dim in resolution]
+    offsets = np.stack(np.meshgrid(*ranges, indexing='ij'),
+                       axis=-1).reshape(-1, len(resolution))
+    distance = np.sum(offsets ** 2, axis=1)
+    offsets = offsets[np.argsort(distance, kind='stable')]
+    # Skip the point itself
+    return offsets[1:]
+
+
+def fit_image(evaluation_controller, spectra, frequencies,
+              brillouin_regions, rayleigh_regions, nr_brillouin_peaks,
+              seed=None, stages=None, previous=None):
+    """
+    Fits all Brillouin and Rayleigh regions of one measurement point.
+
+    Parameters
+    ----------
+    evaluation_controller: EvaluationController
+        The controller used to fit and to create the multi-peak bounds
+    spectra: list
+        The spectra of all images of the measurement point
+    frequencies: list
+        The frequency axes belonging to the spectra
+    brillouin_regions: list
+        The Brillouin regions to fit [Hz]
+    rayleigh_regions: list
+        The Rayleigh regions to fit [Hz]
+    nr_brillouin_peaks: int
+        The number of peaks to fit per Brillouin region
+    seed: tuple
+        The Brillouin and Rayleigh fit parameters of a neighbouring
+        point as returned by this function, used as initial
+        parameters of the fits if given
+    stages: dict
+        The regions to fit for every stage in
+        `bmicro.dependencies.STAGES`, all regions are fitted if None
+    previous: tuple
+        The Brillouin and Rayleigh fit parameters of this point as
+        returned by this function, used for the regions not fitted
+
+    Returns
+    -------
+    brillouin: np.ndarray
+        The Brillouin fit parameters with the shape
+        (4, nr_images, nr_brillouin_regions, nr_peaks_to_store)
+        in the order of `BRILLOUIN_PARAMETERS`
+    rayleigh: np.ndarray
+        The Rayleigh fit parameters with the shape
+        (4, nr_images, nr_rayleigh_regions, 1)
+        in the order of `RAYLEIGH_PARAMETERS`
+    """
+    evc = evaluation_controller
+    nr_images = len(spectra)
+    # We always do a single-peak fit, plus a multi-peak fit if requested
+    nr_peaks_to_store = nr_brillouin_peaks + 1\
+        if nr_brillouin_peaks > 1 else 1
+
+    if previous is None:
+        brillouin = np.nan * np.ones((4, nr_images, len(brillouin_regions),
+                                      nr_peaks_to_store))
+        rayleigh = np.nan * np.ones((4, nr_images, len(rayleigh_regions),
+                                     1))
+    else:
+        brillouin, rayleigh = [np.array(values) for values in previous]
+
+    def is_stale(stage, region_key):
+        return stages is None or region_key in stages[stage]
+
+    def fit_spectra(region, guesses, *args):
+        if guesses is None:
+            return evc.fit_spectra(spectra, frequencies, region, *args)
+        return fits.fit_spectra(spectra, frequencies, region, *args,
+                                guesses=guesses)
+
+    def get_guesses(seed_idx, region_key):
+        if seed is None:
+            return None
+        # One set of initial parameters per image
+        return list(np.transpose(seed[seed_idx][:, :, region_key, 0]))
+
+    for region_key, region in enumerate(brillouin_regions):
+        if not is_stale('brillouin', region_key):
+            continue
+        results = fit_spectra(region, get_guesses(0, region_key))
+        brillouin[:, :, region_key, 0] = np.transpose(results)
+
+    for region_key, region in enumerate(rayleigh_regions):
+        if not is_stale('rayleigh', region_key):
+            continue
+        results = fit_spectra(region, get_guesses(1, region_key))
+        rayleigh[:, :, region_key, 0] = np.transpose(results)
+
+    # The multi-peak fit bounds are given relative to the
+    # Rayleigh peaks, so we can only do it after the Rayleigh fit
+    if nr_brillouin_peaks > 1:
+        rayleigh_peaks = np.transpose(rayleigh[0, :, :, 0])
+        bounds_w0 = evc.create_bounds(brillouin_regions, rayleigh_peaks)
+        bounds_fwhm = evc.create_bounds_fwhm(brillouin_regions,
+                                             rayleigh_peaks)
+        # The width can only be bounded together with the position
+        if bounds_w0 is None:
+            bounds_fwhm = None
+
+        for region_key, region in enumerate(brillouin_regions):
+            if not is_stale('multi_peak', region_key):
+                continue
+            guesses = None
+            if seed is not None:
+                # The multi-peak fits share one offset
+                guesses = [(*peaks[0:3, 1:], peaks[3, 1]) for peaks
+                           in np.moveaxis(seed[0][:, :, region_key], 0, 1)]
+            results = fit_spectra(
+                region, guesses, nr_brillouin_peaks,
+                None if bounds_w0 is None else bounds_w0[region_key],
+                None if bounds_fwhm is None else bounds_fwhm[region_key])
+            for frame_num, fit in enumerate(results):
+                brillouin[:, frame_num, region_key, 1:] = [
+                    np.broadcast_to(value, nr_brillouin_peaks)
+                    for value in fit]
+
+    return brillouin, rayleigh
+
+
+def fit_images_batched(evaluation_controller, spectra, frequencies,
+                       brillouin_regions, rayleigh_regions,
+                       nr_brillouin_peaks, seeds=None, stages=None,
+                       previous=None):
+    """
+    Fits all Brillouin and Rayleigh regions of several measurement
+    points at once, see `fit_image`.
+
+    Parameters
+    ----------
+    evaluation_controller: EvaluationController
+        The controller used to create the multi-peak bounds
+    spectra: list
+        The spectra of all images of every measurement point
+    frequencies: list
+        The frequency axes belonging to the spectra
+    brillouin_regions: list
+        The Brillouin regions to fit [Hz]
+    rayleigh_regions: list
+        The Rayleigh regions to fit [Hz]
+    nr_brillouin_peaks: int
+        The number of peaks to fit per Brillouin region
+    seeds: list
+        The fit parameters of a neighbouring point as returned by
+        `fit_image` for every point, used as initial parameters
+        of the fits where given
+    stages: list
+        The regions to fit for every stage as described in
+        `fit_image` for every point, None to fit all regions
+    previous: list
+        The fit parameters of every point as returned by `fit_image`,
+        used for the regions not fitted
+
+    Returns
+    -------
+    brillouin: np.ndarray
+        The Brillouin fit parameters as returned by `fit_image`
+        stacked along the first axis
+    rayleigh: np.ndarray
+        The Rayleigh fit parameters as returned by `fit_image`
+        stacked along the first axis
+    """
+    evc = evaluation_controller
+    nr_points = len(spectra)
+    nr_images = len(spectra[0]) if nr_points else 0
+    nr_peaks_to_store = nr_brillouin_peaks + 1\
+        if nr_brillouin_peaks > 1 else 1
+
+    brillouin = np.nan * np.ones((nr_points, 4, nr_images,
+                                  len(brillouin_regions), nr_peaks_to_store))
+    rayleigh = np.nan * np.ones((nr_points, 4, nr_images,
+                                 len(rayleigh_regions), 1))
+    if previous is not None:
+        for point, values in enumerate(previous):
+            if values is not None:
+                brillouin[point], rayleigh[point] = values
+
+    def get_stale(stage, region_key):
+        # The points whose region has to be fitted
+        return [point for point in range(nr_points)
+                if stages is None or stages[point] is None
+                or region_key in stages[point][stage]]
+
+    def fit_regions(points, region, guesses, nr_peaks=1,
+                    bounds_w0=None, bounds_fwhm=None):
+        # We fit the spectra of all points and images together
+        results = batch_fits.fit_lorentz_regions(
+            region,
+            [frequency for point in points
+             for frequency in frequencies[point]],
+            [spectrum for point in points for spectrum in spectra[point]],
+            nr_peaks, bounds_w0, bounds_fwhm, guesses)
+        # Same order as `BRILLOUIN_PARAMETERS`, one offset for all peaks
+        results = np.stack(np.broadcast_arrays(
+            *results[0:3], results[3][:, np.newaxis]))
+        return np.moveaxis(np.reshape(
+            results, (4, len(points), nr_images, nr_peaks)), 0, 1)
+
+    def get_guesses(points, seed_idx, region_key, nr_peaks=1):
+        if seeds is None or all(seeds[point] is None for point in points):
+            return None
+        guesses = np.nan * np.ones((len(points), nr_images,
+                                    3 * nr_peaks + 1))
+        for idx, point in enumerate(points):
+            if seeds[point] is None:
+                continue
+            params = seeds[point][seed_idx][:, :, region_key]
+            if nr_peaks == 1:
+                guesses[idx] = np.transpose(params[:, :, 0])
+            else:
+                # The multi-peak fits share one offset
+                guesses[idx, :, 0:-1] = np.reshape(np.transpose(
+                    params[0:3, :, 1:], (1, 2, 0)), (nr_images, -1))
+                guesses[idx, :, -1] = params[3, :, 1]
+        return np.reshape(guesses, (len(points) * nr_images, -1))
+
+    for region_key, region in enumerate(brillouin_regions):
+        points = get_stale('brillouin', region_key)
+        if points:
+            brillouin[points, :, :, region_key, 0:1] = fit_regions(
+                points, region, get_guesses(points, 0, region_key))
+
+    for region_key, region in enumerate(rayleigh_regions):
+        points = get_stale('rayleigh', region_key)
+        if points:
+            rayleigh[points, :, :, region_key] = fit_regions(
+                points, region, get_guesses(points, 1, region_key))
+
+    # The multi-peak fit bounds are given relative to the
+    # Rayleigh peaks, so we can only do it after the Rayleigh fit
+    if nr_brillouin_peaks > 1:
+        bounds_w0, bounds_fwhm = [], []
+        for point in range(nr_points):
+            rayleigh_peaks = np.transpose(rayleigh[point, 0, :, :, 0])
+            bounds_w0.append(
+                evc.create_bounds(brillouin_regions, rayleigh_peaks))
+            bounds_fwhm.append(
+                evc.create_bounds_fwhm(brillouin_regions, rayleigh_peaks))
+        # The width can only be bounded together with the position
+        if any(bounds is None for bounds in bounds_w0):
+            bounds_w0 = bounds_fwhm = None
+        elif any(bounds is None for bounds in bounds_fwhm):
+            bounds_fwhm = None
+
+        def get_bounds(bounds, points, region_key):
+            if bounds is None:
+                return None
+            # The bounds of every image of every point
+            return np.reshape(
+                np.array([bounds[point][region_key] for point in points],
+                         dtype=float),
+                (len(points) * nr_images, nr_brillouin_peaks, 2))
+
+        for region_key, region in enumerate(brillouin_regions):
+            points = get_stale('multi_peak', region_key)
+            if not points:
+                continue
+            brillouin[points, :, :, region_key, 1:] = fit_regions(
+                points, region,
+                get_guesses(points, 0, region_key, nr_brillouin_peaks),
+                nr_brillouin_peaks,
+                get_bounds(bounds_w0, points, region_key),
+                get_bounds(bounds_fwhm, points, region_key))
+
+    return brillouin, rayleigh
+
+
+def estimate_images(spectra, frequencies, brillouin_regions,
+                    rayleigh_regions, nr_brillouin_peaks, stages=None,
+                    previous=None):
+    """
+    Estimates the Brillouin and Rayleigh peaks of several measurement
+    points at once without fitting, see `bmicro.quick_look`.
+
+    Only a single peak is estimated per region,
+    the multi-peak parameters are NaN.
+
+    Parameters
+    ----------
+    spectra: list
+        The spectra of all images of every measurement point
+    frequencies: list
+        The frequency axes belonging to the spectra
+    brillouin_regions: list
+        The Brillouin regions to evaluate [Hz]
+    rayleigh_regions: list
+        The Rayleigh regions to evaluate [Hz]
+    nr_brillouin_peaks: int
+        The number of peaks per Brillouin region,
+        which determines the shape of the results
+    stages: list
+        The regions to evaluate for every stage as described in
+        `fit_image` for every point, None to evaluate all regions
+    previous: list
+        The parameters of every point as returned by `fit_image`,
+        used for the regions not evaluated
+
+    Returns
+    -------
+    brillouin: np.ndarray
+        The Brillouin parameters as returned by `fit_image`
+        stacked along the first axis
+    rayleigh: np.ndarray
+        The Rayleigh parameters as returned by `fit_image`
+        stacked along the first axis
+    """
+    nr_points = len(spectra)
+    nr_images = len(spectra[0]) if nr_points else 0
+    nr_peaks_to_store = nr_brillouin_peaks + 1\
+        if nr_brillouin_peaks > 1 else 1
+
+    brillouin = np.nan * np.ones((nr_points, 4, nr_images,
+                                  len(brillouin_regions), nr_peaks_to_store))
+    rayleigh = np.nan * np.ones((nr_points, 4, nr_images,
+                                 len(rayleigh_regions), 1))
+    if previous is not None:
+        for point, values in enumerate(previous):
+            if values is not None:
+                brillouin[point], rayleigh[point] = values
+
+    def estimate_regions(stage, regions, results):
+        for region_key, region in enumerate(regions):
+            points = [point for point in range(nr_points)
+                      if stages is None or stages[point] is None
+                      or region_key in stages[point][stage]]
+            if not points:
+                continue
+            estimates = quick_look.estimate_peaks(
+                region,
+                [frequency for point in points
+                 for frequency in frequencies[point]],
+                [spectrum for point in points
+                 for spectrum in spectra[point]])
+            # Same order as `BRILLOUIN_PARAMETERS`
+            estimates = np.stack(np.broadcast_arrays(
+                *estimates[0:3], estimates[3][:, np.newaxis]))
+            results[points, :, :, region_key, 0:1] = np.moveaxis(
+                np.reshape(estimates, (4, len(points), nr_images, 1)), 0, 1)
+
+    estimate_regions('brillouin', brillouin_regions, brillouin)
+    estimate_regions('rayleigh', rayleigh_regions, rayleigh)
+    return brillouin, rayleigh
+
+
+def _is_equal(previous, current):
+    """ Checks whether the spectra or frequency axes are unchanged """
+    if previous is None or len(previous) != len(current):
+        return False
+    return all(np.array_equal(p, c, equal_nan=True)
+               for p, c in zip(previous, current))
+
+
+def get_brillouin_shift(brillouin_positions, rayleigh_positions):
+    """
+    Calculates the Brillouin shift of the given measurement points.
+
+    Every Brillouin peak belongs to the Rayleigh peak nearest to it,
+    so we use the smallest distance to any Rayleigh peak.
+
+    Parameters
+    ----------
+    brillouin_positions: np.ndarray
+        The Brillouin peak positions with the shape
+        (..., nr_images, nr_brillouin_regions, nr_peaks)
+    rayleigh_positions: np.ndarray
+        The Rayleigh peak positions with the shape
+        (..., nr_images, nr_rayleigh_regions, 1)
+    """
+    distance = np.abs(
+        brillouin_positions[..., np.newaxis] -
+        rayleigh_positions[..., 0][..., np.newaxis, np.newaxis, :])
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            action='ignore',
+            message='All-NaN slice encountered'
+        )
+        return np.nanmin(distance, axis=-1)
+
+
+def fit_chunk(evaluation_controller, settings, spectra, frequencies,
+              indices, seeds, stages=None, previous=None):
+    """
+    Fits the measurement points of a chunk.
+
+    Parameters
+    ----------
+    evaluation_controller: EvaluationController
+        The controller used to fit
+    settings: dict
+        The evaluation settings
+    spectra: list
+        The spectra of every point
+    frequencies: list
+        The frequency axes of every point
+    indices: list
+        The indices of every point
+    seeds: list
+        The fit parameters of an evaluated neighbour of every point,
+        used if the fits are warm-started
+    stages: list
+        The regions to fit for every stage as described in
+        `fit_image` for every point, None to fit all regions
+    previous: list
+        The fit parameters of every point, used for the regions
+        not fitted
+
+    Returns
+    -------
+    brillouin: np.ndarray
+        The Brillouin fit parameters of all points
+    rayleigh: np.ndarray
+        The Rayleigh fit parameters of all points
+    """
+    if settings['engine'] == 'quick-look':
+        # The estimates need no initial parameters
+        return estimate_images(
+            spectra, frequencies, settings['brillouin_regions'],
+            settings['rayleigh_regions'], settings['nr_brillouin_peaks'],
+            stages, previous)
+
+    if settings['engine'] == 'batched':
+        # Points fitted in this chunk can't be used as seeds,
+        # since all points are fitted at once
+        return fit_images_batched(
+            evaluation_controller, spectra, frequencies,
+            settings['brillouin_regions'], settings['rayleigh_regions'],
+            settings['nr_brillouin_peaks'],
+            seeds if settings['warm_start'] else None, stages, previous)
+
+    brillouin, rayleigh = [], []
+    for idx, (spectrum, frequency) in enumerate(zip(spectra, frequencies)):
+        seed = None
+        if settings['warm_start']:
+            seed = seeds[idx]
+            # Prefer a direct neighbour fitted in this chunk
+            for neighbour in reversed(range(idx)):
+                distance = np.subtract(indices[neighbour], indices[idx])
+                if np.max(np.abs(distance)) <= 1:
+                    seed = (brillouin[neighbour], rayleigh[neighbour])
+                    break
+        b, r = fit_image(evaluation_controller, spectrum, frequency,
+                         settings['brillouin_regions'],
+                         settings['rayleigh_regions'],
+                         settings['nr_brillouin_peaks'], seed,
+                         None if stages is None else stages[idx],
+                         None if previous is None else previous[idx])
+        brillouin.append(b)
+        rayleigh.append(r)
+    return np.array(brillouin), np.array(rayleigh)
+
+
+def _write_results(results, indices, brillouin, rayleigh):
+    """ Writes fit results to the shared results arrays """
+    if not indices:
+        return
+    ind = tuple(np.transpose(indices))
+    for idx, parameter in enumerate(BRILLOUIN_PARAMETERS):
+        transport.get_array(results[parameter])[ind] = brillouin[:, idx]
+    for idx, parameter in enumerate(RAYLEIGH_PARAMETERS):
+        transport.get_array(results[parameter])[ind] = rayleigh[:, idx]
+
+
+def _get_worker(evaluation_context, results):
+    """
+    Sets up the session of a worker process from the evaluation
+    context and returns the controller and the settings to fit with.
+    """
+    context.apply_context(evaluation_context)
+    if results is not None:
+        # The results of earlier evaluations are not written anymore
+        transport.detach_unused(results.values())
+    return EvaluationController(), context.get_settings(evaluation_context)
+
+
+def _fit_chunk(evaluation_context, spectra, frequencies, indices, seeds,
+               stages=None, previous=None, results=None):
+    """
+    Fits the measurement points of a chunk in a worker process.
+
+    The spectra and frequency axes can be given as descriptors of
+    arrays in shared memory, see `bmicro.transport`. If the descriptors
+    of the shared results arrays are given, the fit results are written
+    to them directly instead of returning them. The process id is
+    returned as well, so the progress of every worker can be reported.
+    """
+    evc, settings = _get_worker(evaluation_context, results)
+    with transport.attach(spectra) as spectra:
+        with transport.attach(frequencies) as frequencies:
+            brillouin, rayleigh = fit_chunk(
+                evc, settings, spectra, frequencies, indices, seeds,
+                stages, previous)
+    if results is None:
+        return os.getpid(), brillouin, rayleigh
+    _write_results(results, indices, brillouin, rayleigh)
+    return os.getpid(), None, None
+
+
+def _evaluate_chunk(evaluation_context, image_keys, indices, seeds,
+                    results=None):
+    """
+    Extracts and fits the measurement points of a chunk in a worker
+    process, which reads the images from the raw data file itself.
+
+    Returns
+    -------
+    worker: int
+        The process id of the worker
+    points: list
+        The key, spectra, acquisition times, mean intensities and
+        frequency axes of every point with spectra. The frequency axes
+        are None if the point has none, it isn't fitted then.
+    brillouin: np.ndarray
+        The Brillouin fit parameters of the fitted points, None if
+        they were written to the shared results arrays
+    rayleigh: np.ndarray
+        The Rayleigh fit parameters of the fitted points, None if
+        they were written to the shared results arrays
+    """
+    evc, settings = _get_worker(evaluation_context, results)
+    cm = evc.session.calibration_model()
+    points = []
+    # The points we have frequency axes for and fit
+    fit_indices, fit_seeds, fit_spectra, fit_frequencies = [], [], [], []
+    with context.open_file(evaluation_context):
+        for image_key, ind, seed in zip(image_keys, indices, seeds):
+            spectra, times, intensities = evc.extract_spectra(image_key)
+            if spectra is None:
+                continue
+            frequencies = cm.get_frequencies_by_time(times)
+            if frequencies is not None:
+                frequencies = list(frequencies)
+                fit_indices.append(ind)
+                fit_seeds.append(seed)
+                fit_spectra.append(spectra)
+                fit_frequencies.append(frequencies)
+            points.append(
+                (image_key, spectra, times, intensities, frequencies))
+    # The spectra are returned, the worker doesn't need to keep them
+    evc.session.evaluation_model().spectra.clear()
+
+    brillouin, rayleigh = fit_chunk(evc, settings, fit_spectra,
+                                    fit_frequencies, fit_indices, fit_seeds)
+    if results is None:
+        return os.getpid(), points, brillouin, rayleigh
+    _write_results(results, fit_indices, brillouin, rayleigh)
+    return os.getpid(), points, None, None
+
+
+class ChunkedEvaluationController(EvaluationController):
+    """
+    Evaluation controller fitting the measurement points
+    in chunks, optionally in a pool of worker processes.
+    """
+
+    # Reads the images ahead while evaluating
+    read_ahead = None
+
+    # Extracts the spectra ahead on a separate thread while evaluating
+    prefetcher = None
+
+    # The rate and remaining time of the running evaluation
+    throughput = None
+
+    # Stores the completed points of the running evaluation
+    checkpoint = None
+
+    def evaluate(self, abort=None, count=None, max_count=None,
+                 nr_workers=1, chunk_size=None, mask=None,
+                 progressive=False, warm_start=False,
+                 engine='sequential', partial=False,
+                 read_ahead=hdf5.READ_AHEAD,
+                 prefetch_depth=prefetch.PREFETCH_DEPTH,
+                 prefetch_memory=prefetch.PREFETCH_MEMORY,
+                 throughput=None, checkpoint_interval=None,
+                 out_of_core=False, scratch_directory=None):
+        """
+        Evaluates the current repetition.
+
+        Parameters
+        ----------
+        abort: multiprocessing.Value
+            Set to True to abort the evaluation
+        count: multiprocessing.Value
+            The number of evaluated measurement points
+        max_count: multiprocessing.Value
+            The number of measurement points to evaluate,
+            set to -1 if the evaluation fails or is aborted
+        nr_workers: int
+            The number of worker processes to fit in,
+            the points are fitted in this process if it is 1
+        chunk_size: int
+            The number of measurement points per chunk,
+            chosen depending on the number of points if not given
+        mask: np.ndarray
+            Boolean array with the shape of the payload resolution,
+            only the points inside are evaluated if given.
+            All other points are set to NaN.
+        progressive: bool
+            Evaluate the points from coarse to fine instead of
+            in the order they were acquired
+        warm_start: bool
+            Start the fits from the results of an evaluated
+            neighbouring point instead of estimating the
+            initial parameters from the spectrum
+        engine: str
+            The fit engine, one of `FIT_ENGINES`. The results of
+            `APPROXIMATE_ENGINES` are flagged as approximate.
+        partial: bool
+            Only fit the regions and stages whose inputs changed
+            since the last evaluation and reuse all other fits,
+            see `bmicro.dependencies`
+        read_ahead: int
+            The number of images to read ahead of the evaluation,
+            see `bmicro.hdf5.ReadAhead`
+        prefetch_depth: int
+            The number of measurement points whose spectra are
+            extracted ahead on a separate thread while the current
+            ones are fitted, 0 extracts them when they are fitted.
+            See `bmicro.prefetch.Prefetcher`.
+        prefetch_memory: float
+            The memory the spectra extracted ahead may take [MiB]
+        throughput: bmicro.progress.Throughput
+            Records the rate and the remaining time of the evaluation
+            and the progress of every worker, e.g. to show them
+        checkpoint_interval: float
+            How often the fit results of the completed points are
+            written to a checkpoint [s], see `bmicro.checkpoint`.
+            An evaluation with the same configuration resumes from
+            the checkpoint, in which case no fits of a previous
+            evaluation are reused. No checkpoint is written if None.
+        out_of_core: bool
+            Store the results and the spectra in files mapped to
+            memory instead, for maps that don't fit into memory,
+            see `bmicro.out_of_core`
+        scratch_directory: str
+            The directory of these files,
+            the temporary directory if not given
+        """
+        if engine not in FIT_ENGINES:
+            raise ValueError(f'Unknown fit engine {engine}.')
+
+        em = self.session.extraction_model()
+        cm = self.session.calibration_model()
+        pm = self.session.peak_selection_model()
+        evm = self.session.evaluation_model()
+        if not em or not cm or not pm or not evm:
+            if max_count is not None:
+                max_count.value = -1
+            return
+
+        image_keys = self.session.get_image_keys(True)
+        resolution = self.session.get_payload_resolution()
+        if mask is not None:
+            # The image keys enumerate the points in Fortran order
+            ind = np.unravel_index(np.array(image_keys, dtype=int),
+                                   resolution, order='F')
+            image_keys = [image_key for image_key, selected
+                          in zip(image_keys, mask[ind]) if selected]
+
+        if max_count is not None:
+            max_count.value = len(image_keys)
+
+        brillouin_regions = pm.get_brillouin_regions()
+        rayleigh_regions = pm.get_rayleigh_regions()
+
+        # Get first spectrum to find number of images
+        spectra, _, _ = self.extract_spectra('0')
+
+        if not spectra:
+            if max_count is not None:
+                max_count.value = -1
+            return
+
+        if throughput is None:
+            throughput = progress.Throughput()
+        throughput.reset(len(image_keys), len(spectra))
+        self.throughput = throughput
+
+        # We copy the settings here, so changing them
+        # during the evaluation does not create issues
+        settings = {
+            'brillouin_regions': brillouin_regions,
+            'rayleigh_regions': rayleigh_regions,
+            'nr_brillouin_peaks': evm.nr_brillouin_peaks,
+            'bounds_w0': evm.bounds_w0,
+            'bounds_fwhm': evm.bounds_fwhm,
+            'warm_start': warm_start,
+            'engine': engine,
+        }
+        inputs = dependencies.get_inputs(settings)
+        self.previous = None
+        self.changed = set()
+        if partial:
+            self.previous = self.get_previous_evaluation(
+                inputs, resolution, len(spectra))
+        # The results are incomplete until the evaluation finished
+        evm.evaluation_inputs = None
+        self.initialize_results({
+            'dim_x': resolution[0],
+            'dim_y': resolution[1],
+            'dim_z': resolution[2],
+            'nr_images': len(spectra),
+            'nr_brillouin_regions': len(brillouin_regions),
+            'nr_brillouin_peaks': settings['nr_brillouin_peaks'],
+            'nr_rayleigh_regions': len(rayleigh_regions),
+        }, out_of_core, scratch_directory)
+        # The plots flag the results of the quick-look estimates
+        evm.approximate = engine in APPROXIMATE_ENGINES
+
+        self.checkpoint = None
+        if checkpoint_interval is not None:
+            resumed = self.open_checkpoint(settings, inputs,
+                                           checkpoint_interval)
+            if resumed is not None:
+                self.previous = resumed
+
+        # The points with valid results to start the fits from
+        self.evaluated = np.zeros(resolution, dtype=bool)
+        self.neighbour_offsets = get_neighbour_offsets(resolution)
+
+        evaluation_order = image_keys
+        if progressive:
+            evaluation_order = get_progressive_order(image_keys, resolution)
+
+        if chunk_size is None:
+            chunk_size = get_chunk_size(len(image_keys), nr_workers)
+        chunks = [evaluation_order[i:i + chunk_size]
+                  for i in range(0, len(evaluation_order), chunk_size)]
+
+        # Unless previous fits are reused, which depends on the spectra,
+        # the worker processes extract the spectra themselves
+        extract_in_workers = nr_workers > 1 and self.previous is None
+        self.read_ahead = hdf5.ReadAhead(
+            self.session.file, self.session.current_repetition().payload,
+            evaluation_order, read_ahead)
+        if prefetch_depth > 0 and not extract_in_workers:
+            self.prefetcher = prefetch.Prefetcher(
+                self.load_spectra, evaluation_order, prefetch_depth,
+                prefetch_memory)
+        finished = False
+        try:
+            if nr_workers > 1:
+                finished = self._evaluate_pool(
+                    chunks, settings, nr_workers, abort, count,
+                    len(image_keys), extract_in_workers)
+            else:
+                finished = self._evaluate_serial(
+                    chunks, settings, abort, count, len(image_keys))
+        finally:
+            if self.prefetcher is not None:
+                self.prefetcher.close()
+                self.prefetcher = None
+            self.read_ahead.close()
+            self.read_ahead = None
+            if self.checkpoint is not None:
+                if finished:
+                    self.checkpoint.remove()
+                else:
+                    self.checkpoint.flush()
+                self.checkpoint = None
+
+        self.calculate_rayleigh_shift(image_keys)
+        # The shift of every point was calculated when storing it,
+        # which does not need memory for the whole map
+        if not out_of_core:
+            calculate_derived_values()
+
+        if not finished:
+            if max_count is not None:
+                max_count.value = -1
+            return
+
+        evm.evaluation_inputs = inputs
+        logger.info(f'Evaluated {len(image_keys)} points in '
+                    f'{progress.format_duration(self.throughput.elapsed)}')
+
+        # The evaluation view stops polling as soon as all points
+        # are counted, so we only do this when everything is stored
+        if count is not None:
+            count.value = len(image_keys)
+
+    def _evaluate_serial(self, chunks, settings, abort, count, nr_keys):
+        done = 0
+        for chunk in chunks:
+            if (abort is not None) and abort.value:
+                return False
+            keys, spectra, frequencies = self.load_chunk(chunk)
+            indices, seeds = self.get_seeds(keys, settings['warm_start'])
+            stages, previous = self.get_reused(keys)
+            brillouin, rayleigh = fit_chunk(self, settings, spectra,
+                                            frequencies, indices, seeds,
+                                            stages, previous)
+            if keys:
+                self.store_chunk(keys, brillouin, rayleigh)
+            done += len(chunk)
+            self.throughput.add_worker(os.getpid(), len(chunk))
+            self._report(count, done, nr_keys)
+        return True
+
+    def _evaluate_pool(self, chunks, settings, nr_workers,
+                       abort, count, nr_keys, extract_in_workers=False):
+        # The workers are kept alive between evaluations
+        pool = workers.WorkerPool.get_instance()
+        pool.start(nr_workers)
+        pool.check_health()
+        evaluation_context = context.create_context(settings)
+        # Only keep a few chunks per worker in flight,
+        # so the extracted spectra don't pile up in memory
+        max_pending = 2 * nr_workers
+        pending = {}
+        remaining = list(chunks)
+        done = 0
+        try:
+            with transport.SharedArrays() as shared:
+                results = self.share_results(shared)
+                while remaining or pending:
+                    if (abort is not None) and abort.value:
+                        return False
+                    while remaining and len(pending) < max_pending:
+                        chunk = remaining.pop(0)
+                        if extract_in_workers:
+                            self.read_ahead(chunk[-1])
+                            indices, seeds = self.get_seeds(
+                                chunk, settings['warm_start'])
+                            keys, blocks = None, []
+                            task = (_evaluate_chunk, evaluation_context,
+                                    chunk, indices, seeds, results)
+                        else:
+                            keys, spectra, frequencies =\
+                                self.load_chunk(chunk)
+                            indices, seeds = self.get_seeds(
+                                keys, settings['warm_start'])
+                            stages, previous = self.get_reused(keys)
+                            blocks = [shared.pack(spectra),
+                                      shared.pack(frequencies)]
+                            task = (_fit_chunk, evaluation_context, *blocks,
+                                    indices, seeds, stages, previous,
+                                    results)
+                        future = pool.submit(*task)
+                        pending[future] = (chunk, keys, blocks, task)
+                    completed, _ = concurrent.futures.wait(
+                        pending, timeout=0.5,
+                        return_when=concurrent.futures.FIRST_COMPLETED)
+                    for future in completed:
+                        chunk, keys, blocks, task = pending.pop(future)
+                        try:
+                            result = future.result()
+                        except BrokenProcessPool:
+                            # A worker crashed, all chunks in flight
+                            # are lost and fitted again
+                            pending[future] = (chunk, keys, blocks, task)
+                            pending = self._resubmit(pool, pending)
+                            break
+                        if keys is None:
+                            worker, points, brillouin, rayleigh = result
+                            keys = self.store_points(points)
+                        else:
+                            worker, brillouin, rayleigh = result
+                        for block in blocks:
+                            shared.release(block)
+                        if keys:
+                            self.store_chunk(keys, brillouin, rayleigh)
+                        done += len(chunk)
+                        self.throughput.add_worker(worker, len(chunk))
+                        self._report(count, done, nr_keys)
+                return True
+        finally:
+            for future in pending:
+                future.cancel()
+
+    @staticmethod
+    def _resubmit(pool, pending):
+        """ Restarts the pool and submits the lost chunks again """
+        pool.restart()
+        return {pool.submit(*task[3]): task for task in pending.values()}
+
+    def share_results(self, shared):
+        """
+        Moves the fit results arrays of the evaluation model to shared
+        memory, so the worker processes can write to them directly.
+
+        Parameters
+        ----------
+        shared: bmicro.transport.SharedArrays
+            Creates the shared memory
+
+        Returns
+        -------
+        results: dict
+            The descriptors of the shared arrays by parameter,
+            None if no shared memory is available
+        """
+        evm = self.session.evaluation_model()
+        results = {}
+        for parameter in BRILLOUIN_PARAMETERS + RAYLEIGH_PARAMETERS:
+            array, descriptor = shared.create(evm.results[parameter])
+            if descriptor is None:
+                return None
+            # The evaluation model uses the shared array from now on
+            evm.results[parameter] = array
+            results[parameter] = descriptor
+        return results
+
+    def _report(self, count, done, nr_keys):
+        self.throughput.update(done)
+        if self.throughput.should_log():
+            logger.info(f'Evaluation progress: {self.throughput}')
+        if count is None:
+            return
+        # The last point is counted after the post-processing
+        count.value = min(done, nr_keys - 1)
+
+    def load_spectra(self, image_key):
+        """
+        Reads the images of a measurement point and extracts its
+        spectra. Runs on the prefetch thread if there is one, so
+        unlike `extract_spectra` it does not store the spectra in
+        the evaluation model, `load_chunk` does.
+
+        Returns
+        -------
+        spectra: list
+            The spectra of all images, None if the point has none
+        times: np.ndarray
+            The acquisition times of the images
+        intensities: np.ndarray
+            The mean intensities of the images
+        """
+        if self.read_ahead is not None:
+            self.read_ahead(image_key)
+        em = self.session.extraction_model()
+        if not em:
+            return None, None, None
+        time = self.get_time(image_key)
+        arc = em.get_arc_by_time(time)
+        if arc.size == 0:
+            return None, None, None
+
+        imgs = self.get_image(image_key)
+        if imgs is None:
+            return None, None, None
+
+        spectra = [extract_lines_along_arc(img, arc) for img in imgs]
+        exposure = self.get_exposure(image_key)
+        times = exposure * np.arange(len(imgs)) + time
+        intensities = np.nanmean(imgs, axis=(1, 2))
+        return spectra, times, intensities
+
+    def load_chunk(self, image_keys):
+        """
+        Extracts the spectra and frequency axes of the given
+        measurement points and stores them in the evaluation model.
+
+        Returns
+        -------
+        keys: list
+            The keys of the points that can be evaluated
+        spectra: list
+            The spectra of these points
+        frequencies: list
+            The frequency axes of these points
+        """
+        evm = self.session.evaluation_model()
+        cm = self.session.calibration_model()
+
+        keys, chunk_spectra, chunk_frequencies = [], [], []
+        for image_key in image_keys:
+            if self.prefetcher is not None:
+                spectra, times, intensities = self.prefetcher.get(image_key)
+            else:
+                spectra, times, intensities = self.load_spectra(image_key)
+            if spectra is None:
+                continue
+            evm.set_spectra(image_key, spectra)
+            frequencies = cm.get_frequencies_by_time(times)
+            if frequencies is not None:
+                frequencies = list(frequencies)
+            self.store_point(image_key, times, intensities, frequencies)
+            # If we don't have frequency axis, we cannot evaluate on it
+            if frequencies is None:
+                continue
+
+            # The fits of a point can only be reused, if its spectra
+            # and frequency axes are unchanged. A checkpoint was
+            # written for the same ones and does not store them.
+            if self.previous is not None and\
+                    self.previous['spectra'] is not None and not (
+                    _is_equal(self.previous['spectra'].get(image_key),
+                              spectra) and
+                    _is_equal(self.previous['frequencies'].get(image_key),
+                              frequencies)):
+                self.changed.add(image_key)
+
+            keys.append(image_key)
+            chunk_spectra.append(spectra)
+            chunk_frequencies.append(frequencies)
+        return keys, chunk_spectra, chunk_frequencies
+
+    def store_point(self, image_key, times, intensities, frequencies):
+        """
+        Stores the acquisition times, the mean intensities and the
+        frequency axes of the images of a measurement point.
+        """
+        evm = self.session.evaluation_model()
+        resolution = self.session.get_payload_resolution()
+        ind = (*self.get_indices_from_key(resolution, image_key),
+               slice(None), 0, 0)
+        evm.results['time'][ind] = times
+        evm.results['intensity'][ind] = intensities
+        if frequencies is not None:
+            evm.set_frequencies(image_key, frequencies)
+
+    def store_points(self, points):
+        """
+        Stores the measurement points extracted by a worker process.
+
+        Parameters
+        ----------
+        points: list
+            The points as returned by `_evaluate_chunk`
+
+        Returns
+        -------
+        keys: list
+            The keys of the points that were fitted
+        """
+        evm = self.session.evaluation_model()
+        keys = []
+        for image_key, spectra, times, intensities, frequencies in points:
+            evm.set_spectra(image_key, spectra)
+            self.store_point(image_key, times, intensities, frequencies)
+            if frequencies is not None:
+                keys.append(image_key)
+        return keys
+
+    def get_previous_evaluation(self, inputs, resolution, nr_images):
+        """
+        Returns the results of the previous evaluation of the
+        current repetition, if they can be partly reused.
+
+        Parameters
+        ----------
+        inputs: dict
+            The inputs of the current evaluation as returned by
+            `bmicro.dependencies.get_inputs`
+        resolution: tuple
+            The payload resolution
+        nr_images: int
+            The number of images per measurement point
+
+        Returns
+        -------
+        previous: dict
+            Which regions can be reused for every stage and the
+            results, spectra and frequency axes of the previous
+            evaluation, None if there is nothing to reuse
+        """
+        evm = self.session.evaluation_model()
+        previous_inputs = getattr(evm, 'evaluation_inputs', None)
+        time = evm.results.get('time')
+        if not previous_inputs or time is None or\
+                time.shape[0:4] != (*resolution, nr_images):
+            return None
+        return {
+            'reusable': dependencies.get_reusable(previous_inputs, inputs),
+            # A new evaluation replaces these, so we don't need to copy
+            'results': dict(evm.results),
+            'spectra': evm.spectra.copy(),
+            'frequencies': evm.frequencies.copy(),
+        }
+
+    def initialize_results(self, dims, on_disk=False, directory=None):
+        """
+        Initializes the results arrays of the evaluation model.
+
+        Parameters
+        ----------
+        dims: dict
+            The dimensions of the results as used by
+            `EvaluationModel.initialize_results_arrays`
+        on_disk: bool
+            Store the results, spectra and frequency axes in
+            files instead of memory, see `bmicro.out_of_core`
+        directory: str
+            The directory of these files,
+            the temporary directory if not given
+        """
+        evm = self.session.evaluation_model()
+        if not on_disk:
+            evm.initialize_results_arrays(dims)
+            return
+        out_of_core.initialize_results_arrays(evm, dims, directory)
+        # The previous evaluation keeps its own copies
+        evm.spectra = out_of_core.SpectraStore(directory)
+        evm.frequencies = out_of_core.SpectraStore(directory)
+
+    def open_checkpoint(self, settings, inputs, interval):
+        """
+        Opens the checkpoint of the evaluation and returns the
+        results of the points already evaluated.
+
+        Parameters
+        ----------
+        settings: dict
+            The evaluation settings
+        inputs: dict
+            The inputs of the evaluation as returned by
+            `bmicro.dependencies.get_inputs`
+        interval: float
+            How often the completed points are written [s]
+
+        Returns
+        -------
+        previous: dict
+            All regions of the points in the checkpoint are reused,
+            in the format of `get_previous_evaluation`. None if the
+            checkpoint is empty.
+        """
+        evm = self.session.evaluation_model()
+        evaluation_context = context.create_context(settings)
+        self.checkpoint = checkpoint.Checkpoint(
+            checkpoint.get_checkpoint_path(evaluation_context.file_path,
+                                           evaluation_context.rep_key),
+            checkpoint.get_configuration(evaluation_context,
+                                         evm.results['time'].shape),
+            interval)
+        results = {parameter: out_of_core.full_like(evm.results[parameter])
+                   for parameter in CHECKPOINT_PARAMETERS}
+        image_keys = self.checkpoint.load(
+            results, self.session.get_payload_resolution())
+        if not image_keys:
+            return None
+        logger.info(f'Resuming the evaluation of {len(image_keys)} points '
+                    f'from the checkpoint')
+        return {
+            'reusable': dependencies.get_reusable(inputs, inputs),
+            'results': results,
+            'spectra': None,
+            'frequencies': None,
+        }
+
+    def get_reused(self, image_keys):
+        """
+        Returns which regions of the given measurement points have to be
+        fitted and the previous fit results reused for the other regions.
+
+        Parameters
+        ----------
+        image_keys: list
+            The keys of the measurement points
+
+        Returns
+        -------
+        stages: list
+            The regions to fit for every stage as described in
+            `fit_image` for every point, None to fit all regions
+        previous: list
+            The reused Brillouin and Rayleigh fit parameters as returned
+            by `fit_image` for every point, None if nothing is reused
+        """
+        stages = [None] * len(image_keys)
+        previous = [None] * len(image_keys)
+        if self.previous is None:
+            return stages, previous
+
+        evm = self.session.evaluation_model()
+        resolution = self.session.get_payload_resolution()
+        results = self.previous['results']
+        reusable = self.previous['reusable']
+        stale = {stage: [region_key for region_key, old
+                         in enumerate(reusable[stage]) if old is None]
+                 for stage in dependencies.STAGES}
+        for idx, image_key in enumerate(image_keys):
+            ind = self.get_indices_from_key(resolution, image_key)
+            # Points not evaluated before or with changed spectra
+            # have to be fitted completely
+            if image_key in self.changed or\
+                    np.isnan(results['time'][ind]).all():
+                continue
+            brillouin = np.nan * np.ones(
+                (4, *evm.results['brillouin_peak_position_f'].shape[3:]))
+            rayleigh = np.nan * np.ones(
+                (4, *evm.results['rayleigh_peak_position_f'].shape[3:]))
+            for param_idx, parameter in enumerate(BRILLOUIN_PARAMETERS):
+                values = results[parameter][ind]
+                for region_key, old in enumerate(reusable['brillouin']):
+                    if old is not None:
+                        brillouin[param_idx, :, region_key, 0] =\
+                            values[:, old, 0]
+                for region_key, old in enumerate(reusable['multi_peak']):
+                    if old is not None:
+                        brillouin[param_idx, :, region_key, 1:] =\
+                            values[:, old, 1:]
+            for param_idx, parameter in enumerate(RAYLEIGH_PARAMETERS):
+                values = results[parameter][ind]
+                for region_key, old in enumerate(reusable['rayleigh']):
+                    if old is not None:
+                        rayleigh[param_idx, :, region_key] = values[:, old]
+            stages[idx] = stale
+            previous[idx] = (brillouin, rayleigh)
+        return stages, previous
+
+    def get_seeds(self, image_keys, warm_start=True):
+        """
+        Returns the fit parameters of the nearest evaluated
+        neighbour of every given measurement point.
+
+        Parameters
+        ----------
+        image_keys: list
+            The keys of the measurement points
+        warm_start: bool
+            Whether the fits are warm-started at all
+
+        Returns
+        -------
+        indices: list
+            The indices of the measurement points
+        seeds: list
+            The Brillouin and Rayleigh fit parameters of the nearest
+            neighbour as returned by `fit_image`, None if there is
+            no neighbour or the fits are not warm-started
+        """
+        evm = self.session.evaluation_model()
+        resolution = self.session.get_payload_resolution()
+        indices = [self.get_indices_from_key(resolution, image_key)
+                   for image_key in image_keys]
+        seeds = [None] * len(indices)
+        if not warm_start:
+            return indices, seeds
+
+        for idx, ind in enumerate(indices):
+            neighbours = ind + self.neighbour_offsets
+            valid = np.all((neighbours >= 0) & (neighbours < resolution),
+                           axis=1)
+            neighbours = neighbours[valid]
+            evaluated = self.evaluated[tuple(neighbours.T)]
+            if not evaluated.any():
+                continue
+            # The offsets are sorted by distance
+            neighbour = tuple(neighbours[np.argmax(evaluated)])
+            seeds[idx] = (
+                np.array([evm.results[parameter][neighbour]
+                          for parameter in BRILLOUIN_PARAMETERS]),
+                np.array([evm.results[parameter][neighbour]
+                          for parameter in RAYLEIGH_PARAMETERS]),
+            )
+        return indices, seeds
+
+    def store_chunk(self, image_keys, brillouin, rayleigh):
+        """
+        Stores the fit results of the given measurement points.
+
+        Parameters
+        ----------
+        image_keys: list
+            The keys of the measurement points
+        brillouin: np.ndarray
+            The Brillouin fit parameters as returned by `fit_image`
+            stacked along the first axis, None if they were
+            already written to the results by a worker process
+        rayleigh: np.ndarray
+            The Rayleigh fit parameters as returned by `fit_image`
+            stacked along the first axis, None if they were
+            already written to the results by a worker process
+        """
+        evm = self.session.evaluation_model()
+        resolution = self.session.get_payload_resolution()
+        # The image keys enumerate the points in Fortran order
+        ind = np.unravel_index(np.array(image_keys, dtype=int),
+                               resolution, order='F')
+        if brillouin is not None:
+            for idx, parameter in enumerate(BRILLOUIN_PARAMETERS):
+                evm.results[parameter][ind] = brillouin[:, idx]
+        if rayleigh is not None:
+            for idx, parameter in enumerate(RAYLEIGH_PARAMETERS):
+                evm.results[parameter][ind] = rayleigh[:, idx]
+        # Only calculate the shift of the new points,
+        # so the map can already be shown while evaluating
+        positions = evm.results['brillouin_peak_position_f'][ind]
+        evm.results['brillouin_shift_f'][ind] = get_brillouin_shift(
+            positions, evm.results['rayleigh_peak_position_f'][ind])
+        self.evaluated[ind] = np.isfinite(positions).any(axis=(1, 2, 3))
+        if self.checkpoint is not None:
+            self.checkpoint.append(image_keys, {
+                parameter: evm.results[parameter][ind]
+                for parameter in CHECKPOINT_PARAMETERS})
+
+    def get_data(self, parameter_key, brillouin_peak_index=0,
+                 max_points=None):
+        """
+        Returns the evaluated data like `EvaluationController.get_data`.
+
+        The results are read and averaged in slabs, so this works for
+        results that don't fit into memory, see `bmicro.out_of_core`.
+        Maps with more than `max_points` points are decimated, so only
+        the results of the points shown are read.
+
+        Parameters
+        ----------
+        parameter_key: str
+            The key of the parameter requested
+        brillouin_peak_index: int
+            The index of the Brillouin peak to show,
+            see `EvaluationController.get_data`
+        max_points: int
+            The number of points to return at most, see
+            `get_decimation`. All points are returned if None.
+
+        Returns
+        -------
+        data: np.ndarray
+            The data to show, a 3-dimensional array
+        positions: list
+            The spatial positions of the data points along every axis
+        dimensionality: int
+            Whether it's a 0, 1, 2, or 3D measurement
+        labels: list
+            The labels of the positions
+        """
+        resolution = self.session.get_payload_resolution()
+        dimensionality = sum(np.array(resolution) > 1)
+        decimated = tuple(slice(None, None, step) for step
+                          in get_decimation(resolution, max_points))
+
+        positions = [position[decimated] for position
+                     in self.session.get_payload_positions().values()]
+        labels = [r'$' + axis_label + '$ [$\\mu$m]'
+                  for axis_label in ['x', 'y', 'z']]
+
+        evm = self.session.evaluation_model()
+        results = evm.results[parameter_key]
+        shape = np.empty(resolution)[decimated].shape
+        data = np.nan * np.ones(shape)
+        if results.size == 0:
+            return data, positions, dimensionality, labels
+
+        # The number of points along x to read at once
+        rows = max(1, int(SLAB_MEMORY * 1024 ** 2 //
+                          max(results[decimated][0].nbytes, 1)))
+        for start in range(0, shape[0], rows):
+            ind = (slice(decimated[0].step * start,
+                         decimated[0].step * (start + rows),
+                         decimated[0].step), *decimated[1:])
+
+            def weight(ind=ind):
+                return evm.results['brillouin_peak_intensity'][ind][
+                    ..., 1:] * evm.results['brillouin_peak_fwhm_f'][ind][
+                    ..., 1:]
+
+            data[start:start + rows] = average_peaks(
+                np.asarray(results[ind]), weight, brillouin_peak_index)
+
+        # Scale the data in case of GHz
+        data = evm.parameters[parameter_key]['scaling'] * data
+        return data, positions, dimensionality, labels
+
+    def calculate_rayleigh_shift(self, image_keys):
+        """
+        Calculates the shift of the Rayleigh peaks relative to
+        the first valid measurement point, in order to follow
+        the peaks in case of a drift.
+
+        Parameters
+        ----------
+        image_keys: list
+            The image keys sorted by time
+        """
+        evm = self.session.evaluation_model()
+        resolution = self.session.get_payload_resolution()
+        positions = evm.results['rayleigh_peak_position_f']
+        for image_key in image_keys:
+            initial = positions[
+                self.get_indices_from_key(resolution, image_key)]
+            if not np.isnan(initial).all():
+                # Without a temporary array of the whole map
+                np.subtract(positions, initial,
+                            out=evm.results['rayleigh_shift'])
+                return
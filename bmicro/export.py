@@ -0,0 +1,127 @@
+"""
+Export of the evaluated maps with approximate results flagged.
+
+`bmlab.controllers.ExportController` names the exported files after the
+raw data file, the repetition and the parameter. The results of the
+quick-look engine are only approximate (see `bmicro.quick_look`), so the
+files exported for these repetitions are renamed to end with
+`APPROXIMATE_SUFFIX`, e.g. `Water_BMrep0_brillouin_shift_f_approximate.png`.
+Only the files written by the export are renamed, and exporting exact
+results again removes the flagged files of the earlier export.
+"""
+import logging
+import os
+import pathlib
+
+from bmlab.controllers import ExportController
+from bmlab.session import Session
+
+logger = logging.getLogger(__name__)
+
+# Appended to the names of the files exported from approximate results
+APPROXIMATE_SUFFIX = '_approximate'
+
+
+def get_export_directories(path):
+    """ Returns the directories the maps of a raw data file are exported to """
+    path = pathlib.Path(path)
+    if path.parent.name == 'RawData':
+        return [path.parents[1] / 'Plots' / 'WithAxis',
+                path.parents[1] / 'Plots' / 'Bare',
+                path.parents[1] / 'Export']
+    return [path.parent]
+
+
+def list_export_files(path):
+    """
+    Returns the modification time and the size of every file
+    in the directories the maps of a raw data file are exported to.
+    Comparing them before and after an export gives the files it wrote.
+    """
+    files = {}
+    for directory in get_export_directories(path):
+        if not directory.is_dir():
+            continue
+        for file in directory.iterdir():
+            if file.is_file():
+                stat = file.stat()
+                files[file] = (stat.st_mtime_ns, stat.st_size)
+    return files
+
+
+def get_approximate_repetitions(session):
+    """ Returns the keys of the repetitions with approximate results """
+    return [rep_key for rep_key, evm in session.evaluation_models.items()
+            if evm is not None and getattr(evm, 'approximate', False)]
+
+
+def get_flagged_path(file):
+    """ Returns the name of an exported file flagged as approximate """
+    return file.with_name(f'{file.stem}{APPROXIMATE_SUFFIX}{file.suffix}')
+
+
+def flag_approximate(path, files, rep_keys):
+    """
+    Flags the exported files of the repetitions with approximate
+    results and removes the flagged files of earlier exports of
+    the other repetitions, which are outdated now.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        The raw data file
+    files: list
+        The files written by the export
+    rep_keys: list
+        The keys of the repetitions with approximate results
+
+    Returns
+    -------
+    renamed: list
+        The flagged files
+    """
+    path = pathlib.Path(path)
+    approximate = tuple(f'{path.stem}_BMrep{rep_key}_'
+                        for rep_key in rep_keys)
+    renamed = []
+    for file in map(pathlib.Path, files):
+        # Only the Brillouin maps belong to a repetition, flagged files
+        # are never written by the export itself
+        if not file.name.startswith(f'{path.stem}_BMrep') or\
+                file.stem.endswith(APPROXIMATE_SUFFIX):
+            continue
+        flagged = get_flagged_path(file)
+        if approximate and file.name.startswith(approximate):
+            # Replaces the flagged file of an earlier export
+            os.replace(file, flagged)
+            renamed.append(flagged)
+        elif flagged.exists():
+            flagged.unlink()
+    return renamed
+
+
+def export(configuration=None):
+    """
+    Exports the open file like `ExportController.export`,
+    flagging the files of approximate results.
+
+    Parameters
+    ----------
+    configuration: dict
+        The export configuration as returned by
+        `ExportController.get_configuration`
+    """
+    session = Session.get_instance()
+    if session.file is None:
+        return
+    path = session.file.path
+    before = list_export_files(path)
+    ExportController().export(configuration)
+    written = [file for file, state in list_export_files(path).items()
+               if before.get(file) != state]
+    rep_keys = get_approximate_repetitions(session)
+    if rep_keys:
+        logger.warning(f'The results of the repetitions '
+                       f'{", ".join(rep_keys)} are approximate, their '
+                       f'files end with {APPROXIMATE_SUFFIX}')
+    flag_approximate(path, written, rep_keys)
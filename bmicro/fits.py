@@ -0,0 +1,196 @@
+"""
+Lorentzian fits started from given parameters.
+
+The fits use the same model, bounds and cost function as `bmlab.fits`,
+but start from given parameters, e.g. the converged parameters of a
+neighbouring measurement point, instead of estimating them from the
+spectrum. Since neighbouring points have similar peaks, the optimizer
+needs fewer iterations. If no valid parameters are given or the fit
+fails, we fall back to the fits of `bmlab.fits`.
+"""
+import numpy as np
+from scipy.optimize import least_squares
+
+from bmlab import fits
+from bmlab.fits import lorentz
+
+
+def fit_lorentz(x, y, guess):
+    """
+    Fits a single Lorentzian peak plus offset starting from the guess.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        The x-data
+    y: np.ndarray
+        The y-data to fit
+    guess: tuple
+        The initial center, full-width-half-maximum,
+        intensity and offset
+
+    Returns
+    -------
+    center, full-width-half-maximum, intensity and offset
+    """
+    def error(params, xdata, ydata):
+        return (ydata
+                - lorentz(xdata, *params[0:3])
+                - params[3]) ** 2
+
+    bounds_lower = (x[0], (x[-1] - x[0]) / x.shape[0], 0, 0)
+    bounds_upper = (x[-1], (x[-1] - x[0]), 2 * np.max(y), 2 * np.max(y))
+
+    opt_result = least_squares(
+        error,
+        x0=np.clip(guess, bounds_lower, bounds_upper),
+        args=(x, y),
+        bounds=(bounds_lower, bounds_upper)
+    )
+
+    if not opt_result.success:
+        raise fits.FitError('Lorentz fit failed.')
+
+    w0, fwhm, intensity, offset = opt_result.x
+
+    return w0, fwhm, intensity, offset
+
+
+def fit_multi_lorentz(x, y, nr_peaks, guess,
+                      bounds_w0=None, bounds_fwhm=None):
+    """
+    Fits the sum of several Lorentzian peaks plus offset
+    starting from the guess.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        The x-data
+    y: np.ndarray
+        The y-data to fit
+    nr_peaks: int
+        The number of peaks to fit
+    guess: tuple
+        The initial centers, full-width-half-maxima and
+        intensities of all peaks and the offset
+    bounds_w0: list
+        The lower and upper bound of every peak center
+    bounds_fwhm: list
+        The lower and upper bound of every peak width
+
+    Returns
+    -------
+    centers, full-width-half-maxima, intensities and offset
+    """
+    w0_guess, fwhm_guess, intensity_guess, offset_guess = guess
+    x0 = np.append(
+        np.column_stack((w0_guess, fwhm_guess, intensity_guess)).ravel(),
+        offset_guess)
+
+    def error(params, xdata, ydata):
+        model = params[-1]
+        for peak in range(nr_peaks):
+            model = model + lorentz(xdata, *params[3 * peak:3 * peak + 3])
+        return (ydata - model) ** 2
+
+    bounds_lower = -np.inf * np.ones(3 * nr_peaks + 1)
+    bounds_upper = np.inf * np.ones(3 * nr_peaks + 1)
+    # Like bmlab, we only constrain the fit if bounds are given
+    if bounds_w0 is not None or bounds_fwhm is not None:
+        # The instrument width is far higher than the step size
+        bounds_lower[1::3] = (x[-1] - x[0]) / x.shape[0]
+        # intensities and offset
+        bounds_lower[2::3] = 0
+        bounds_lower[-1] = 0
+
+        if bounds_w0 is not None:
+            bounds_lower[0:-1:3] = [bound[0] for bound in bounds_w0]
+            bounds_upper[0:-1:3] = [bound[1] for bound in bounds_w0]
+
+        if bounds_fwhm is not None:
+            bounds_lower[1:-1:3] = [bound[0] for bound in bounds_fwhm]
+            bounds_upper[1:-1:3] = [bound[1] for bound in bounds_fwhm]
+
+    opt_result = least_squares(
+        error,
+        x0=np.clip(x0, bounds_lower, bounds_upper),
+        args=(x, y),
+        bounds=(bounds_lower, bounds_upper)
+    )
+
+    if not opt_result.success:
+        raise fits.FitError('Lorentz fit failed.')
+
+    res = opt_result.x
+    w0s, fwhms, intens = \
+        tuple(res[0:-1:3]), tuple(res[1:-1:3]), tuple(res[2:-1:3])
+    offset = res[-1]
+    return w0s, fwhms, intens, offset
+
+
+def fit_lorentz_region(region, xdata, ydata, nr_peaks=1,
+                       bounds_w0=None, bounds_fwhm=None, guess=None):
+    """
+    Fits one or several Lorentzian peaks to the given region,
+    starting from the guess if it is valid.
+
+    Parameters
+    ----------
+    region: The section of the data to fit
+    xdata: The x-data
+    ydata: The y-data to fit
+    nr_peaks: The number of peaks to fit
+    bounds_w0: The bounds for the lorentz fit value of the maximum position
+    bounds_fwhm: The bounds for the lorentz fit value of the peak width
+    guess: The initial center(s), full-width-half-maxim(a/um),
+        intensit(y/ies) and offset, e.g. of a neighbouring fit
+
+    Returns
+    -------
+    center, full-width-half-maximum, intensity and offset
+    """
+    if guess is not None and np.isfinite(np.hstack(guess)).all():
+        try:
+            idx_l = np.nanargmin(np.abs(xdata - region[0]))
+            idx_r = np.nanargmin(np.abs(xdata - region[1]))
+            x = xdata[idx_l:idx_r]
+            y = ydata[idx_l:idx_r]
+            # Mask all NaN values
+            mask = ~(np.isnan(x) | np.isnan(y))
+            x = x[mask]
+            y = y[mask]
+            if nr_peaks == 1:
+                return fit_lorentz(x, y, guess)
+            return fit_multi_lorentz(x, y, nr_peaks, guess,
+                                     bounds_w0, bounds_fwhm)
+        except Exception:
+            pass
+    # Start from the usual estimates if that's not possible
+    return fits.fit_lorentz_region(region, xdata, ydata, nr_peaks,
+                                   bounds_w0, bounds_fwhm)
+
+
+def fit_spectra(spectra, frequencies, region, nr_peaks=1,
+                bounds_w0=None, bounds_fwhm=None, guesses=None):
+    """
+    Fits the region of all spectra of a measurement point
+    like `bmlab.controllers.EvaluationController.fit_spectra`.
+
+    Parameters
+    ----------
+    guesses: list
+        The initial parameters for every spectrum, see
+        `fit_lorentz_region`
+    """
+    results = []
+    for frame_num, spectrum in enumerate(spectra):
+        results.append(fit_lorentz_region(
+            region,
+            frequencies[frame_num],
+            spectrum,
+            nr_peaks,
+            None if bounds_w0 is None else bounds_w0[frame_num],
+            None if bounds_fwhm is None else bounds_fwhm[frame_num],
+            None if guesses is None else guesses[frame_num]
+        ))
+    return results
@@ -1,19 +1,21 @@
-from importlib import resources
 import logging
 
-from PyQt6 import QtWidgets, QtCore, uic
+from PyQt6 import QtWidgets, QtCore
 # from PyQt6.QtWidgets import QMessageBox
 from matplotlib.widgets import SpanSelector
 import numpy as np
 import multiprocessing as mp
-import time
 
 from bmlab.session import Session
 
 from bmlab.controllers import CalibrationController
 
+from bmicro import progress
 from bmicro.BGThread import BGThread
-from bmicro.gui.mpl import MplCanvas
+from bmicro.gui.mpl import MplCanvas, Overlays
+from bmicro.gui.pipeline import Pipeline
+from bmicro.gui.redraw import RedrawScheduler
+from bmicro.gui.ui import load_ui
 
 
 logger = logging.getLogger(__name__)
@@ -31,21 +33,32 @@ class CalibrationView(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs):
         super(CalibrationView, self).__init__(*args, **kwargs)
 
-        ref = resources.files('bmicro.gui.calibration') / 'calibration_view.ui'
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self)
+        load_ui('bmicro.gui.calibration', 'calibration_view', self)
 
         self.mplcanvas = MplCanvas(self.image_widget,
-                                   toolbar=('Home', 'Pan', 'Zoom'))
+                                   toolbar=('Home', 'Pan', 'Zoom'),
+                                   name='calibration')
         self.plot = self.mplcanvas.get_figure().add_subplot(111)
+        # The regions and peaks are redrawn without redrawing the spectrum
+        self.overlays = Overlays(self.mplcanvas, self.plot)
+        self.overlays.add_lines('brillouin_regions', colors='r')
+        self.overlays.add_lines('rayleigh_regions', colors='m')
+        self.overlays.add_lines('fits', colors='black')
+        self.overlays.add_lines('expected', colors='green')
+        # The spectrum shown and its frequencies [GHz]
+        self.spectrum = None
+        self.frequency = None
 
         self.thread = BGThread()
+        self.pipeline = None
+        self.throughput = progress.Throughput(unit='frames')
 
         props = dict(facecolor='green', alpha=0.5)
         self.span_selector = SpanSelector(
             self.plot, onselect=self.on_select_data_region,
             useblit=True,
             direction='horizontal', props=props)
+        self.overlays.add_widget(self.span_selector)
 
         self.button_find_peaks.clicked.connect(self.find_peaks)
 
@@ -108,7 +121,8 @@ class CalibrationView(QtWidgets.QWidget):
         self.table_Rayleigh_regions.setRowCount(0)
         self.combobox_calibration.clear()
         self.calibration_progress.setValue(0)
-        self.plot.cla()
+        self.calibration_progress.setFormat('%p%')
+        self.clear_plot()
         self.mplcanvas.draw()
 
     def prev_frame(self):
@@ -178,7 +192,7 @@ class CalibrationView(QtWidgets.QWidget):
             cm.clear_brillouin_regions(calib_key)
         elif button is self.button_rayleigh_clear:
             cm.clear_rayleigh_regions(calib_key)
-        self.refresh_plot()
+        self.refresh_overlays()
 
     def on_select_data_region(self, xmin, xmax):
         if not self.plot.lines or not self.plot.lines[0]:
@@ -200,13 +214,26 @@ class CalibrationView(QtWidgets.QWidget):
             elif self.mode == MODE_SELECT_RAYLEIGH:
                 cm.add_rayleigh_region(calib_key, (indmin, indmax))
 
-        self.refresh_plot()
+        self.refresh_overlays()
 
     def on_select_calibration(self):
         self.checkFrameNavigationButtons()
         self.refresh_plot()
 
+    def run_pipeline(self, stages):
+        """
+        Runs stages in the background, unless others are running,
+        see `bmicro.gui.pipeline`.
+        """
+        if self.pipeline is not None and self.pipeline.running:
+            return
+        self.pipeline = Pipeline(stages, self)
+        self.pipeline.start()
+
     def calibrate(self):
+        self.run_pipeline(self.calibrate_stages())
+
+    def calibrate_stages(self):
         calib_key = self.combobox_calibration.currentText()
 
         count = mp.Value('I', 0, lock=True)
@@ -220,20 +247,42 @@ class CalibrationView(QtWidgets.QWidget):
 
         self.thread.set_task(
             func=self.calibration_controller.calibrate, fkw=dnkw)
-        self.thread.start()
-        # Show a progress until computation is done
-        while max_count.value == 0 or count.value < max_count.value:
-            time.sleep(.05)
+        self.throughput.unit = 'frames'
+        self.throughput.reset(0)
+
+        def show_progress():
             self.calibration_progress.setValue(count.value)
             if max_count.value >= 0:
                 self.calibration_progress.setMaximum(max_count.value)
-            QtCore.QCoreApplication.instance().processEvents()
-        # make sure the thread finishes
-        self.thread.wait()
+            self.throughput.update(count.value, max(max_count.value, 0))
+            self.refresh_throughput()
+
+        # Show a progress until computation is done
+        timer = QtCore.QTimer(self)
+        timer.timeout.connect(show_progress)
+        timer.start(50)
+        self.thread.start()
+        try:
+            yield self.thread
+        finally:
+            timer.stop()
+            timer.deleteLater()
+        show_progress()
 
         self.refresh_plot()
 
     def calibrate_all(self, do_not=None):
+        self.run_pipeline(self.calibrate_all_stages(do_not))
+
+    def calibrate_all_stages(self, do_not=None):
+        """
+        Finds the peaks of and/or calibrates all calibrations.
+
+        Parameters
+        ----------
+        do_not: str
+            Skip this step, either 'find_peaks' or 'calibrate'
+        """
         session = Session.get_instance()
         calib_keys = session.get_calib_keys(sort_by_time=True)
 
@@ -241,6 +290,8 @@ class CalibrationView(QtWidgets.QWidget):
             return
 
         self.calibration_progress.setMaximum(len(calib_keys))
+        self.throughput.unit = 'calibrations'
+        self.throughput.reset(len(calib_keys))
 
         for i, calib_key in enumerate(calib_keys):
             self.combobox_calibration.setCurrentText(calib_key)
@@ -253,19 +304,39 @@ class CalibrationView(QtWidgets.QWidget):
                 self.thread.set_task(
                     func=self.calibration_controller.find_peaks, fkw=dnkw)
                 self.thread.start()
-                self.thread.wait()
+                yield self.thread
             if do_not != 'calibrate':
                 self.thread.set_task(
                     func=self.calibration_controller.calibrate, fkw=dnkw)
                 self.thread.start()
-                self.thread.wait()
+                yield self.thread
             self.calibration_progress.setValue(i + 1)
+            self.throughput.update(i + 1)
+            self.refresh_throughput()
 
             self.refresh_plot()
-            QtCore.QCoreApplication.instance().processEvents()
 
-    def refresh_plot(self):
+    def refresh_throughput(self):
+        """ Shows the rate and the remaining time in the progress bar """
+        self.calibration_progress.setFormat(
+            f'%p% ({self.throughput.summary()})')
+
+    def clear_plot(self):
         self.plot.cla()
+        self.overlays.attach()
+        self.overlays.clear()
+        self.spectrum = None
+        self.frequency = None
+
+    def refresh_plot(self):
+        """
+        Draws the spectrum of the current frame with its overlays.
+        Use `refresh_overlays` if only the regions or peaks changed.
+        """
+        scheduler = RedrawScheduler.get_instance()
+        scheduler.cancel(self.refresh_plot)
+        scheduler.cancel(self.refresh_overlays)
+        self.clear_plot()
         session = Session.get_instance()
         calib_key = self.combobox_calibration.currentText()
         if not calib_key:
@@ -302,55 +373,86 @@ class CalibrationView(QtWidgets.QWidget):
                 self.plot.set_title('Frame %d' %
                                     (self.current_frame+1))
 
-                regions = cm.get_brillouin_regions(calib_key)
-                table = self.table_Brillouin_regions
-                self.refresh_regions(spectrum, regions, table, 'r', frequency)
-
-                for region_key, region in enumerate(regions):
-                    fit = cm.brillouin_fits\
-                        .get_fit(calib_key, region_key, self.current_frame)
-                    if fit is not None:
-                        w0s = fit.w0s
-                        w0s_f = cm.get_frequency_by_calib_key(w0s, calib_key)
-                        if w0s_f is not None:
-                            self.plot.vlines(1e-9*w0s_f[0], 0, np.nanmax(
-                                spectrum), colors=['black'])
-                            self.plot.vlines(1e-9*w0s_f[1], 0, np.nanmax(
-                                spectrum), colors=['black'])
-                        else:
-                            self.plot.vlines(w0s[0], 0, np.nanmax(
-                                spectrum), colors=['black'])
-                            self.plot.vlines(w0s[1], 0, np.nanmax(
-                                spectrum), colors=['black'])
-
-                regions = cm.get_rayleigh_regions(calib_key)
-                table = self.table_Rayleigh_regions
-                self.refresh_regions(spectrum, regions, table, 'm', frequency)
-
-                for region_key, region in enumerate(regions):
-                    fit = cm.rayleigh_fits\
-                        .get_fit(calib_key, region_key, self.current_frame)
-                    if fit is not None:
-                        w0 = fit.w0
-                        w0_f = cm.get_frequency_by_calib_key(w0, calib_key)
-                        if w0_f is not None:
-                            self.plot.vlines(1e-9*w0_f, 0, np.nanmax(
-                                spectrum), colors=['black'])
-                        else:
-                            self.plot.vlines(w0, 0, np.nanmax(
-                                spectrum), colors=['black'])
-
-                expected = cc.expected_frequencies(
-                    calib_key, self.current_frame)
-                if expected is not None:
-                    self.plot.vlines(1e-9 * expected, 0, np.nanmax(
-                        spectrum), colors=['green'])
+                self.spectrum = spectrum
+                self.frequency = frequency
+                self.set_overlays()
 
         except Exception as e:
             logger.error('Exception occurred in calibration: %s' % e)
         finally:
             self.mplcanvas.draw()
 
+    def request_overlays(self):
+        """
+        Redraws the regions and peaks with the next frame,
+        see `RedrawScheduler`.
+        """
+        RedrawScheduler.get_instance().request(self.refresh_overlays, self)
+
+    def refresh_overlays(self):
+        """
+        Redraws the regions and peaks, the spectrum stays as it is.
+        """
+        RedrawScheduler.get_instance().cancel(self.refresh_overlays)
+        try:
+            self.set_overlays()
+        except Exception as e:
+            logger.error('Exception occurred in calibration: %s' % e)
+        self.overlays.update()
+
+    def set_overlays(self):
+        session = Session.get_instance()
+        cm = session.calibration_model()
+        calib_key = self.combobox_calibration.currentText()
+        spectrum = self.spectrum
+        frequency = self.frequency
+        if not cm or not calib_key or spectrum is None:
+            self.overlays.clear()
+            return
+        peak_max = np.nanmax(spectrum)
+
+        regions = cm.get_brillouin_regions(calib_key)
+        table = self.table_Brillouin_regions
+        self.refresh_regions(spectrum, regions, table,
+                             'brillouin_regions', frequency)
+
+        peaks = []
+        for region_key, region in enumerate(regions):
+            fit = cm.brillouin_fits\
+                .get_fit(calib_key, region_key, self.current_frame)
+            if fit is not None:
+                w0s = fit.w0s
+                w0s_f = cm.get_frequency_by_calib_key(w0s, calib_key)
+                if w0s_f is not None:
+                    peaks.extend(1e-9*np.ravel(w0s_f[:2]))
+                else:
+                    peaks.extend(np.ravel(w0s[:2]))
+
+        regions = cm.get_rayleigh_regions(calib_key)
+        table = self.table_Rayleigh_regions
+        self.refresh_regions(spectrum, regions, table,
+                             'rayleigh_regions', frequency)
+
+        for region_key, region in enumerate(regions):
+            fit = cm.rayleigh_fits\
+                .get_fit(calib_key, region_key, self.current_frame)
+            if fit is not None:
+                w0 = fit.w0
+                w0_f = cm.get_frequency_by_calib_key(w0, calib_key)
+                if w0_f is not None:
+                    peaks.extend(1e-9*np.ravel(w0_f))
+                else:
+                    peaks.extend(np.ravel(w0))
+        self.overlays.set_vlines('fits', peaks, 0, peak_max)
+
+        expected = CalibrationController().expected_frequencies(
+            calib_key, self.current_frame)
+        if expected is not None:
+            self.overlays.set_vlines(
+                'expected', 1e-9 * expected, 0, peak_max)
+        else:
+            self.overlays.set_segments('expected', [])
+
     def setupTables(self):
         self.table_Brillouin_regions.setColumnCount(2)
         self.table_Brillouin_regions\
@@ -370,15 +472,17 @@ class CalibrationView(QtWidgets.QWidget):
         header.setSectionResizeMode(1,
                                     QtWidgets.QHeaderView.ResizeMode.Stretch)
 
-    def refresh_regions(self, spectrum, regions, table, color,
+    def refresh_regions(self, spectrum, regions, table, overlay,
                         frequencies=None):
         table.setRowCount(len(regions))
+        segments = []
         for rowIdx, region in enumerate(regions):
             mask = np.arange(int(region[0]), int(region[1]))
             if frequencies is not None:
-                self.plot.plot(frequencies[mask], spectrum[mask], color)
+                segments.append(
+                    np.column_stack((frequencies[mask], spectrum[mask])))
             else:
-                self.plot.plot(mask, spectrum[mask], color)
+                segments.append(np.column_stack((mask, spectrum[mask])))
             # Add regions to table
             # Block signals, so the itemChanged signal is not
             # emitted during table creation
@@ -387,6 +491,7 @@ class CalibrationView(QtWidgets.QWidget):
                 item = QtWidgets.QTableWidgetItem(str(value))
                 table.setItem(rowIdx, columnIdx, item)
             table.blockSignals(False)
+        self.overlays.set_segments(overlay, segments)
 
     def on_region_changed(self, type, item):
         row = item.row()
@@ -410,7 +515,7 @@ class CalibrationView(QtWidgets.QWidget):
                 current_region[column] = value
                 current_region = tuple(current_region)
                 cm.set_rayleigh_region(calib_key, row, current_region)
-            self.refresh_plot()
+            self.request_overlays()
 
     def find_peaks(self):
         """
@@ -419,18 +524,23 @@ class CalibrationView(QtWidgets.QWidget):
         calib_key = self.combobox_calibration.currentText()
         cc = CalibrationController()
         cc.find_peaks(calib_key)
-        self.refresh_plot()
+        self.refresh_overlays()
 
     def show_options(self):
+        if self.options_dialog is None:
+            self.create_options_dialog()
+        self.update_options_view()
+        self.options_dialog.exec()
+
+    def create_options_dialog(self):
+        """ Creates the options dialog, which is reused afterwards """
         self.options_dialog = QtWidgets.QDialog(
             self,
             QtCore.Qt.WindowType.WindowTitleHint |
             QtCore.Qt.WindowType.WindowCloseButtonHint
         )
-        ref = (resources.files('bmicro.gui.calibration') /
-               'calibration_options.ui')
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self.options_dialog)
+        load_ui('bmicro.gui.calibration', 'calibration_options',
+                self.options_dialog)
         self.options_dialog.setWindowTitle('Calibration options')
         self.options_dialog.setWindowModality(
             QtCore.Qt.WindowModality.ApplicationModal)
@@ -449,13 +559,11 @@ class CalibrationView(QtWidgets.QWidget):
         self.options_dialog.adjustSize()
 
         self.mplcanvas_options = MplCanvas(self.options_dialog.widget_plot,
-                                           toolbar=('Home', 'Pan', 'Zoom'))
+                                           toolbar=('Home', 'Pan', 'Zoom'),
+                                           name='calibration_options')
         self.plot_options =\
             self.mplcanvas_options.get_figure().add_subplot(111)
 
-        self.update_options_view()
-        self.options_dialog.exec()
-
     def apply_and_close_options(self):
         self.apply_options()
         self.close_options()
@@ -495,7 +603,8 @@ class CalibrationView(QtWidgets.QWidget):
         if temperature == session.setup.temperature - 273.15:
             return
         session.setup.set_temperature(temperature)
-        self.update_options_view()
+        RedrawScheduler.get_instance().request(
+            self.update_options_view, self.options_dialog)
 
     def update_options_view(self):
         if self.options_dialog is None:
@@ -1,14 +1,16 @@
-from importlib import resources
 import logging
 
-from PyQt6 import uic, QtWidgets, QtCore
+from PyQt6 import QtWidgets
 import matplotlib
 
 from bmlab.models.setup import AVAILABLE_SETUPS
 from bmlab.session import Session
 from bmlab.controllers import PeakSelectionController, EvaluationController
 
+from bmicro import repetitions
 from bmicro.gui.mpl import MplCanvas
+from bmicro.gui.pipeline import Pipeline
+from bmicro.gui.ui import load_ui
 
 
 import os
@@ -25,13 +27,12 @@ class DataView(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs):
         super(DataView, self).__init__(*args, **kwargs)
 
-        ref = resources.files('bmicro.gui.data') / 'data_view.ui'
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self)
+        load_ui('bmicro.gui.data', 'data_view', self)
 
         self.parent = args[0]
 
-        self.mplcanvas = MplCanvas(self.image_preview_widget)
+        self.mplcanvas = MplCanvas(self.image_preview_widget,
+                                   name='data_preview')
         self.preview = self.mplcanvas.get_figure().add_subplot(111)
         self.preview.axis('off')
 
@@ -52,6 +53,7 @@ class DataView(QtWidgets.QWidget):
             self.on_select_setup)
 
         self.auto_evaluation.clicked.connect(self.on_auto_evaluation)
+        self.pipeline = None
 
         # Initialize current setup to first entry
         Session.get_instance().set_setup(AVAILABLE_SETUPS[0])
@@ -125,16 +127,34 @@ class DataView(QtWidgets.QWidget):
         self.update_preview()
 
     def on_auto_evaluation(self):
+        if self.pipeline is not None and self.pipeline.running:
+            return
+        self.pipeline = Pipeline(self.auto_evaluation_stages(), self)
+        self.pipeline.start()
+
+    def auto_evaluation_stages(self):
+        """
+        The stages of the automatic evaluation with the default
+        settings, see `bmicro.gui.pipeline`.
+        """
         session = Session.get_instance()
         if session.file is None:
             return
 
         rep_keys = session.file.repetition_keys()
 
+        # Evaluate the repetitions in parallel if we may use several
+        # worker processes, otherwise one after the other below
+        evaluation_view = self.parent.widget_evaluation_view
+        nr_workers = evaluation_view.nr_workers.value()
+        if nr_workers > 1 and len(rep_keys) > 1:
+            yield from self.evaluate_repetitions(rep_keys, nr_workers)
+            return
+
         for rep_key in rep_keys:
             # Load repetition
             session.set_current_repetition(rep_key)
-            QtCore.QCoreApplication.instance().processEvents()
+            yield
 
             # Setup
             session.set_setup(AVAILABLE_SETUPS[0])
@@ -149,31 +169,58 @@ class DataView(QtWidgets.QWidget):
 
             # Extraction
             self.parent.tabWidget.setCurrentIndex(1)
-            QtCore.QCoreApplication.instance().processEvents()
-            self.parent.widget_extraction_view.find_points_all()
+            yield
+            yield from self.parent.widget_extraction_view.\
+                find_points_all_stages()
 
             # Calibration
             self.parent.tabWidget.setCurrentIndex(2)
-            QtCore.QCoreApplication.instance().processEvents()
-            self.parent.widget_calibration_view.calibrate_all()
+            yield
+            yield from self.parent.widget_calibration_view.\
+                calibrate_all_stages()
 
             # PeakSelection
             self.parent.tabWidget.setCurrentIndex(3)
-            QtCore.QCoreApplication.instance().processEvents()
+            yield
             psc = PeakSelectionController()
             psc.add_brillouin_region_frequency((4.0e9, 6.0e9))
             psc.add_brillouin_region_frequency((9.0e9, 11.0e9))
             psc.add_rayleigh_region_frequency((-2.0e9, 2.0e9))
             psc.add_rayleigh_region_frequency((13.0e9, 17.0e9))
             self.parent.widget_peak_selection_view.update_ui()
-            QtCore.QCoreApplication.instance().processEvents()
+            yield
 
             # Evaluation
             self.parent.tabWidget.setCurrentIndex(4)
-            QtCore.QCoreApplication.instance().processEvents()
+            yield
             evc = EvaluationController()
             evc.set_nr_brillouin_peaks(1)
-            self.parent.widget_evaluation_view.evaluate(blocking=True)
+            if evaluation_view.evaluate():
+                yield evaluation_view.evaluation_finished
+
+    def evaluate_repetitions(self, rep_keys, nr_workers):
+        """
+        Evaluates the repetitions of the open file in parallel with
+        the default settings and merges the results into the session.
+        """
+        session = Session.get_instance()
+        config = repetitions.get_default_config()
+        config['evaluation']['engine'] =\
+            self.parent.widget_evaluation_view.fit_engine.currentData()
+
+        self.parent.tabWidget.setCurrentIndex(4)
+        repetitions.apply_global_config(config)
+        self.update_ui()
+        pending = repetitions.start_repetitions(
+            session.file.path, rep_keys, config, nr_workers)
+        try:
+            while pending:
+                future, _ = yield list(pending)
+                repetitions.merge_repetition(pending.pop(future),
+                                             future.result())
+        finally:
+            repetitions.cancel_repetitions(pending)
+        self.parent.update_ui()
 
     def on_rotation_clicked(self):
         """
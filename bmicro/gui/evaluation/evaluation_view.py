@@ -1,23 +1,31 @@
-from importlib import resources
 import logging
 import numpy as np
 import matplotlib
 from matplotlib.colors import Normalize
+from matplotlib.patches import Polygon
+from matplotlib.widgets import PolygonSelector, RectangleSelector
 from mpl_toolkits.mplot3d.axes3d import Axes3D
 import warnings
 
-import time
 
-from PyQt6 import QtWidgets, uic, QtCore
-from PyQt6.QtCore import QObject, QTimer, QThread, pyqtSignal, QCoreApplication
+from PyQt6 import QtWidgets, QtCore
+from PyQt6.QtCore import QObject, QTimer, QThread, pyqtSignal
 import multiprocessing as mp
 
 from bmlab.session import Session
 from bmlab.fits import lorentz
 
+from bmicro import checkpoint, hdf5, prefetch, progress
+from bmicro.BGThread import BGThread
 from bmicro.gui.mpl import MplCanvas
-
-from bmlab.controllers import EvaluationController
+from bmicro.gui.raster import RasterMap
+from bmicro.gui.redraw import RedrawScheduler
+from bmicro.gui.ui import load_ui
+from bmicro.evaluation import (ChunkedEvaluationController, FIT_ENGINES,
+                               FIT_ENGINE_NAMES, MAX_PLOT_POINTS,
+                               fill_nearest, get_decimation)
+from bmicro.roi import (rectangle_mask, polygon_mask, intensity_mask,
+                        get_evaluated_intensity, get_intensity_map)
 
 logger = logging.getLogger(__name__)
 
@@ -27,12 +35,14 @@ class Worker(QObject):
 
     def __init__(self, fkw):
         super().__init__()
-        self.evaluation_controller = EvaluationController()
+        self.evaluation_controller = ChunkedEvaluationController()
         self.fkw = fkw
 
     def run(self):
-        self.evaluation_controller.evaluate(**self.fkw)
-        self.finished.emit()
+        try:
+            self.evaluation_controller.evaluate(**self.fkw)
+        finally:
+            self.finished.emit()
 
 
 class EvaluationView(QtWidgets.QWidget):
@@ -40,20 +50,30 @@ class EvaluationView(QtWidgets.QWidget):
     Class for the evaluation widget
     """
 
+    # The rate and remaining time of the running evaluation
+    progress_changed = pyqtSignal(str)
+
+    # Emitted when the evaluation finished, failed or was aborted
+    evaluation_finished = pyqtSignal()
+
     def __init__(self, *args, **kwargs):
         super(EvaluationView, self).__init__(*args, **kwargs)
 
-        ref = resources.files('bmicro.gui.evaluation') / 'evaluation_view.ui'
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self)
+        load_ui('bmicro.gui.evaluation', 'evaluation_view', self)
 
         self.mplcanvas = MplCanvas(self.image_widget,
-                                   toolbar=('Home', 'Pan', 'Zoom'))
+                                   toolbar=('Home', 'Pan', 'Zoom'),
+                                   name='evaluation')
         self.mplcanvas.get_figure().canvas.mpl_connect(
             'button_press_event', self.on_click_image)
         self.plot = self.mplcanvas.get_figure().add_subplot(111)
         self.image_map = None
         self.colorbar = None
+        # Shows 2D maps while evaluating, much faster than matplotlib
+        self.raster_map = RasterMap(self.image_widget)
+        self.raster_map.clicked.connect(self.show_point)
+        self.raster_map.hide()
+        self.image_widget.layout().addWidget(self.raster_map)
 
         self.image_spectrum_dialog = None
         self.isd_image_canvas = None
@@ -65,6 +85,32 @@ class EvaluationView(QtWidgets.QWidget):
 
         self.button_evaluate.released.connect(self.evaluate)
 
+        self.settings = QtCore.QSettings()
+        self.nr_workers.setValue(
+            int(self.settings.value('evaluation/workers', 1)))
+        self.nr_workers.valueChanged.connect(self.on_nr_workers_changed)
+        self.progressive.setChecked(self.settings.value(
+            'evaluation/progressive', False, type=bool))
+        self.progressive.toggled.connect(self.on_progressive_changed)
+        self.warm_start.setChecked(self.settings.value(
+            'evaluation/warm-start', False, type=bool))
+        self.warm_start.toggled.connect(self.on_warm_start_changed)
+        self.reuse_fits.setChecked(self.settings.value(
+            'evaluation/reuse-fits', True, type=bool))
+        self.reuse_fits.toggled.connect(self.on_reuse_fits_changed)
+        self.out_of_core.setChecked(self.settings.value(
+            'evaluation/out-of-core', False, type=bool))
+        self.out_of_core.toggled.connect(self.on_out_of_core_changed)
+        self.raster_map_enabled.setChecked(self.settings.value(
+            'evaluation/raster-map', True, type=bool))
+        self.raster_map_enabled.toggled.connect(self.on_raster_map_changed)
+        for engine in FIT_ENGINES:
+            self.fit_engine.addItem(FIT_ENGINE_NAMES[engine], engine)
+        self.fit_engine.setCurrentIndex(max(self.fit_engine.findData(
+            self.settings.value('evaluation/engine', FIT_ENGINES[0])), 0))
+        self.fit_engine.currentIndexChanged.connect(
+            self.on_fit_engine_changed)
+
         self.setup_parameter_selection_combobox()
 
         self.combobox_parameter.currentIndexChanged.connect(
@@ -73,7 +119,7 @@ class EvaluationView(QtWidgets.QWidget):
             self.on_select_parameter)
 
         self.aspect_ratio.clicked.connect(
-            self.refresh_plot)
+            self.request_plot)
 
         self.autoscale.clicked.connect(
             self.on_scale_changed)
@@ -84,10 +130,15 @@ class EvaluationView(QtWidgets.QWidget):
         self.value_max.valueChanged.connect(
             self.on_scale_changed)
 
-        self.evaluation_controller = EvaluationController()
+        # Reads only the results shown
+        self.evaluation_controller = ChunkedEvaluationController()
 
         self.evaluation_abort = mp.Value('I', False, lock=True)
         self.evaluation_running = False
+        # The points and order of the running evaluation
+        self.evaluation_mask = None
+        self.evaluation_progressive = False
+        self.evaluation_raster_map = False
 
         self.session = Session.get_instance()
 
@@ -95,6 +146,7 @@ class EvaluationView(QtWidgets.QWidget):
         self.evaluation_timer.timeout.connect(self.refresh_ui)
         self.count = None
         self.max_count = None
+        self.throughput = progress.Throughput()
         self.thread = None
         self.worker = None
         # Currently used to determine if we should update the plot
@@ -114,12 +166,43 @@ class EvaluationView(QtWidgets.QWidget):
         self.nrBrillouinPeaks_4.toggled.connect(
             lambda: self.setNrBrillouinPeaks(4))
 
+        # The region of interest to evaluate,
+        # either ('rectangle', extent) or ('polygon', vertices)
+        self.roi = None
+        self.roi_mask = None
+        self.roi_selector = None
+        self.roi_patch = None
+        # The raw intensities of the measurement points as
+        # (evaluation model, intensities), the evaluation model
+        # identifies the repetition they belong to
+        self.intensity_map = None
+        # Reads the raw intensities in the background
+        self.intensity_thread = BGThread()
+        self.intensity_thread.finished.connect(self.on_intensity_map_read)
+
+        self.button_roi_rectangle.clicked.connect(self.select_roi_rectangle)
+        self.button_roi_polygon.clicked.connect(self.select_roi_polygon)
+        self.button_roi_clear.clicked.connect(self.clear_roi)
+        self.roi_threshold_enabled.toggled.connect(self.on_roi_threshold)
+        self.roi_threshold.valueChanged.connect(self.on_roi_threshold)
+
     def update_ui(self):
         session = Session.get_instance()
         evm = session.evaluation_model()
         if evm is None:
             return
 
+        # The intensity threshold belongs to another repetition
+        if self.intensity_map is not None and\
+                self.intensity_map[0] is not evm:
+            self.intensity_map = None
+            self.update_roi_mask()
+
+        # The region of interest belongs to another map
+        if self.roi_mask is not None and self.roi_mask.shape !=\
+                tuple(session.get_payload_resolution()):
+            self.clear_roi()
+
         if evm.nr_brillouin_peaks == 1:
             self.nrBrillouinPeaks_1.setChecked(True)
             self.bounds_table.setEnabled(False)
@@ -173,6 +256,23 @@ class EvaluationView(QtWidgets.QWidget):
         # If the click is outside the axes, skip it
         if event.inaxes is None:
             return
+        # Clicks while drawing a region of interest don't select a point
+        if self.roi_selector is not None:
+            return
+        self.show_point(event.xdata, event.ydata)
+
+    def show_point(self, x, y):
+        """
+        Shows the image and the spectrum of the point
+        closest to the given position of the map.
+
+        Parameters
+        ----------
+        x: float
+            The horizontal position in the map [µm]
+        y: float
+            The vertical position in the map [µm]
+        """
         # If we don't have a session we have not loaded data yet
         session = Session.get_instance()
         if session is None:
@@ -196,7 +296,7 @@ class EvaluationView(QtWidgets.QWidget):
             return
 
         # Determine the indices of the click in the positions arrays
-        click_pos = (event.xdata, event.ydata)
+        click_pos = (x, y)
         indices = np.zeros(len(resolution), dtype="int")
         for ind, p_ind in enumerate(idx):
             dslice = [slice(None) if p_ind == i else 0
@@ -323,9 +423,8 @@ class EvaluationView(QtWidgets.QWidget):
                 QtCore.Qt.WindowType.WindowMaximizeButtonHint |
                 QtCore.Qt.WindowType.WindowMinimizeButtonHint
             )
-            ref = resources.files('bmicro.gui.evaluation') / 'spectrum_view.ui'
-            with resources.as_file(ref) as ui_file:
-                uic.loadUi(ui_file, self.image_spectrum_dialog)
+            load_ui('bmicro.gui.evaluation', 'spectrum_view',
+                    self.image_spectrum_dialog)
             self.image_spectrum_dialog\
                 .setWindowTitle('Camera image & spectrum')
             self.image_spectrum_dialog.setWindowModality(
@@ -335,7 +434,8 @@ class EvaluationView(QtWidgets.QWidget):
 
             self.isd_image_canvas = MplCanvas(
                 self.image_spectrum_dialog.image_widget,
-                toolbar=('Home', 'Pan', 'Zoom'))
+                toolbar=('Home', 'Pan', 'Zoom'),
+                name='spectrum_dialog_image')
             self.isd_image_plot =\
                 self.isd_image_canvas.get_figure().add_subplot(111)
             self.isd_image_map = None
@@ -343,7 +443,8 @@ class EvaluationView(QtWidgets.QWidget):
 
             self.isd_spectrum_canvas = MplCanvas(
                 self.image_spectrum_dialog.spectrum_widget,
-                toolbar=('Home', 'Pan', 'Zoom'))
+                toolbar=('Home', 'Pan', 'Zoom'),
+                name='spectrum_dialog_spectrum')
             self.isd_spectrum_plot =\
                 self.isd_spectrum_canvas.get_figure().add_subplot(111)
 
@@ -414,10 +515,186 @@ class EvaluationView(QtWidgets.QWidget):
             self.image_map.remove()
             self.image_map = None
 
+    def get_roi_coordinates(self):
+        """
+        Returns the positions of the measurement points along
+        the horizontal and vertical axis of the map plot.
+        The vertical positions are None for 1D maps.
+        """
+        resolution = self.session.get_payload_resolution()
+        if resolution is None:
+            return None, None
+
+        # Center the positions the same way the plot does
+        positions = list(self.session.get_payload_positions().values())
+        for position in positions:
+            position -= np.nanmean(position)
+
+        idx = [idx for idx, dim in enumerate(resolution) if dim > 1]
+        if len(idx) == 1:
+            return positions[idx[0]], None
+        if len(idx) == 2:
+            return positions[idx[0]], positions[idx[1]]
+        return None, None
+
+    def select_roi_rectangle(self):
+        x, _ = self.get_roi_coordinates()
+        if x is None:
+            return
+        self.stop_roi_selection()
+        self.roi_selector = RectangleSelector(
+            self.plot, self.on_select_roi_rectangle, button=[1])
+
+    def select_roi_polygon(self):
+        _, y = self.get_roi_coordinates()
+        # Polygons are only supported for 2D maps
+        if y is None:
+            return
+        self.stop_roi_selection()
+        self.roi_selector = PolygonSelector(
+            self.plot, self.on_select_roi_polygon)
+
+    def on_select_roi_rectangle(self, eclick, erelease):
+        extent = (eclick.xdata, erelease.xdata, eclick.ydata, erelease.ydata)
+        self.stop_roi_selection()
+        self.set_roi(('rectangle', extent))
+
+    def on_select_roi_polygon(self, vertices):
+        self.stop_roi_selection()
+        self.set_roi(('polygon', vertices))
+
+    def stop_roi_selection(self):
+        if self.roi_selector is None:
+            return
+        self.roi_selector.set_active(False)
+        self.roi_selector.set_visible(False)
+        self.roi_selector.disconnect_events()
+        self.roi_selector = None
+        self.mplcanvas.draw_idle()
+
+    def set_roi(self, roi):
+        self.roi = roi
+        self.update_roi_mask()
+        self.draw_roi()
+        self.mplcanvas.draw()
+
+    def clear_roi(self):
+        self.stop_roi_selection()
+        self.set_roi(None)
+
+    def on_roi_threshold(self):
+        self.roi_threshold.setEnabled(self.roi_threshold_enabled.isChecked())
+        self.update_roi_mask()
+
+    def update_roi_mask(self):
+        """
+        Combines the drawn region of interest and the
+        intensity threshold into the mask of points to evaluate.
+        """
+        mask = None
+        if self.session.file is not None:
+            x, y = self.get_roi_coordinates()
+            if self.roi is not None and x is not None:
+                shape, value = self.roi
+                if shape == 'rectangle':
+                    mask = rectangle_mask(x, y, value)
+                elif y is not None:
+                    mask = polygon_mask(x, y, value)
+
+            if self.roi_threshold_enabled.isChecked():
+                intensity = self.get_intensity_map()
+                if intensity is None:
+                    # The mask is updated once the intensities are read
+                    self.roi_mask = None
+                    self.label_roi.setText('Reading intensities...')
+                    return
+                threshold_mask = intensity_mask(intensity,
+                                                self.roi_threshold.value())
+                mask = threshold_mask if mask is None\
+                    else mask & threshold_mask
+
+        self.roi_mask = mask
+        if mask is None:
+            self.label_roi.setText('All points')
+        else:
+            self.label_roi.setText(
+                f'{np.count_nonzero(mask)} of {mask.size} points')
+
+    def get_intensity_map(self):
+        """
+        Returns the raw intensities of the measurement points of the
+        current repetition. The intensities of points not evaluated yet
+        are read in the background, None is returned until then.
+        """
+        evm = self.session.evaluation_model()
+        if self.intensity_map is not None and\
+                self.intensity_map[0] is evm:
+            return self.intensity_map[1]
+        resolution = self.session.get_payload_resolution()
+        intensity = get_evaluated_intensity(evm, resolution)
+        if not np.isnan(intensity).any():
+            self.intensity_map = (evm, intensity)
+            return intensity
+        if not self.intensity_thread.isRunning():
+            # The button also cancels a running evaluation
+            if not self.evaluation_running:
+                self.button_evaluate.setEnabled(False)
+            self.intensity_thread.set_task(
+                func=self.read_intensity_map,
+                fkw={'evm': evm, 'intensity': intensity})
+            self.intensity_thread.start()
+        return None
+
+    def read_intensity_map(self, evm, intensity):
+        return evm, get_intensity_map(self.session, intensity)
+
+    def on_intensity_map_read(self):
+        self.button_evaluate.setEnabled(True)
+        if self.intensity_thread.result is None:
+            return
+        self.intensity_map = self.intensity_thread.result
+        self.intensity_thread.result = None
+        # Reads the intensities of the current repetition
+        # if another one was selected meanwhile
+        self.update_roi_mask()
+
+    def draw_roi(self):
+        if self.roi_patch is not None and\
+                self.roi_patch in self.plot.patches:
+            self.roi_patch.remove()
+        self.roi_patch = None
+        if self.roi is None or isinstance(self.plot, Axes3D):
+            return
+
+        shape, value = self.roi
+        style = {'fill': False, 'edgecolor': 'tab:red', 'linestyle': '--'}
+        if shape == 'rectangle':
+            x_min, x_max, y_min, y_max = value
+            _, y = self.get_roi_coordinates()
+            # For line plots, only the horizontal extent matters
+            if y is None:
+                self.roi_patch = self.plot.axvspan(x_min, x_max, **style)
+                return
+            value = [(x_min, y_min), (x_max, y_min),
+                     (x_max, y_max), (x_min, y_max)]
+        self.roi_patch = Polygon(value, closed=True, **style)
+        self.plot.add_patch(self.roi_patch)
+
     def reset_ui(self):
         self.evaluation_progress.setValue(0)
+        self.evaluation_progress.setFormat('%p%')
+        self.evaluation_progress.setToolTip('')
+        self.stop_roi_selection()
+        self.roi = None
+        self.roi_patch = None
+        self.intensity_map = None
+        self.intensity_thread.wait()
+        self.intensity_thread.result = None
+        self.update_roi_mask()
         self.clear_plots()
         self.plot.cla()
+        self.raster_map.clear()
+        self.show_raster_map(False)
         self.updateBoundsTable()
         self.nrBrillouinPeaks_1.setChecked(True)
         self.combobox_parameter.clear()
@@ -454,25 +731,61 @@ class EvaluationView(QtWidgets.QWidget):
         self.combobox_parameter.blockSignals(False)
 
     def on_select_parameter(self):
-        self.refresh_plot()
+        self.request_plot()
 
     def on_scale_changed(self):
         autoscale = self.autoscale.isChecked()
         self.value_min.setDisabled(autoscale)
         self.value_max.setDisabled(autoscale)
         self.ignore_outliers.setDisabled(not autoscale)
-        self.refresh_plot()
+        self.request_plot()
+
+    def on_nr_workers_changed(self, nr_workers):
+        self.settings.setValue('evaluation/workers', nr_workers)
+
+    def on_progressive_changed(self, progressive):
+        self.settings.setValue('evaluation/progressive', progressive)
+
+    def on_warm_start_changed(self, warm_start):
+        self.settings.setValue('evaluation/warm-start', warm_start)
+
+    def on_reuse_fits_changed(self, reuse_fits):
+        self.settings.setValue('evaluation/reuse-fits', reuse_fits)
+
+    def on_out_of_core_changed(self, out_of_core):
+        self.settings.setValue('evaluation/out-of-core', out_of_core)
+
+    def on_raster_map_changed(self, enabled):
+        self.settings.setValue('evaluation/raster-map', enabled)
+
+    def on_fit_engine_changed(self):
+        self.settings.setValue('evaluation/engine',
+                               self.fit_engine.currentData())
 
-    def evaluate(self, blocking=False):
+    def evaluate(self, engine=None):
+        """
+        Starts the evaluation of the current repetition in the
+        background, or aborts it if it is already running.
+
+        Returns
+        -------
+        started: bool
+            Whether the evaluation was started. If so,
+            `evaluation_finished` is emitted when it is done.
+        """
         # Check that a file is open
         if self.session.file is None:
-            return
+            return False
         # If the evaluation is already running, we abort it and reset
         #  the button label
         if self.evaluation_running:
             self.evaluation_abort.value = True
             self.refresh_ui()
-            return
+            return False
+        # The region of interest is incomplete
+        # while the intensities are read
+        if self.intensity_thread.isRunning():
+            return False
 
         self.evaluation_abort.value = False
         self.evaluation_running = True
@@ -481,23 +794,61 @@ class EvaluationView(QtWidgets.QWidget):
         # disable switching to multi-peak fit and adjusting bounds
         self.nrBrillouinPeaksGroup.setEnabled(False)
         self.bounds_table.setEnabled(False)
+        self.widget_evaluation_options.setEnabled(False)
+        self.roiGroup.setEnabled(False)
+        self.stop_roi_selection()
         self.evaluation_timer.start(500)
 
         self.plot_count = 0
         self.count = mp.Value('I', 0, lock=True)
 
+        # Only evaluate the region of interest of the current map
+        mask = self.roi_mask
+        if mask is not None and\
+                mask.shape != tuple(self.session.get_payload_resolution()):
+            mask = None
+
         # We have to initialize the value correctly here,
         # otherwise the evaluation might abort immediately
         # if max_count is set only after the evaluation_timer
         # triggered for the first time
         image_keys = self.session.get_image_keys()
-        self.max_count = mp.Value('i', len(image_keys), lock=True)
+        nr_keys = len(image_keys) if mask is None\
+            else int(np.count_nonzero(mask))
+        self.max_count = mp.Value('i', nr_keys, lock=True)
+        self.throughput.reset(nr_keys)
 
         dnkw = {
             "count": self.count,
             "max_count": self.max_count,
             "abort": self.evaluation_abort,
+            "nr_workers": self.nr_workers.value(),
+            "mask": mask,
+            "progressive": self.progressive.isChecked(),
+            "warm_start": self.warm_start.isChecked(),
+            "engine": engine if engine is not None
+            else self.fit_engine.currentData(),
+            "partial": self.reuse_fits.isChecked(),
+            "read_ahead": int(self.settings.value(
+                'io/read-ahead', hdf5.READ_AHEAD)),
+            "prefetch_depth": int(self.settings.value(
+                'io/prefetch-depth', prefetch.PREFETCH_DEPTH)),
+            "prefetch_memory": float(self.settings.value(
+                'io/prefetch-memory-mb', prefetch.PREFETCH_MEMORY)),
+            "throughput": self.throughput,
+            "checkpoint_interval": float(self.settings.value(
+                'evaluation/checkpoint-interval-s',
+                checkpoint.CHECKPOINT_INTERVAL)),
+            "out_of_core": self.out_of_core.isChecked(),
+            "scratch_directory": self.settings.value(
+                'evaluation/scratch-directory') or None,
         }
+        self.evaluation_mask = mask
+        self.evaluation_progressive = self.progressive.isChecked()
+        resolution = self.session.get_payload_resolution()
+        self.evaluation_raster_map = self.raster_map_enabled.isChecked()\
+            and resolution is not None\
+            and sum(dim > 1 for dim in resolution) == 2
 
         self.thread = QThread()
         self.worker = Worker(fkw=dnkw)
@@ -507,24 +858,26 @@ class EvaluationView(QtWidgets.QWidget):
         self.worker.finished.connect(self.worker.deleteLater)
         self.worker.finished.connect(self.refresh_ui)
         self.thread.finished.connect(self.thread.deleteLater)
+        # The evaluation is only done when its thread stopped,
+        # even if it was aborted before
+        self.thread.finished.connect(self.evaluation_finished)
         self.thread.start()
-
-        if blocking:
-            while self.evaluation_running:
-                QCoreApplication.instance().processEvents()
-                time.sleep(0.1)
+        return True
 
     def refresh_ui(self):
         # If evaluation is aborted by user,
         # couldn't start or is finished,
         # we stop the timer
-        if self.evaluation_abort.value or\
-           self.max_count.value < 0 or\
-           self.count.value >= self.max_count.value:
+        if self.evaluation_running and (
+                self.evaluation_abort.value or
+                self.max_count.value < 0 or
+                self.count.value >= self.max_count.value):
             self.evaluation_timer.stop()
             self.evaluation_running = False
             self.button_evaluate.setText('Evaluate')
             self.nrBrillouinPeaksGroup.setEnabled(True)
+            self.widget_evaluation_options.setEnabled(True)
+            self.roiGroup.setEnabled(True)
             session = Session.get_instance()
             if session.evaluation_model().nr_brillouin_peaks > 1:
                 self.bounds_table.setEnabled(True)
@@ -533,13 +886,36 @@ class EvaluationView(QtWidgets.QWidget):
         if self.max_count.value >= 0:
             self.evaluation_progress.setMaximum(self.max_count.value)
         self.evaluation_progress.setValue(self.count.value)
+        self.refresh_throughput()
 
-        # We refresh the image every thirty points to not slow down to much
-        if (self.count.value - self.plot_count) > 30:
+        # We refresh the image every thirty points to not slow down to much,
+        # the raster map is fast enough to show every update
+        plot_interval = 0 if self.evaluation_raster_map else 30
+        if (self.count.value - self.plot_count) > plot_interval:
             self.plot_count = self.count.value
-            self.refresh_plot()
+            self.request_plot()
+
+    def refresh_throughput(self):
+        """
+        Shows the rate and the remaining time of the evaluation
+        in the progress bar and the progress of every worker
+        in its tooltip.
+        """
+        if self.evaluation_running:
+            summary = self.throughput.summary()
+            self.evaluation_progress.setFormat(f'%p% ({summary})')
+        else:
+            summary = progress.format_duration(self.throughput.elapsed)
+            self.evaluation_progress.setFormat(f'%p% (took {summary})')
+        self.evaluation_progress.setToolTip(self.throughput.worker_summary())
+        self.progress_changed.emit(summary)
+
+    def request_plot(self):
+        """ Redraws the plot with the next frame, see `RedrawScheduler` """
+        RedrawScheduler.get_instance().request(self.refresh_plot, self)
 
     def refresh_plot(self):
+        RedrawScheduler.get_instance().cancel(self.refresh_plot)
         session = Session.get_instance()
         evm = session.evaluation_model()
         if evm is None:
@@ -550,16 +926,44 @@ class EvaluationView(QtWidgets.QWidget):
         parameter_index = self.combobox_parameter.currentIndex()
         brillouin_peak_index = self.combobox_peak_number.currentIndex()
         parameter_key = list(parameters.keys())[parameter_index]
+        title = parameters[parameter_key]['label']
+        if getattr(evm, 'approximate', False):
+            title += ' (approximate)'
 
+        # Large maps are decimated to the points that can be shown
+        max_points = int(self.settings.value('plot/max-points',
+                                             MAX_PLOT_POINTS))
         data, positions, dimensionality, labels =\
             self.evaluation_controller.\
-            get_data(parameter_key, brillouin_peak_index)
+            get_data(parameter_key, brillouin_peak_index, max_points)
+
+        # While evaluating from coarse to fine, we show the
+        # points not evaluated yet with the value of their neighbours
+        if self.evaluation_running and self.evaluation_progressive:
+            mask = self.evaluation_mask
+            if mask is not None:
+                mask = mask[tuple(slice(None, None, step) for step in
+                                  get_decimation(mask.shape, max_points))]
+            data = fill_nearest(data, mask)
 
         # Subtract the mean value of the positions,
         # so they are centered around zero
         for position in positions:
             position -= np.nanmean(position)
 
+        # Create the slices list
+        dslice = [slice(None) if dim > 1 else 0 for dim in data.shape]
+        idx = [idx for idx, dim in enumerate(data.shape) if dim > 1]
+
+        if self.evaluation_running and self.evaluation_raster_map\
+                and dimensionality == 2:
+            self.refresh_raster_map(
+                data, [positions[i][tuple(dslice)] for i in idx],
+                {**parameters[parameter_key], 'label': title},
+                [labels[i] for i in idx])
+            return
+        self.show_raster_map(False)
+
         # Check that we have the correct subplot type
         if dimensionality != 3\
                 and isinstance(self.plot, Axes3D):
@@ -571,10 +975,6 @@ class EvaluationView(QtWidgets.QWidget):
             self.plot = self.mplcanvas.\
                 get_figure().add_subplot(111, projection='3d')
 
-        # Create the slices list
-        dslice = [slice(None) if dim > 1 else 0 for dim in data.shape]
-        idx = [idx for idx, dim in enumerate(data.shape) if dim > 1]
-
         try:
             if dimensionality == 0:
                 # If this is a line plot already, just set new data
@@ -586,7 +986,7 @@ class EvaluationView(QtWidgets.QWidget):
                     self.image_map =\
                         self.plot.plot(0, data[tuple(dslice)], marker='x')
                 self.plot.set_xlabel('')
-                self.plot.set_title(parameters[parameter_key]['label'])
+                self.plot.set_title(title)
                 ylabel = parameters[parameter_key]['symbol'] +\
                     ' [' + parameters[parameter_key]['unit'] + ']'
                 self.plot.set_ylabel(ylabel)
@@ -610,7 +1010,7 @@ class EvaluationView(QtWidgets.QWidget):
                         positions[idx[0]][tuple(dslice)],
                         data[tuple(dslice)]
                     )
-                self.plot.set_title(parameters[parameter_key]['label'])
+                self.plot.set_title(title)
                 self.plot.set_xlabel(labels[idx[0]])
                 ylabel = parameters[parameter_key]['symbol'] +\
                     ' [' + parameters[parameter_key]['unit'] + ']'
@@ -663,7 +1063,7 @@ class EvaluationView(QtWidgets.QWidget):
                         # For some reason we have to apply the color limits
                         # twice to make it work properly
                         self.image_map.set_clim(value_min, value_max)
-                self.plot.set_title(parameters[parameter_key]['label'])
+                self.plot.set_title(title)
                 self.plot.set_xlabel(labels[idx[0]])
                 self.plot.set_ylabel(labels[idx[1]])
                 cb_label = parameters[parameter_key]['symbol'] +\
@@ -722,11 +1122,58 @@ class EvaluationView(QtWidgets.QWidget):
                     ' [' + parameters[parameter_key]['unit'] + ']'
                 self.colorbar.ax.set_title(cb_label)
 
+            self.draw_roi()
             self.mplcanvas.draw()
         except Exception as e:
             self.reset_ui()
             raise e
 
+    def refresh_raster_map(self, data, positions, parameter, labels):
+        """
+        Shows a 2D map in the raster map instead of the canvas.
+
+        Parameters
+        ----------
+        data: np.ndarray
+            The values of the map
+        positions: list
+            The horizontal and the vertical positions of the points
+        parameter: dict
+            The parameter shown
+        labels: list
+            The labels of the horizontal and the vertical axis
+        """
+        # We rotate the array so the x-axis is shown as the
+        # horizontal axis
+        image_map = np.rot90(np.squeeze(data))
+        with warnings.catch_warnings():
+            warnings.filterwarnings(
+                action='ignore',
+                message='All-NaN slice encountered'
+            )
+            extent = np.nanmin(positions[0]), np.nanmax(positions[0]), \
+                np.nanmin(positions[1]), np.nanmax(positions[1])
+            # Ignoring the outliers replaces them in the data
+            (value_min, value_max) = self.get_plot_limits(data.copy())
+        if not value_min < value_max:
+            value_min, value_max = None, None
+        self.raster_map.set_keep_aspect(self.aspect_ratio.isChecked())
+        self.raster_map.set_labels(
+            parameter['label'], labels[0], labels[1],
+            parameter['symbol'] + ' [' + parameter['unit'] + ']')
+        self.raster_map.set_data(image_map, extent, value_min, value_max)
+        self.show_raster_map(True)
+
+    def show_raster_map(self, show):
+        """ Shows either the raster map or the canvas and its toolbar """
+        if show != self.raster_map.isHidden():
+            return
+        layout = self.image_widget.layout()
+        for index in range(layout.count()):
+            widget = layout.itemAt(index).widget()
+            if widget is not None:
+                widget.setVisible((widget is self.raster_map) == show)
+
     def get_plot_limits(self, data):
         if self.autoscale.isChecked():
 
@@ -1,7 +1,6 @@
-from importlib import resources
 import logging
 
-from PyQt6 import QtWidgets, QtCore, uic
+from PyQt6 import QtWidgets
 from matplotlib.patches import Circle as MPLCircle
 
 import matplotlib
@@ -12,6 +11,9 @@ from bmlab.controllers import ExtractionController
 
 from bmicro.BGThread import BGThread
 from bmicro.gui.mpl import MplCanvas
+from bmicro.gui.pipeline import Pipeline
+from bmicro.gui.redraw import RedrawScheduler
+from bmicro.gui.ui import load_ui
 
 
 MODE_DEFAULT = 0
@@ -28,21 +30,21 @@ class ExtractionView(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs):
         super(ExtractionView, self).__init__(*args, **kwargs)
 
-        ref = resources.files('bmicro.gui.extraction') / 'extraction_view.ui'
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self)
+        load_ui('bmicro.gui.extraction', 'extraction_view', self)
 
         self.mode = MODE_DEFAULT
         self.current_frame = 0
 
         self.mplcanvas = MplCanvas(
-            self.image_widget, toolbar=('Home', 'Pan', 'Zoom'))
+            self.image_widget, toolbar=('Home', 'Pan', 'Zoom'),
+            name='extraction')
         self.image_plot = self.mplcanvas.get_figure().add_subplot(111)
         self.image_plot.axis('off')
         self.mplcanvas.get_figure().canvas.mpl_connect(
             'button_press_event', self.on_click_image)
 
         self.thread = BGThread()
+        self.pipeline = None
 
         self.combobox_datasets.currentIndexChanged.connect(
             self.on_select_dataset)
@@ -137,10 +139,15 @@ class ExtractionView(QtWidgets.QWidget):
                      (event.xdata, event.ydata))
         self.refresh_image_plot()
 
+    def request_image_plot(self):
+        """ Redraws the image with the next frame, see `RedrawScheduler` """
+        RedrawScheduler.get_instance().request(self.refresh_image_plot, self)
+
     def refresh_image_plot(self):
         """
         Updates the plot of the selected calibration image.
         """
+        RedrawScheduler.get_instance().cancel(self.refresh_image_plot)
         self.image_plot.cla()
         session = Session.get_instance()
         calib_key = self.combobox_datasets.currentText()
@@ -220,7 +227,7 @@ class ExtractionView(QtWidgets.QWidget):
             current_point[column] = value
             current_point = tuple(current_point)
             ec.set_point(calib_key, row, current_point)
-            self.refresh_image_plot()
+            self.request_image_plot()
 
     def _plot_points(self, points):
         for p in points:
@@ -275,7 +282,16 @@ class ExtractionView(QtWidgets.QWidget):
     def find_points_all(self):
         """
         Automatically finds the Rayleigh and Brillouin peaks of interest
-        for all calibrations existing.
+        for all calibrations existing, without blocking the interface.
+        """
+        if self.pipeline is not None and self.pipeline.running:
+            return
+        self.pipeline = Pipeline(self.find_points_all_stages(), self)
+        self.pipeline.start()
+
+    def find_points_all_stages(self):
+        """
+        The stages of `find_points_all`, see `bmicro.gui.pipeline`.
         """
         session = Session.get_instance()
         calib_keys = session.get_calib_keys(sort_by_time=True)
@@ -293,7 +309,6 @@ class ExtractionView(QtWidgets.QWidget):
             self.thread.set_task(
                 func=self.extraction_controller.find_points, fkw=dnkw)
             self.thread.start()
-            self.thread.wait()
+            yield self.thread
 
             self.refresh_image_plot()
-            QtCore.QCoreApplication.instance().processEvents()
@@ -7,10 +7,10 @@ import traceback
 
 import numpy as np
 
-from PyQt6 import QtWidgets, uic, QtCore, QtGui
+from PyQt6 import QtWidgets, QtCore, QtGui
 from PyQt6.QtWidgets import QFileDialog, QMessageBox, \
     QVBoxLayout, QWidget, QCheckBox, QHBoxLayout, QLabel, QLineEdit
-from PyQt6.QtCore import QSize
+from PyQt6.QtCore import QSize, pyqtSignal
 
 from bmlab.session import Session
 from bmlab.file import is_source_file
@@ -26,6 +26,11 @@ from . import peak_selection
 from . import evaluation
 
 from bmicro import __version__ as bmicroversion
+from bmicro import export, hdf5, progress, repetitions
+from bmicro.evaluation import FIT_ENGINES, FIT_ENGINE_NAMES
+from bmicro.gui.pipeline import Pipeline
+from bmicro.gui.ui import load_ui
+from bmicro.workers import WorkerPool
 from bmlab import __version__ as bmlabversion
 
 
@@ -49,6 +54,9 @@ class BMicro(QtWidgets.QMainWindow):
 
     """
 
+    # Emitted when the user cancels the batch evaluation
+    batch_cancelled = pyqtSignal()
+
     def __init__(self, *args, **kwargs):
         # Settings are stored in the .ini file format. Even though
         # `self.settings` may return integer/bool in the same session,
@@ -64,9 +72,7 @@ class BMicro(QtWidgets.QMainWindow):
 
         """ Initializes BMicro."""
         super(BMicro, self).__init__(*args, **kwargs)
-        ref = resources.files('bmicro.gui') / 'main.ui'
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self)
+        load_ui('bmicro.gui', 'main', self)
         QtCore.QCoreApplication.setApplicationName('BMicro')
 
         ref = resources.files('bmicro') / 'img'
@@ -108,12 +114,14 @@ class BMicro(QtWidgets.QMainWindow):
                 'nr_brillouin_peaks': 1,
                 'bounds_w0': None,
                 'bounds_fwhm': None,
+                'engine': FIT_ENGINES[0],
             },
             'export': {
                 'export': False,
             },
         }
         self.batch_evaluation_running = False
+        self.batch_pipeline = None
 
         # Build tabs
         self.widget_data_view = data.DataView(self)
@@ -134,6 +142,8 @@ class BMicro(QtWidgets.QMainWindow):
         self.tab_peak_selection.setLayout(self.layout_peak_selection)
         self.layout_peak_selection.addWidget(self.widget_peak_selection_view)
         self.widget_evaluation_view = evaluation.EvaluationView(self)
+        self.widget_evaluation_view.progress_changed.connect(
+            self.on_evaluation_progress)
         self.layout_evaluation = QtWidgets.QVBoxLayout()
         self.tab_evaluation.setLayout(self.layout_evaluation)
         self.layout_evaluation.addWidget(self.widget_evaluation_view)
@@ -181,6 +191,10 @@ class BMicro(QtWidgets.QMainWindow):
         try:
             self.close_file()
             session.set_file(file_name)
+            hdf5.set_chunk_cache(
+                session.file,
+                float(self.settings.value('io/chunk-cache-mb', 0)),
+                int(self.settings.value('io/chunk-cache-slots', 0)))
         except FileNotFoundError as e:
             msg = QMessageBox()
             msg.setIcon(QMessageBox.Icon.Warning)
@@ -203,14 +217,21 @@ class BMicro(QtWidgets.QMainWindow):
         self.reset_ui()
 
     def on_action_export_file(self):
+        if self.export_dialog is None:
+            self.create_export_dialog()
+        else:
+            # The batch dialog might have changed the configuration
+            self.update_export_dialog(self.export_dialog.widget)
+        self.export_dialog.open()
+
+    def create_export_dialog(self):
+        """ Creates the export dialog, which is reused afterwards """
         self.export_dialog = QtWidgets.QDialog(
             self,
             QtCore.Qt.WindowType.WindowTitleHint |
             QtCore.Qt.WindowType.WindowCloseButtonHint
         )
-        ref = resources.files('bmicro.gui') / 'export_configuration.ui'
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self.export_dialog)
+        load_ui('bmicro.gui', 'export_configuration', self.export_dialog)
         self.export_dialog.setWindowTitle('Export configuration')
         self.export_dialog.setWindowModality(
             QtCore.Qt.WindowModality.ApplicationModal)
@@ -223,8 +244,6 @@ class BMicro(QtWidgets.QMainWindow):
         self.init_export_dialog(self.export_dialog.widget)
         self.export_dialog.resize(QSize(500, 560))
 
-        self.export_dialog.open()
-
     def on_export_checkbox(self, parameter, min_box, max_box):
         checked = self.sender().isChecked()
         if checked:
@@ -253,6 +272,9 @@ class BMicro(QtWidgets.QMainWindow):
             self.export_config['brillouin'][parameter] = {'cax': tuple(cax)}
 
     def init_export_dialog(self, parent_widget):
+        # The widgets of every parameter, to update them
+        # when the dialog is shown again
+        parent_widget.export_widgets = {}
         v_layout = QVBoxLayout()
         v_layout.setContentsMargins(0, 6, 0, 6)
         v_layout.setSpacing(0)
@@ -295,22 +317,7 @@ class BMicro(QtWidgets.QMainWindow):
             parameter_widget.setLayout(h_layout)
             v_layout.addWidget(parameter_widget)
 
-            # Set the current config values
-            if key in self.export_config['brillouin']:
-                min_box.setText(self.export_config['brillouin'][key]['cax'][0])
-                max_box.setText(self.export_config['brillouin'][key]['cax'][1])
-            # Otherwise we set it to the default min/max
-            else:
-                min_box.setText('min')
-                max_box.setText('max')
-
-            if key in self.export_config['brillouin']['parameters']:
-                checkbox.setChecked(True)
-                min_box.setEnabled(True)
-                max_box.setEnabled(True)
-            else:
-                min_box.setEnabled(False)
-                max_box.setEnabled(False)
+            parent_widget.export_widgets[key] = (checkbox, min_box, max_box)
 
             # Connect handlers
             checkbox.clicked.connect(
@@ -324,16 +331,48 @@ class BMicro(QtWidgets.QMainWindow):
                 lambda value, param=key: self.on_export_maxbox(value, param)
             )
 
+        # Set the current config values
+        self.update_export_dialog(parent_widget)
+
         # This only works if there is no layout set yet!
         parent_widget.setLayout(v_layout)
         # self.export_dialog.scrollAreaWidgetContents.\
         #     setMinimumSize(QSize(0, 40*len(parameters)))
 
+    def update_export_dialog(self, parent_widget):
+        """ Shows the current export configuration """
+        config = self.export_config['brillouin']
+        for key, widgets in parent_widget.export_widgets.items():
+            checkbox, min_box, max_box = widgets
+            for widget in widgets:
+                widget.blockSignals(True)
+            checked = key in config['parameters']
+            checkbox.setChecked(checked)
+            # Otherwise we set it to the default min/max
+            cax = config[key]['cax'] if key in config else ('min', 'max')
+            min_box.setText(cax[0])
+            max_box.setText(cax[1])
+            min_box.setEnabled(checked)
+            max_box.setEnabled(checked)
+            for widget in widgets:
+                widget.blockSignals(False)
+
     def close_export_dialog(self):
         self.export_dialog.close()
 
     def export_file(self):
-        ExportController().export(self.export_config)
+        export.export(self.export_config)
+
+    def start_workers(self):
+        """
+        Starts the worker processes in the background,
+        so they are ready when the first evaluation starts.
+        """
+        nr_workers = self.widget_evaluation_view.nr_workers.value()
+        # The serial evaluation does not use them, they are
+        # started on demand if they are needed later on
+        if nr_workers > 1:
+            WorkerPool.get_instance().start(nr_workers)
 
     def reset_ui(self):
         """
@@ -405,6 +444,16 @@ class BMicro(QtWidgets.QMainWindow):
                                     f"BMicro {bmicroversion}", about_text)
 
     def on_action_batch_evaluation(self):
+        if self.batch_dialog is None:
+            self.create_batch_dialog()
+        else:
+            self.update_batch_file_table()
+            # The export dialog might have changed the configuration
+            self.update_export_dialog(self.batch_dialog.widget_parameters)
+        self.batch_dialog.exec()
+
+    def create_batch_dialog(self):
+        """ Creates the batch dialog, which is reused afterwards """
         self.batch_dialog = QtWidgets.QDialog(
             self,
             QtCore.Qt.WindowType.WindowTitleHint |
@@ -412,9 +461,7 @@ class BMicro(QtWidgets.QMainWindow):
             QtCore.Qt.WindowType.WindowMaximizeButtonHint |
             QtCore.Qt.WindowType.WindowMinimizeButtonHint
         )
-        ref = resources.files('bmicro.gui') / 'batch_evaluation.ui'
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self.batch_dialog)
+        load_ui('bmicro.gui', 'batch_evaluation', self.batch_dialog)
         self.batch_dialog.setWindowTitle('Batch evaluation')
         self.batch_dialog.setWindowModality(
             QtCore.Qt.WindowModality.ApplicationModal)
@@ -433,8 +480,6 @@ class BMicro(QtWidgets.QMainWindow):
 
         self.update_batch_file_settings()
 
-        self.batch_dialog.exec()
-
     def close_batch_dialog(self):
         self.batch_dialog.close()
 
@@ -624,6 +669,17 @@ class BMicro(QtWidgets.QMainWindow):
         self.batch_dialog.nrBrillouinPeaks_4.toggled.connect(
             lambda: self.set_nr_brillouin_peaks(4))
 
+        for engine in FIT_ENGINES:
+            self.batch_dialog.combobox_fit_engine.addItem(
+                FIT_ENGINE_NAMES[engine], engine)
+        self.batch_dialog.combobox_fit_engine.setCurrentIndex(
+            self.batch_dialog.combobox_fit_engine.findData(
+                cfg_evaluation['engine']))
+        self.batch_dialog.combobox_fit_engine.setEnabled(
+            cfg_evaluation['evaluate'])
+        self.batch_dialog.combobox_fit_engine.currentIndexChanged.connect(
+            self.on_evaluation_engine)
+
         # Export
         cfg_export = self.batch_config['export']
         self.batch_dialog.checkBox_export\
@@ -871,11 +927,17 @@ class BMicro(QtWidgets.QMainWindow):
             = self.sender().isChecked()
         self.batch_dialog.nrBrillouinPeaksGroup\
             .setEnabled(self.batch_config['evaluation']['evaluate'])
+        self.batch_dialog.combobox_fit_engine\
+            .setEnabled(self.batch_config['evaluation']['evaluate'])
         self.batch_dialog.bounds_table\
             .setEnabled(
                 self.batch_config['evaluation']['evaluate'] and
                 self.batch_config['evaluation']['nr_brillouin_peaks'] > 1)
 
+    def on_evaluation_engine(self):
+        self.batch_config['evaluation']['engine'] =\
+            self.batch_dialog.combobox_fit_engine.currentData()
+
     def on_export_export(self):
         self.batch_config['export']['export'] = self.sender().isChecked()
 
@@ -899,35 +961,68 @@ class BMicro(QtWidgets.QMainWindow):
             self.run_batch_evaluation()
         else:
             self.widget_evaluation_view.evaluation_abort.value = True
+            self.batch_cancelled.emit()
 
     def run_batch_evaluation(self):
         self.batch_dialog.button_start_cancel.setText('Cancel')
         self.batch_dialog.progressBar.setMaximum(len(self.batch_files))
         self.batch_dialog.progressBar.setValue(0)
-        for i, (file_hash, file) in enumerate(self.batch_files.items()):
+        self.show_batch_progress()
+        self.batch_pipeline = Pipeline(self.batch_evaluation_stages(), self)
+        self.batch_pipeline.finished.connect(
+            self.on_batch_evaluation_finished)
+        self.batch_pipeline.start()
+
+    def batch_evaluation_stages(self):
+        """
+        Evaluates all files of the batch evaluation one after
+        the other, see `bmicro.gui.pipeline`.
+        """
+        for i, file in enumerate(list(self.batch_files.values())):
             try:
-                self.evaluate_batch_file(file)
-            except BaseException:
+                yield from self.evaluate_batch_file(file)
+            except Exception:
                 # Set the status as failed
                 file['status'] = 'failed'
                 self.update_batch_file_table()
             if not self.batch_evaluation_running:
                 break
             self.batch_dialog.progressBar.setValue(i + 1)
+
+    def on_batch_evaluation_finished(self):
         self.batch_dialog.button_start_cancel.setText('Start')
         self.batch_evaluation_running = False
+        self.batch_dialog.progressBar.setFormat('%p%')
         self.update_batch_file_table()
 
+    def show_batch_progress(self, summary=None):
+        """
+        Shows the evaluated files and the rate and remaining
+        time of the running evaluation in the batch dialog.
+        """
+        text = '%v/%m files'
+        if summary:
+            text += f' (evaluating: {summary})'
+        self.batch_dialog.progressBar.setFormat(text)
+
+    def on_evaluation_progress(self, summary):
+        if self.batch_evaluation_running and self.batch_dialog is not None:
+            self.show_batch_progress(summary)
+
     def evaluate_batch_file(self, file):
+        """
+        The stages evaluating a file of the batch evaluation,
+        see `bmicro.gui.pipeline`.
+        """
         # Set the status as in process
         file['status'] = 'in-process'
         self.update_batch_file_table()
 
         # Show the data tab and open the file
         self.tabWidget.setCurrentIndex(0)
-        QtCore.QCoreApplication.instance().processEvents()
+        yield
         self.open_file(file['path'])
-        QtCore.QCoreApplication.instance().processEvents()
+        yield
 
         """
         Evaluate the file
@@ -936,10 +1031,20 @@ class BMicro(QtWidgets.QMainWindow):
 
         rep_keys = session.file.repetition_keys()
 
+        # Evaluate the repetitions in parallel if we may use several
+        # worker processes, otherwise one after the other below
+        nr_workers = self.widget_evaluation_view.nr_workers.value()
+        if nr_workers > 1 and len(rep_keys) > 1:
+            finished = yield from self.evaluate_batch_repetitions(
+                file, rep_keys, nr_workers)
+            if not finished:
+                return
+            rep_keys = []
+
         for rep_key in rep_keys:
             # Load repetition
             session.set_current_repetition(rep_key)
-            QtCore.QCoreApplication.instance().processEvents()
+            yield
 
             # Setup
             cfg_setup = self.batch_config['setup']
@@ -961,8 +1066,9 @@ class BMicro(QtWidgets.QMainWindow):
                 self.tabWidget.setCurrentIndex(1)
                 if self.aborted(file):
                     return
-                QtCore.QCoreApplication.instance().processEvents()
-                self.widget_extraction_view.find_points_all()
+                yield
+                yield from \
+                    self.widget_extraction_view.find_points_all_stages()
 
             # Calibration
             cfg_calibration = self.batch_config['calibration']
@@ -971,15 +1077,14 @@ class BMicro(QtWidgets.QMainWindow):
                 self.tabWidget.setCurrentIndex(2)
                 if self.aborted(file):
                     return
-                QtCore.QCoreApplication.instance().processEvents()
+                yield
+                do_not = None
                 if not cfg_calibration['find-peaks']:
-                    self.widget_calibration_view.\
-                        calibrate_all(do_not='find_peaks')
+                    do_not = 'find_peaks'
                 elif not cfg_calibration['calibrate']:
-                    self.widget_calibration_view.\
-                        calibrate_all(do_not='calibrate')
-                else:
-                    self.widget_calibration_view.calibrate_all()
+                    do_not = 'calibrate'
+                yield from self.widget_calibration_view.\
+                    calibrate_all_stages(do_not=do_not)
 
             # PeakSelection
             cfg_peak_selection = self.batch_config['peak-selection']
@@ -987,7 +1092,7 @@ class BMicro(QtWidgets.QMainWindow):
                 self.tabWidget.setCurrentIndex(3)
                 if self.aborted(file):
                     return
-                QtCore.QCoreApplication.instance().processEvents()
+                yield
                 psc = PeakSelectionController()
                 for brillouin_region \
                         in cfg_peak_selection['brillouin_regions']:
@@ -996,7 +1101,7 @@ class BMicro(QtWidgets.QMainWindow):
                         in cfg_peak_selection['rayleigh_regions']:
                     psc.add_rayleigh_region_frequency(rayleigh_region)
                 self.widget_peak_selection_view.update_ui()
-                QtCore.QCoreApplication.instance().processEvents()
+                yield
 
             # Evaluation
             cfg_evaluation = self.batch_config['evaluation']
@@ -1004,35 +1109,69 @@ class BMicro(QtWidgets.QMainWindow):
                 self.tabWidget.setCurrentIndex(4)
                 if self.aborted(file):
                     return
-                QtCore.QCoreApplication.instance().processEvents()
+                yield
                 evc = EvaluationController()
                 evc.set_nr_brillouin_peaks(
                     cfg_evaluation['nr_brillouin_peaks'])
                 evc.set_bounds(cfg_evaluation['bounds_w0'])
                 evc.set_bounds_fwhm(cfg_evaluation['bounds_fwhm'])
-                self.widget_evaluation_view.evaluate(blocking=True)
+                if self.widget_evaluation_view.evaluate(
+                        engine=cfg_evaluation['engine']):
+                    yield self.widget_evaluation_view.evaluation_finished
 
             cfg_export = self.batch_config['export']
             if cfg_export['export']:
                 if self.aborted(file):
                     return
-                QtCore.QCoreApplication.instance().processEvents()
+                yield
                 self.export_file()
 
         # Save the evaluated data
         self.save_session()
         if self.aborted(file):
             return
-        QtCore.QCoreApplication.instance().processEvents()
+        yield
 
         # Close the file
         self.close_file()
-        QtCore.QCoreApplication.instance().processEvents()
+        yield
 
         # Set the status as done
         file['status'] = 'success'
         self.update_batch_file_table()
 
+    def evaluate_batch_repetitions(self, file, rep_keys, nr_workers):
+        """
+        The stages evaluating the repetitions of the open file in
+        parallel and merging the results into the session.
+
+        Returns False if the evaluation was aborted.
+        """
+        self.tabWidget.setCurrentIndex(4)
+        repetitions.apply_global_config(self.batch_config)
+        pending = repetitions.start_repetitions(
+            file['path'], rep_keys, self.batch_config, nr_workers)
+        throughput = progress.Throughput(len(rep_keys), unit='repetitions')
+        self.show_batch_progress(throughput.summary())
+        try:
+            while pending:
+                # Wait for the next repetition or the user to cancel
+                done, future = yield list(pending) + [self.batch_cancelled]
+                if self.aborted(file):
+                    return False
+                repetitions.merge_repetition(pending.pop(done),
+                                             future.result())
+                throughput.update(throughput.done + 1)
+                self.show_batch_progress(throughput.summary())
+        finally:
+            repetitions.cancel_repetitions(pending)
+
+        self.update_ui()
+        # The export covers all repetitions of the file
+        if self.batch_config['export']['export']:
+            self.export_file()
+        return True
+
     def aborted(self, file):
         if not self.batch_evaluation_running:
             file['status'] = 'aborted'
@@ -1040,7 +1179,6 @@ class BMicro(QtWidgets.QMainWindow):
             self.batch_evaluation_running = False
             self.update_batch_file_table()
             self.batch_dialog.progressBar.setValue(0)
-            QtCore.QCoreApplication.instance().processEvents()
             return True
 
     def batch_add_files(self):
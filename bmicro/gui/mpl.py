@@ -1,12 +1,70 @@
-from PyQt6 import QtWidgets
+import logging
+import time
+
+import numpy as np
+
+from PyQt6 import QtWidgets, QtCore
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg
+from matplotlib.collections import LineCollection
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT
 
+from bmicro.profiling import Profiler
+
+logger = logging.getLogger(__name__)
+
+
+class DrawStats(object):
+    """
+    Number and duration of the draws of a canvas.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.last = 0.0
+        self.over_budget = 0
+
+    def add(self, duration, budget):
+        self.count += 1
+        self.total += duration
+        self.max = max(self.max, duration)
+        self.last = duration
+        if duration > budget:
+            self.over_budget += 1
+
+    @property
+    def mean(self):
+        if not self.count:
+            return 0.0
+        return self.total / self.count
+
+    def as_dict(self):
+        return {
+            'count': self.count,
+            'total': self.total,
+            'mean': self.mean,
+            'max': self.max,
+            'last': self.last,
+            'over_budget': self.over_budget,
+        }
+
 
 class MplCanvas(FigureCanvasQTAgg):
 
-    def __init__(self, parent, toolbar=False, width=5, height=5, dpi=100):
+    # The draw statistics of all canvases by name
+    _draw_stats = {}
+
+    # Draws taking longer than this [s] are logged
+    draw_budget = 0.1
+
+    def __init__(self, parent, toolbar=False, width=5, height=5, dpi=100,
+                 name=None):
         """
         A custom PyQt widget for plotting with matplotlib.
 
@@ -22,11 +80,23 @@ class MplCanvas(FigureCanvasQTAgg):
             height of the figure
         dpi: int
             DPI settings
+        name: str
+            Name under which the draw statistics are collected,
+            the object name of the parent if not given
         """
 
         self.fig = Figure(figsize=(width, height), dpi=dpi)
         super(MplCanvas, self).__init__(self.fig)
 
+        if name is None:
+            name = parent.objectName()
+        self.name = name
+        # The budget [ms] can be adjusted in the settings file
+        self.draw_budget = 1e-3 * float(QtCore.QSettings().value(
+            'plot/draw-budget-ms', 1e3 * MplCanvas.draw_budget))
+        self.draw_stats = MplCanvas._draw_stats.setdefault(
+            name, DrawStats(name))
+
         layout = QtWidgets.QVBoxLayout()
 
         if toolbar:
@@ -43,3 +113,173 @@ class MplCanvas(FigureCanvasQTAgg):
 
     def get_figure(self):
         return self.fig
+
+    def draw(self):
+        start = time.perf_counter()
+        super(MplCanvas, self).draw()
+        duration = time.perf_counter() - start
+
+        self.draw_stats.add(duration, self.draw_budget)
+        Profiler.get_instance().record(
+            f'MplCanvas.draw ({self.name})', 'draw', start, duration)
+        if duration > self.draw_budget:
+            logger.info(f"Drawing canvas '{self.name}' took "
+                        f"{1e3 * duration:.0f} ms, exceeding the budget "
+                        f"of {1e3 * self.draw_budget:.0f} ms")
+
+    @staticmethod
+    def get_draw_stats():
+        """
+        Returns the draw statistics of all canvases.
+
+        Returns
+        -------
+        stats: dict
+            Number of draws, the total, mean, maximum and last
+            draw duration [s] and the number of draws exceeding
+            the budget by canvas name
+        """
+        return {name: stats.as_dict()
+                for name, stats in MplCanvas._draw_stats.items()}
+
+    @staticmethod
+    def reset_draw_stats():
+        for stats in MplCanvas._draw_stats.values():
+            stats.reset()
+
+
+class Overlays(object):
+    """
+    Artists drawn on top of the static content of an axes.
+
+    Whenever the canvas is fully drawn, e.g. because the spectrum
+    changed or the axes were zoomed, the static content is cached as
+    background. Changing an overlay, e.g. a selected region or a fitted
+    peak, then only restores the background and draws the overlays again
+    (blitting) instead of drawing the whole figure.
+    """
+
+    def __init__(self, canvas, axes):
+        """
+        Parameters
+        ----------
+        canvas: MplCanvas
+            The canvas the axes belong to
+        axes: Axes
+            The axes to draw the overlays in
+        """
+        self.canvas = canvas
+        self.axes = axes
+        self.artists = {}
+        self.widgets = []
+        self.background = None
+        # Widgets blitting themselves also cache the overlays
+        self.widgets_stale = False
+        # Must be connected before the widgets using blitting are
+        # created, so that the background does not contain their artists
+        canvas.mpl_connect('draw_event', self.on_draw)
+        canvas.mpl_connect('button_press_event', self.on_press)
+
+    def add_lines(self, name, **kwargs):
+        """
+        Adds an overlay of line segments.
+
+        Parameters
+        ----------
+        name: str
+            The name of the overlay
+        kwargs:
+            The properties of the `LineCollection`, e.g. `colors`
+
+        Returns
+        -------
+        lines: LineCollection
+            The lines of the overlay
+        """
+        lines = LineCollection([], animated=True, **kwargs)
+        self.artists[name] = lines
+        self.axes.add_collection(lines, autolim=False)
+        return lines
+
+    def add_widget(self, widget):
+        """
+        Registers a widget using blitting, e.g. a `SpanSelector`,
+        so that its background is updated when the overlays change.
+        """
+        if not self.widgets:
+            self.canvas.mpl_connect('draw_event', self.on_widgets_drawn)
+        self.widgets.append(widget)
+
+    def set_segments(self, name, segments):
+        """
+        Sets the line segments of an overlay.
+
+        Parameters
+        ----------
+        name: str
+            The name of the overlay
+        segments: list
+            The (x, y) coordinates of every segment, shape (N, 2)
+        """
+        self.artists[name].set_segments(segments)
+
+    def set_vlines(self, name, positions, ymin, ymax):
+        """ Sets vertical lines at the given positions """
+        self.set_segments(name, [[(x, ymin), (x, ymax)]
+                                 for x in np.ravel(positions)])
+
+    def clear(self):
+        """ Removes the segments of all overlays """
+        for lines in self.artists.values():
+            lines.set_segments([])
+
+    def attach(self):
+        """ Adds the overlays to the axes again after they were cleared """
+        for lines in self.artists.values():
+            if lines not in self.axes.collections:
+                lines.axes = None
+                self.axes.add_collection(lines, autolim=False)
+        self.background = None
+
+    def on_draw(self, event):
+        self.background = self.canvas.copy_from_bbox(
+            self.canvas.get_figure().bbox)
+        self.widgets_stale = False
+        self.draw_artists()
+        # Widgets using blitting draw the whole figure again to cache
+        # their background if there are visible animated artists.
+        # Since the overlays are already drawn, we hide them until
+        # the widgets handled the draw event.
+        if self.widgets:
+            for lines in self.artists.values():
+                lines.set_visible(False)
+
+    def on_widgets_drawn(self, event):
+        for lines in self.artists.values():
+            lines.set_visible(True)
+
+    def on_press(self, event):
+        if not self.widgets_stale or event.inaxes is not self.axes:
+            return
+        for widget in self.widgets:
+            if widget.useblit:
+                widget.update_background(event)
+        self.widgets_stale = False
+
+    def draw_artists(self):
+        for lines in self.artists.values():
+            self.axes.draw_artist(lines)
+
+    def update(self):
+        """ Draws the changed overlays on the cached background """
+        if self.background is None:
+            self.canvas.draw()
+            return
+        start = time.perf_counter()
+        self.canvas.restore_region(self.background)
+        self.draw_artists()
+        self.canvas.blit(self.canvas.get_figure().bbox)
+        self.widgets_stale = True
+        Profiler.get_instance().record(
+            f'Overlays.update ({self.canvas.name})', 'draw',
+            start, time.perf_counter() - start)
@@ -1,7 +1,6 @@
-from importlib import resources
 import logging
 
-from PyQt6 import QtWidgets, uic
+from PyQt6 import QtWidgets
 
 from matplotlib.widgets import SpanSelector
 import numpy as np
@@ -9,7 +8,9 @@ import numpy as np
 from bmlab.session import Session
 from bmlab.controllers import EvaluationController
 
-from bmicro.gui.mpl import MplCanvas
+from bmicro.gui.mpl import MplCanvas, Overlays
+from bmicro.gui.redraw import RedrawScheduler
+from bmicro.gui.ui import load_ui
 import warnings
 
 logger = logging.getLogger(__name__)
@@ -27,20 +28,26 @@ class PeakSelectionView(QtWidgets.QWidget):
     def __init__(self, *args, **kwargs):
         super(PeakSelectionView, self).__init__(*args, **kwargs)
 
-        ref = (resources.files('bmicro.gui.peak_selection') /
-               'peak_selection_view.ui')
-        with resources.as_file(ref) as ui_file:
-            uic.loadUi(ui_file, self)
+        load_ui('bmicro.gui.peak_selection', 'peak_selection_view', self)
 
         self.mplcanvas = MplCanvas(self.image_widget,
-                                   toolbar=('Home', 'Pan', 'Zoom'))
+                                   toolbar=('Home', 'Pan', 'Zoom'),
+                                   name='peak_selection')
         self.plot = self.mplcanvas.get_figure().add_subplot(111)
+        # The regions are redrawn without redrawing the spectrum
+        self.overlays = Overlays(self.mplcanvas, self.plot)
+        self.overlays.add_lines('brillouin_regions', colors='r')
+        self.overlays.add_lines('rayleigh_regions', colors='m')
+        # The mean spectrum shown and its frequencies [Hz]
+        self.spectrum = None
+        self.frequencies = None
 
         props = dict(facecolor='green', alpha=0.5)
         self.span_selector = SpanSelector(
             self.plot, onselect=self.on_select_data_region,
             useblit=True,
             direction='horizontal', props=props)
+        self.overlays.add_widget(self.span_selector)
 
         self.button_brillouin_select_done.clicked.connect(
             self.on_select_brillouin_clicked)
@@ -68,7 +75,7 @@ class PeakSelectionView(QtWidgets.QWidget):
     def reset_ui(self):
         self.table_Brillouin_regions.setRowCount(0)
         self.table_Rayleigh_regions.setRowCount(0)
-        self.plot.cla()
+        self.clear_plot()
         self.mplcanvas.draw()
 
     def on_select_brillouin_clicked(self):
@@ -101,7 +108,7 @@ class PeakSelectionView(QtWidgets.QWidget):
             pm.clear_brillouin_regions()
         elif button is self.button_rayleigh_clear:
             pm.clear_rayleigh_regions()
-        self.refresh_plot()
+        self.refresh_overlays()
 
     def on_select_data_region(self, xmin, xmax):
         if not self.plot.lines or not self.plot.lines[0]:
@@ -120,10 +127,24 @@ class PeakSelectionView(QtWidgets.QWidget):
             elif self.mode == MODE_SELECT_RAYLEIGH:
                 pm.add_rayleigh_region(region)
 
-        self.refresh_plot()
+        self.refresh_overlays()
 
-    def refresh_plot(self):
+    def clear_plot(self):
         self.plot.cla()
+        self.overlays.attach()
+        self.overlays.clear()
+        self.spectrum = None
+        self.frequencies = None
+
+    def refresh_plot(self):
+        """
+        Draws the mean spectrum with the selected regions.
+        Use `refresh_overlays` if only the regions changed.
+        """
+        scheduler = RedrawScheduler.get_instance()
+        scheduler.cancel(self.refresh_plot)
+        scheduler.cancel(self.refresh_overlays)
+        self.clear_plot()
         session = Session.get_instance()
         evc = EvaluationController()
 
@@ -159,21 +180,47 @@ class PeakSelectionView(QtWidgets.QWidget):
                                        1e-9*np.nanmax(frequencies))
                 self.plot.set_ylim(bottom=0)
 
-                regions = pm.get_brillouin_regions()
-                table = self.table_Brillouin_regions
-                self.refresh_regions(
-                    spectrum, regions, table, 'r', frequencies)
-
-                regions = pm.get_rayleigh_regions()
-                table = self.table_Rayleigh_regions
-                self.refresh_regions(
-                    spectrum, regions, table, 'm', frequencies)
+                self.spectrum = spectrum
+                self.frequencies = frequencies
+                self.set_overlays()
 
         except Exception as e:
             logger.error('Exception occurred in peak selection: %s' % e)
         finally:
             self.mplcanvas.draw()
 
+    def request_overlays(self):
+        """ Redraws the regions with the next frame, see `RedrawScheduler` """
+        RedrawScheduler.get_instance().request(self.refresh_overlays, self)
+
+    def refresh_overlays(self):
+        """
+        Redraws the regions, the spectrum stays as it is.
+        """
+        RedrawScheduler.get_instance().cancel(self.refresh_overlays)
+        try:
+            self.set_overlays()
+        except Exception as e:
+            logger.error('Exception occurred in peak selection: %s' % e)
+        self.overlays.update()
+
+    def set_overlays(self):
+        session = Session.get_instance()
+        pm = session.peak_selection_model()
+        if not pm or self.spectrum is None:
+            self.overlays.clear()
+            return
+
+        regions = pm.get_brillouin_regions()
+        table = self.table_Brillouin_regions
+        self.refresh_regions(self.spectrum, regions, table,
+                             'brillouin_regions', self.frequencies)
+
+        regions = pm.get_rayleigh_regions()
+        table = self.table_Rayleigh_regions
+        self.refresh_regions(self.spectrum, regions, table,
+                             'rayleigh_regions', self.frequencies)
+
     def setupTables(self):
         self.table_Brillouin_regions.setColumnCount(2)
         self.table_Brillouin_regions\
@@ -193,16 +240,17 @@ class PeakSelectionView(QtWidgets.QWidget):
         header.setSectionResizeMode(1,
                                     QtWidgets.QHeaderView.ResizeMode.Stretch)
 
-    def refresh_regions(self, spectrum, regions, table, color,
+    def refresh_regions(self, spectrum, regions, table, overlay,
                         frequencies=None):
         table.setRowCount(len(regions))
+        segments = []
         for rowIdx, region in enumerate(regions):
             if frequencies is not None:
                 ind_l = np.nanargmin(abs(frequencies[0] - region[0]))
                 ind_r = np.nanargmin(abs(frequencies[0] - region[1]))
                 mask = slice(ind_l, ind_r)
-                self.plot.plot(
-                    1e-9*frequencies[0][mask], spectrum[0][mask], color)
+                segments.append(np.column_stack(
+                    (1e-9*frequencies[0][mask], spectrum[0][mask])))
             # Add regions to table
             # Block signals, so the itemChanged signal is not
             # emitted during table creation
@@ -211,6 +259,7 @@ class PeakSelectionView(QtWidgets.QWidget):
                 item = QtWidgets.QTableWidgetItem(str(1e-9*value))
                 table.setItem(rowIdx, columnIdx, item)
             table.blockSignals(False)
+        self.overlays.set_segments(overlay, segments)
 
     def on_region_changed(self, type, item):
         row = item.row()
@@ -233,4 +282,4 @@ class PeakSelectionView(QtWidgets.QWidget):
                 current_region[column] = 1e9*value
                 current_region = tuple(current_region)
                 pm.set_rayleigh_region(row, current_region)
-            self.refresh_plot()
+            self.request_overlays()
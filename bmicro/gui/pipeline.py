@@ -0,0 +1,165 @@
+"""
+Runs sequences of stages without blocking the event loop.
+
+The batch and automatic evaluations consist of stages that take a
+while, e.g. finding the peaks in a background thread or evaluating in
+worker processes. Instead of spinning the event loop until a stage is
+done, a pipeline is written as generator that yields what it waits for:
+
+- a bound signal, the pipeline continues with the arguments
+  of the signal when it is emitted
+- a `QThread`, the pipeline continues when the thread finished
+- a `concurrent.futures.Future`, the pipeline continues with
+  the future when it is done
+- None, the pipeline continues in the next iteration of the event
+  loop, e.g. to let the user interface update first
+- a list of the above, the pipeline continues with the item done
+  first and its value
+
+For example::
+
+    def stages(self):
+        self.thread.start()
+        yield self.thread
+        self.tabWidget.setCurrentIndex(2)
+        yield
+
+    pipeline = Pipeline(self.stages())
+    pipeline.finished.connect(self.on_finished)
+    pipeline.start()
+
+Pipelines compose with `yield from`.
+"""
+import concurrent.futures
+import logging
+
+from PyQt6 import QtCore
+from PyQt6.QtCore import pyqtSignal
+
+logger = logging.getLogger(__name__)
+
+
+class Pipeline(QtCore.QObject):
+    """
+    Runs the stages of a generator, continuing whenever
+    what the current stage waits for is done.
+    """
+
+    # Emitted with the exception that stopped the pipeline,
+    # None if it completed or was aborted
+    finished = pyqtSignal(object)
+
+    # Emitted from any thread when a future is done
+    _future_done = pyqtSignal(object, object)
+
+    def __init__(self, stages, parent=None):
+        """
+        Parameters
+        ----------
+        stages: generator
+            The stages of the pipeline
+        parent: QObject
+            The parent of the pipeline
+        """
+        super().__init__(parent)
+        self.stages = stages
+        self.running = False
+        self.error = None
+        # Identifies the stage waiting, so that we ignore
+        # notifications of stages that are already done
+        self._step = 0
+        self._disconnect = []
+        self._future_done.connect(
+            self._on_future_done, QtCore.Qt.ConnectionType.QueuedConnection)
+
+    def start(self):
+        """ Starts running the stages """
+        if self.running:
+            return
+        self.running = True
+        self._resume(self._step, None)
+
+    def abort(self):
+        """
+        Stops the pipeline at the stage it waits for. The generator
+        is closed, so its `finally` clauses run.
+        """
+        if not self.running:
+            return
+        self._finish()
+        self.stages.close()
+        self.finished.emit(None)
+
+    def _finish(self):
+        self.running = False
+        self._step += 1
+        self._disconnect_all()
+
+    def _disconnect_all(self):
+        for disconnect in self._disconnect:
+            try:
+                disconnect()
+            except (TypeError, RuntimeError):
+                # Already disconnected or deleted
+                pass
+        self._disconnect = []
+
+    def _resume(self, step, value):
+        if not self.running or step != self._step:
+            return
+        self._disconnect_all()
+        self._step += 1
+        try:
+            self._wait(self.stages.send(value))
+        except StopIteration:
+            self._finish()
+            self.finished.emit(None)
+        except Exception as e:
+            logger.exception('Pipeline stage failed')
+            self.error = e
+            self._finish()
+            self.stages.close()
+            self.finished.emit(e)
+
+    def _wait(self, awaited):
+        step = self._step
+
+        def resume(value=None):
+            self._resume(step, value)
+
+        if isinstance(awaited, list):
+            # Continue with whatever is done first
+            for item in awaited:
+                self._wait_for(
+                    item, lambda value=None, item=item: resume((item, value)))
+        else:
+            self._wait_for(awaited, resume)
+
+    def _wait_for(self, awaited, resume):
+        if awaited is None:
+            QtCore.QTimer.singleShot(0, resume)
+        elif isinstance(awaited, QtCore.QThread):
+            def on_finished():
+                resume()
+            awaited.finished.connect(on_finished)
+            self._disconnect.append(
+                lambda: awaited.finished.disconnect(on_finished))
+            # The thread might have finished before we connected
+            if awaited.isFinished() or not awaited.isRunning():
+                QtCore.QTimer.singleShot(0, resume)
+        elif isinstance(awaited, concurrent.futures.Future):
+            # The callback runs in the thread completing the future,
+            # the signal brings the future to the thread of the pipeline
+            awaited.add_done_callback(
+                lambda future: self._future_done.emit(resume, future))
+        elif hasattr(awaited, 'connect') and hasattr(awaited, 'disconnect'):
+            def on_signal(*args):
+                resume(args[0] if len(args) == 1 else args)
+            awaited.connect(on_signal)
+            self._disconnect.append(lambda: awaited.disconnect(on_signal))
+        else:
+            raise TypeError(f'Cannot wait for {awaited!r}.')
+
+    @staticmethod
+    def _on_future_done(resume, future):
+        resume(future)
@@ -0,0 +1,302 @@
+"""
+Fast raster view of two-dimensional maps.
+
+Drawing a map with matplotlib lays out the axes, the colorbar and the
+whole figure and renders everything with Agg, which takes much longer
+than the map itself. For live updates while evaluating, the `RasterMap`
+colors the values through a precomputed lookup table into a `QImage`
+and paints it directly with Qt, together with simple axes, ticks and a
+colorbar. An update then costs a single pass over the pixels.
+"""
+import logging
+
+import numpy as np
+from matplotlib import colormaps
+from matplotlib.ticker import MaxNLocator
+from PyQt6 import QtCore, QtGui, QtWidgets
+from PyQt6.QtCore import pyqtSignal
+
+from bmicro.profiling import Profiler
+
+logger = logging.getLogger(__name__)
+
+# Number of colors of the lookup table
+LUT_SIZE = 256
+
+# Color of the points without a value (ARGB), transparent
+NAN_COLOR = 0x00000000
+
+
+def make_lut(cmap='viridis', size=LUT_SIZE, nan_color=NAN_COLOR):
+    """
+    Creates the lookup table of a colormap.
+
+    Parameters
+    ----------
+    cmap: str
+        The name of the matplotlib colormap
+    size: int
+        The number of colors
+    nan_color: int
+        The color of values that are not finite (ARGB)
+
+    Returns
+    -------
+    lut: np.ndarray
+        The `size` colors of the colormap followed by `nan_color`
+        as 32 bit ARGB values
+    """
+    rgba = colormaps[cmap].resampled(size)(np.arange(size), bytes=True)
+    rgba = rgba.astype(np.uint32)
+    lut = np.empty(size + 1, dtype=np.uint32)
+    lut[:size] = (rgba[:, 3] << 24) | (rgba[:, 0] << 16) |\
+        (rgba[:, 1] << 8) | rgba[:, 2]
+    lut[size] = nan_color
+    return lut
+
+
+def apply_lut(data, vmin, vmax, lut):
+    """
+    Maps values to the colors of a lookup table.
+
+    Parameters
+    ----------
+    data: np.ndarray
+        The values to map
+    vmin: float
+        The value mapped to the first color
+    vmax: float
+        The value mapped to the last color
+    lut: np.ndarray
+        The lookup table as created by `make_lut`
+
+    Returns
+    -------
+    argb: np.ndarray
+        The 32 bit ARGB colors of the values, values outside of
+        [vmin, vmax] get the first or the last color
+    """
+    size = len(lut) - 1
+    # A C-contiguous copy, so the colors can back an image
+    scaled = np.array(data, dtype=float, order='C')
+    invalid = ~np.isfinite(scaled)
+    scale = size / (vmax - vmin) if vmax > vmin else 0.
+    with np.errstate(invalid='ignore'):
+        scaled -= vmin
+        scaled *= scale
+    np.clip(scaled, 0, size - 1, out=scaled)
+    scaled[invalid] = size
+    return lut[scaled.astype(np.intp)]
+
+
+class RasterMap(QtWidgets.QWidget):
+    """
+    Shows a two-dimensional map with axes and a colorbar.
+    """
+
+    # Emitted with the data coordinates of a click into the map
+    clicked = pyqtSignal(float, float)
+
+    def __init__(self, parent=None, cmap='viridis'):
+        """
+        Parameters
+        ----------
+        parent: QWidget
+            The parent widget
+        cmap: str
+            The name of the matplotlib colormap
+        """
+        super(RasterMap, self).__init__(parent)
+        self.lut = make_lut(cmap)
+        # The colorbar is a single column of the lookup table,
+        # the highest value on top
+        self.colorbar = self._to_image(
+            self.lut[-2::-1].reshape(-1, 1).copy())
+        self.image = None
+        self._buffer = None
+        self.extent = (0., 1., 0., 1.)
+        self.vmin = 0.
+        self.vmax = 1.
+        self.title = ''
+        self.xlabel = ''
+        self.ylabel = ''
+        self.cb_label = ''
+        self.keep_aspect = True
+        self.setSizePolicy(QtWidgets.QSizePolicy.Policy.Expanding,
+                           QtWidgets.QSizePolicy.Policy.Expanding)
+        self.setMinimumSize(200, 150)
+
+    @staticmethod
+    def _to_image(argb):
+        height, width = argb.shape
+        return QtGui.QImage(argb.data, width, height, 4 * width,
+                            QtGui.QImage.Format.Format_ARGB32)
+
+    def set_data(self, data, extent, vmin=None, vmax=None):
+        """
+        Sets the map to show.
+
+        Parameters
+        ----------
+        data: np.ndarray
+            The values of the map, the first row is shown on top
+        extent: tuple
+            The coordinates of the left, right, bottom and top
+            edges of the map
+        vmin: float
+            The value mapped to the first color of the colormap,
+            the minimum of the data if not given
+        vmax: float
+            The value mapped to the last color of the colormap,
+            the maximum of the data if not given
+        """
+        data = np.asarray(data)
+        if vmin is None or vmax is None:
+            finite = data[np.isfinite(data)]
+            if vmin is None:
+                vmin = finite.min() if finite.size else 0.
+            if vmax is None:
+                vmax = finite.max() if finite.size else 1.
+        self.vmin, self.vmax = float(vmin), float(vmax)
+        self.extent = tuple(float(value) for value in extent)
+        # The image does not copy the data, so we keep a reference
+        self._buffer = apply_lut(data, self.vmin, self.vmax, self.lut)
+        self.image = self._to_image(self._buffer)
+        self.update()
+
+    def set_labels(self, title='', xlabel='', ylabel='', cb_label=''):
+        """ Sets the title and the labels of the axes and the colorbar """
+        self.title = title
+        self.xlabel = xlabel
+        self.ylabel = ylabel
+        self.cb_label = cb_label
+        self.update()
+
+    def set_keep_aspect(self, keep_aspect):
+        """ Sets whether the map is shown with equal axis scales """
+        self.keep_aspect = keep_aspect
+        self.update()
+
+    def clear(self):
+        self.image = None
+        self._buffer = None
+        self.update()
+
+    def get_map_rect(self):
+        """ Returns the rectangle [px] the map is drawn in """
+        metrics = self.fontMetrics()
+        line = metrics.height()
+        left = metrics.horizontalAdvance('-0000.0') + 2 * line
+        right = metrics.horizontalAdvance('-0000.00') + 3 * line
+        rect = QtCore.QRectF(self.rect()).adjusted(
+            left, 2 * line, -right, -3 * line)
+        x_min, x_max, y_min, y_max = self.extent
+        if self.keep_aspect and x_max > x_min and y_max > y_min\
+                and rect.width() > 0 and rect.height() > 0:
+            aspect = (x_max - x_min) / (y_max - y_min)
+            if rect.width() / rect.height() > aspect:
+                width = rect.height() * aspect
+                rect.setLeft(rect.left() + (rect.width() - width) / 2)
+                rect.setWidth(width)
+            else:
+                height = rect.width() / aspect
+                rect.setTop(rect.top() + (rect.height() - height) / 2)
+                rect.setHeight(height)
+        return rect
+
+    def to_data(self, x, y):
+        """ Converts widget coordinates [px] to data coordinates """
+        rect = self.get_map_rect()
+        x_min, x_max, y_min, y_max = self.extent
+        return (x_min + (x - rect.left()) / rect.width() * (x_max - x_min),
+                y_max - (y - rect.top()) / rect.height() * (y_max - y_min))
+
+    def mousePressEvent(self, event):
+        position = event.position()
+        if self.image is not None and\
+                self.get_map_rect().contains(position):
+            self.clicked.emit(*self.to_data(position.x(), position.y()))
+        super(RasterMap, self).mousePressEvent(event)
+
+    def paintEvent(self, event):
+        painter = QtGui.QPainter(self)
+        try:
+            with Profiler.get_instance().span('RasterMap.paint', 'draw'):
+                self._paint(painter)
+        finally:
+            painter.end()
+
+    def _paint(self, painter):
+        rect = self.get_map_rect()
+        if rect.width() <= 0 or rect.height() <= 0:
+            return
+        metrics = painter.fontMetrics()
+        line = metrics.height()
+        palette = self.palette()
+        painter.setPen(palette.color(QtGui.QPalette.ColorRole.WindowText))
+        align = QtCore.Qt.AlignmentFlag
+
+        painter.drawText(
+            QtCore.QRectF(rect.left(), 0, rect.width(), 2 * line),
+            align.AlignCenter, self.title)
+        if self.image is None:
+            painter.drawRect(rect)
+            return
+
+        # Every value is a block of pixels, so we don't smooth
+        painter.setRenderHint(
+            QtGui.QPainter.RenderHint.SmoothPixmapTransform, False)
+        painter.drawImage(rect, self.image)
+        painter.drawRect(rect)
+
+        x_min, x_max, y_min, y_max = self.extent
+        for tick in self._get_ticks(x_min, x_max):
+            x = rect.left() + (tick - x_min) / (x_max - x_min) * rect.width()
+            painter.drawLine(QtCore.QPointF(x, rect.bottom()),
+                             QtCore.QPointF(x, rect.bottom() + line / 4))
+            painter.drawText(
+                QtCore.QRectF(x - 3 * line, rect.bottom() + line / 4,
+                              6 * line, line),
+                align.AlignHCenter | align.AlignTop, f'{tick:g}')
+        painter.drawText(
+            QtCore.QRectF(rect.left(), rect.bottom() + 1.5 * line,
+                          rect.width(), line),
+            align.AlignCenter, self.xlabel)
+
+        for tick in self._get_ticks(y_min, y_max):
+            y = rect.bottom() - (tick - y_min) / (y_max - y_min) *\
+                rect.height()
+            painter.drawLine(QtCore.QPointF(rect.left() - line / 4, y),
+                             QtCore.QPointF(rect.left(), y))
+            painter.drawText(
+                QtCore.QRectF(0, y - line / 2, rect.left() - line / 2, line),
+                align.AlignRight | align.AlignVCenter, f'{tick:g}')
+        painter.save()
+        painter.translate(line / 2, rect.center().y())
+        painter.rotate(-90)
+        painter.drawText(QtCore.QRectF(-rect.height() / 2, -line / 2,
+                                       rect.height(), line),
+                         align.AlignCenter, self.ylabel)
+        painter.restore()
+
+        # The colorbar right of the map
+        bar = QtCore.QRectF(rect.right() + line, rect.top(),
+                            line, rect.height())
+        painter.drawImage(bar, self.colorbar)
+        painter.drawRect(bar)
+        painter.drawText(
+            QtCore.QRectF(bar.left() - 2 * line, bar.top() - 1.5 * line,
+                          5 * line, line),
+            align.AlignCenter, self.cb_label)
+        for value, y in ((self.vmax, bar.top()), (self.vmin, bar.bottom())):
+            painter.drawText(
+                QtCore.QRectF(bar.right() + line / 4, y - line / 2,
+                              self.width() - bar.right(), line),
+                align.AlignLeft | align.AlignVCenter, f'{value:.4g}')
+
+    @staticmethod
+    def _get_ticks(lower, upper):
+        if not upper > lower:
+            return []
+        ticks = MaxNLocator(nbins=5).tick_values(lower, upper)
+        return [tick for tick in ticks if lower <= tick <= upper]
@@ -0,0 +1,156 @@
+"""
+Coalesces the redraws of all views.
+
+Spinning a spin box, pasting into a table or switching the shown
+parameter emits many signals in a short time and every one of them used
+to redraw the plot at once. Instead, views request a redraw from the
+`RedrawScheduler`, which runs every requested redraw at most once per
+frame interval, however often it was requested. Redraws of views that
+are not visible, e.g. on another tab, are postponed until they are shown.
+"""
+import logging
+import sys
+import time
+
+from PyQt6 import QtCore
+
+logger = logging.getLogger(__name__)
+
+# The minimum time between two redraws [ms]
+FRAME_INTERVAL = 40
+
+
+class RedrawScheduler(QtCore.QObject):
+    """
+    Runs requested redraws at most once per frame interval.
+    """
+
+    _instance = None
+
+    def __init__(self, frame_interval=None):
+        """
+        Parameters
+        ----------
+        frame_interval: float
+            The minimum time between two redraws [ms], taken from the
+            setting `plot/frame-interval-ms` if not given
+        """
+        super(RedrawScheduler, self).__init__()
+        if frame_interval is None:
+            frame_interval = float(QtCore.QSettings().value(
+                'plot/frame-interval-ms', FRAME_INTERVAL))
+        self.frame_interval = frame_interval
+        # The requested redraws and the widgets they draw into,
+        # in the order they were requested
+        self.pending = {}
+        self.watched = set()
+        self.last_run = None
+        self.timer = QtCore.QTimer(self)
+        self.timer.setSingleShot(True)
+        self.timer.timeout.connect(self.run)
+
+    @staticmethod
+    def get_instance():
+        if RedrawScheduler._instance is None:
+            RedrawScheduler._instance = RedrawScheduler()
+        return RedrawScheduler._instance
+
+    def request(self, redraw, widget=None):
+        """
+        Requests a redraw. Requesting it again before it ran
+        does not redraw again.
+
+        Parameters
+        ----------
+        redraw: callable
+            Redraws the view, e.g. its `refresh_plot` method
+        widget: QWidget
+            The widget the redraw draws into. The redraw is postponed
+            while it is not visible.
+        """
+        self.pending[redraw] = widget
+        if widget is not None and widget not in self.watched:
+            # Redraw when the widget is shown
+            widget.installEventFilter(self)
+            widget.destroyed.connect(
+                lambda _=None, widget=widget: self.forget(widget))
+            self.watched.add(widget)
+        self.schedule()
+
+    def cancel(self, redraw):
+        """ Removes a requested redraw """
+        self.pending.pop(redraw, None)
+
+    def forget(self, widget):
+        self.watched.discard(widget)
+        self.pending = {redraw: pending_widget for redraw, pending_widget
+                        in self.pending.items()
+                        if pending_widget is not widget}
+
+    def is_pending(self, redraw):
+        return redraw in self.pending
+
+    def schedule(self):
+        if self.timer.isActive() or not self.get_due():
+            return
+        delay = 0
+        if self.last_run is not None:
+            elapsed = 1e3 * (time.monotonic() - self.last_run)
+            delay = max(0, round(self.frame_interval - elapsed))
+        self.timer.start(delay)
+
+    def get_due(self):
+        """ Returns the requested redraws of the visible widgets """
+        return [redraw for redraw, widget in self.pending.items()
+                if widget is None or widget.isVisible()]
+
+    def run(self):
+        """
+        Runs the requested redraws of all visible widgets. If a redraw
+        fails, the others still run and the error is then passed to
+        `sys.excepthook`, which shows it to the user.
+        """
+        due = self.get_due()
+        for redraw in due:
+            self.pending.pop(redraw, None)
+        error = self.run_redraws(due)
+        # The interval starts when the redraws are done,
+        # so that the events arriving meanwhile are handled first
+        self.last_run = time.monotonic()
+        self.schedule()
+        if error is not None:
+            sys.excepthook(type(error), error, error.__traceback__)
+
+    def flush(self):
+        """
+        Runs all requested redraws at once, also of hidden widgets.
+        Raises the error of the first failing redraw after running
+        the others.
+        """
+        self.timer.stop()
+        due = list(self.pending)
+        self.pending = {}
+        error = self.run_redraws(due)
+        self.last_run = time.monotonic()
+        if error is not None:
+            raise error
+
+    @staticmethod
+    def run_redraws(redraws):
+        """ Runs the redraws and returns the error of the first failing """
+        error = None
+        for redraw in redraws:
+            try:
+                redraw()
+            except Exception as exc:
+                if error is None:
+                    error = exc
+                else:
+                    # Only the first error is reported to the caller
+                    logger.exception('Redrawing failed')
+        return error
+
+    def eventFilter(self, watched, event):
+        if event.type() == QtCore.QEvent.Type.Show:
+            self.schedule()
+        return False
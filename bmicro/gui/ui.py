@@ -0,0 +1,142 @@
+"""
+Sets up the user interfaces designed with Qt Designer.
+
+Parsing a .ui file with `uic.loadUi` when a view or dialog is created
+takes a noticeable time. Instead, the .ui files are compiled into Python
+modules named `ui_<name>.py` next to them when BMicro is built
+(see `setup.py`). When working on the sources, compile them with
+
+    python -m bmicro.gui.ui
+
+Every compiled module stores the hash of the .ui file it was compiled
+from. If the module is missing or the .ui file changed since, the .ui
+file is parsed as before.
+"""
+import argparse
+import hashlib
+import importlib
+from importlib import resources
+import io
+import logging
+import pathlib
+
+from PyQt6 import uic
+
+logger = logging.getLogger(__name__)
+
+# Prefix of the modules compiled from the .ui files
+MODULE_PREFIX = 'ui_'
+
+
+def get_ui_hash(data):
+    """ Returns the hash of the content of a .ui file """
+    return hashlib.sha256(data).hexdigest()
+
+
+def compile_ui(ui_file, py_file=None):
+    """
+    Compiles a .ui file into a Python module.
+
+    Parameters
+    ----------
+    ui_file: str or pathlib.Path
+        The .ui file
+    py_file: str or pathlib.Path
+        The module to write, `ui_<name>.py` next
+        to the .ui file if not given
+
+    Returns
+    -------
+    py_file: pathlib.Path
+        The module written
+    """
+    ui_file = pathlib.Path(ui_file)
+    if py_file is None:
+        py_file = ui_file.with_name(f'{MODULE_PREFIX}{ui_file.stem}.py')
+    py_file = pathlib.Path(py_file)
+    code = io.StringIO()
+    uic.compileUi(str(ui_file), code)
+    with open(py_file, 'w', encoding='utf-8') as fd:
+        # The generated code does not follow our style
+        fd.write('# flake8: noqa\n')
+        fd.write(code.getvalue())
+        fd.write(f"\n\nUI_HASH = '{get_ui_hash(ui_file.read_bytes())}'\n")
+    return py_file
+
+
+def compile_all(directory):
+    """
+    Compiles all .ui files in a directory and its subdirectories.
+
+    Returns
+    -------
+    py_files: list
+        The modules written
+    """
+    return [compile_ui(ui_file) for ui_file
+            in sorted(pathlib.Path(directory).rglob('*.ui'))]
+
+
+def setup_compiled(module, widget):
+    """
+    Sets up a widget from a compiled module. Like `uic.loadUi`,
+    the child widgets become attributes of the widget.
+    """
+    ui_class = next(value for key, value in vars(module).items()
+                    if key.startswith('Ui_'))
+    ui = ui_class()
+    ui.setupUi(widget)
+    for key, value in vars(ui).items():
+        setattr(widget, key, value)
+    return widget
+
+
+def load_ui(package, name, widget):
+    """
+    Sets up a widget from a .ui file, using the compiled
+    module if it is up to date.
+
+    Parameters
+    ----------
+    package: str
+        The package containing the .ui file, e.g. 'bmicro.gui'
+    name: str
+        The name of the .ui file without suffix, e.g. 'main'
+    widget: QWidget
+        The widget to set up
+
+    Returns
+    -------
+    widget: QWidget
+        The widget set up
+    """
+    ref = resources.files(package) / f'{name}.ui'
+    try:
+        module = importlib.import_module(f'{package}.{MODULE_PREFIX}{name}')
+    except ImportError:
+        module = None
+    if module is not None and\
+            getattr(module, 'UI_HASH', None) == get_ui_hash(ref.read_bytes()):
+        return setup_compiled(module, widget)
+    if module is not None:
+        logger.debug(f"The compiled '{name}.ui' is outdated")
+    with resources.as_file(ref) as ui_file:
+        uic.loadUi(ui_file, widget)
+    return widget
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='Compiles the .ui files of BMicro into Python modules')
+    parser.add_argument(
+        'directory', nargs='?',
+        default=pathlib.Path(__file__).parent,
+        help='directory containing the .ui files, '
+             'the BMicro user interface by default')
+    args = parser.parse_args()
+    for py_file in compile_all(args.directory):
+        print(py_file)
+
+
+if __name__ == '__main__':
+    main()
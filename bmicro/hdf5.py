@@ -0,0 +1,176 @@
+"""
+Tuning of the HDF5 access to the raw data.
+
+bmlab opens the raw data files with the default settings of h5py and
+reads every image with a separate request, which results in many small
+reads. On network file systems these are slow, so we
+
+- reopen the file with a raw data chunk cache of configurable size,
+  which keeps the chunks of chunked and compressed images in memory
+- advise the operating system to read the images of the next
+  measurement points ahead while the current ones are evaluated.
+  Only systems supporting `os.posix_fadvise` do this, e.g. Linux.
+"""
+import logging
+import os
+
+import h5py
+
+logger = logging.getLogger(__name__)
+
+# Number of images to read ahead during the evaluation
+READ_AHEAD = 8
+
+
+def set_chunk_cache(brillouin_file, size, slots=None):
+    """
+    Reopens the HDF5 file of a Brillouin file with the given
+    raw data chunk cache.
+
+    Parameters
+    ----------
+    brillouin_file: bmlab.file.BrillouinFile
+        The opened Brillouin file
+    size: float
+        The size of the chunk cache [MiB], the default
+        of HDF5 is kept if 0 or None
+    slots: int
+        The number of slots of the chunk cache, should be a prime
+        number about 100 times the number of chunks fitting into
+        the cache. The default of HDF5 is kept if 0 or None.
+    """
+    h5 = brillouin_file.file
+    cache = h5.id.get_access_plist().get_cache()
+    nslots = int(slots) if slots else cache[1]
+    nbytes = int(size * 2**20) if size else cache[2]
+    if (nslots, nbytes) == cache[1:3]:
+        return
+    filename = h5.filename
+    groups = {'Brillouin_group': brillouin_file.Brillouin_group,
+              'Fluorescence_group': brillouin_file.Fluorescence_group}
+    groups = {attribute: group.name for attribute, group in groups.items()
+              if group is not None}
+    # HDF5 would reuse the open file with its cache settings,
+    # so we have to close it before we open it again
+    h5.close()
+    brillouin_file.file = h5py.File(filename, 'r', rdcc_nbytes=nbytes,
+                                    rdcc_nslots=nslots, rdcc_w0=cache[3])
+    # The groups bmlab accesses the data through
+    # have to refer to the reopened file
+    for attribute, name in groups.items():
+        setattr(brillouin_file, attribute, brillouin_file.file[name])
+    logger.debug(f'Chunk cache of {filename} set to {nbytes} bytes '
+                 f'with {nslots} slots')
+
+
+def _get_fd(h5):
+    """ Returns the file descriptor of an HDF5 file, if it has one """
+    if not hasattr(os, 'posix_fadvise') or h5.driver != 'sec2':
+        return None
+    try:
+        return int(h5.id.get_vfd_handle())
+    except (TypeError, ValueError, RuntimeError):
+        return None
+
+
+def get_byte_ranges(dataset):
+    """
+    Returns where the data of a dataset is stored in the file.
+
+    Parameters
+    ----------
+    dataset: h5py.Dataset
+        The dataset
+
+    Returns
+    -------
+    ranges: list
+        The offset and size [bytes] of every contiguous part
+    """
+    dsid = dataset.id
+    if dataset.chunks is None:
+        offset = dsid.get_offset()
+        if offset is None:
+            return []
+        return [(offset, dsid.get_storage_size())]
+    ranges = []
+    for index in range(dsid.get_num_chunks()):
+        info = dsid.get_chunk_info(index)
+        ranges.append((info.byte_offset, info.size))
+    return ranges
+
+
+def evict(path):
+    """
+    Advises the operating system to drop a file from the page cache,
+    so it is read from the storage again. Used for benchmarks.
+    """
+    if not hasattr(os, 'posix_fadvise'):
+        return
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+    finally:
+        os.close(fd)
+
+
+class ReadAhead:
+    """
+    Advises the operating system to read the images of the next
+    measurement points, while the current ones are evaluated.
+    """
+
+    def __init__(self, brillouin_file, payload, image_keys,
+                 depth=READ_AHEAD):
+        """
+        Parameters
+        ----------
+        brillouin_file: bmlab.file.BrillouinFile
+            The file containing the images
+        payload: bmlab.file.Payload
+            The payload of the repetition evaluated
+        image_keys: list
+            The image keys in the order they are read
+        depth: int
+            How many images to read ahead, 0 disables the read-ahead
+        """
+        self.fd = _get_fd(brillouin_file.file) if depth > 0 else None
+        self.data = payload.data
+        self.image_keys = list(image_keys)
+        self.positions = {key: idx for idx, key in enumerate(image_keys)}
+        self.depth = depth
+        # Images up to this position are already advised
+        self.advised = 0
+        if self.fd is not None:
+            os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+
+    def __call__(self, image_key):
+        """
+        Advises to read the images following the given one ahead.
+
+        Parameters
+        ----------
+        image_key: str
+            The image key that is about to be read
+        """
+        if self.fd is None or image_key not in self.positions:
+            return
+        position = self.positions[image_key]
+        end = min(position + 1 + self.depth, len(self.image_keys))
+        for key in self.image_keys[max(self.advised, position + 1):end]:
+            dataset = self.data.get(key)
+            if dataset is None:
+                continue
+            for offset, size in get_byte_ranges(dataset):
+                os.posix_fadvise(self.fd, offset, size,
+                                 os.POSIX_FADV_WILLNEED)
+        self.advised = max(self.advised, end)
+
+    def close(self):
+        """ Restores the default access pattern """
+        if self.fd is not None:
+            try:
+                os.posix_fadvise(self.fd, 0, 0, os.POSIX_FADV_NORMAL)
+            except OSError:
+                pass
+            self.fd = None
@@ -0,0 +1,227 @@
+"""
+Out-of-core storage of the evaluation results and spectra.
+
+The fit results of large 3D maps with multi-peak fits, and the spectra
+they were fitted to, can exceed the memory of a workstation. In the
+out-of-core mode, the results arrays of the evaluation model are NumPy
+memory maps of files in a scratch directory instead, and the spectra and
+frequency axes are appended to a file as they are extracted. The
+operating system then only keeps the parts in memory that are used.
+
+The memory maps behave like any other NumPy array, so the evaluation
+fills them chunk by chunk as before. The worker processes map the same
+files, see `bmicro.transport`, and the session file is written from them
+directly. The files are removed once the arrays are not used anymore.
+"""
+import logging
+import mmap
+import os
+import tempfile
+import threading
+import weakref
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _remove(path):
+    try:
+        os.remove(path)
+    except OSError:
+        # On Windows, the file is still mapped until the process exits
+        logger.debug(f"Could not remove '{path}'")
+
+
+def _create_file(directory, suffix):
+    fd, path = tempfile.mkstemp(prefix='bmicro-', suffix=suffix,
+                                dir=directory)
+    os.close(fd)
+    return path
+
+
+def is_mapped(array):
+    """ Whether an array is a memory map created by this module """
+    return isinstance(array, np.memmap) and\
+        isinstance(array.base, mmap.mmap) and array.filename is not None
+
+
+def create_array(shape, dtype=float, fill_value=np.nan, directory=None):
+    """
+    Creates an array in a file mapped to memory.
+
+    Parameters
+    ----------
+    shape: tuple
+        The shape of the array
+    dtype: np.dtype
+        The data type of the array
+    fill_value: float
+        The initial value of all elements
+    directory: str
+        The directory to create the file in,
+        the temporary directory if not given
+
+    Returns
+    -------
+    array: np.memmap
+        The array. Its file is removed when it is not used anymore.
+    """
+    if not np.prod(shape):
+        # Empty files cannot be mapped
+        return np.full(shape, fill_value, dtype=dtype)
+    path = _create_file(directory, '.dat')
+    array = np.memmap(path, dtype=dtype, mode='w+', shape=shape)
+    weakref.finalize(array, _remove, path)
+    array.fill(fill_value)
+    return array
+
+
+def full_like(array, fill_value=np.nan):
+    """
+    Returns a new array with the shape and data type of the given one,
+    which is mapped to a file in the same directory if the given one is.
+    """
+    if not is_mapped(array):
+        return np.full_like(array, fill_value)
+    return create_array(array.shape, array.dtype, fill_value,
+                        os.path.dirname(array.filename))
+
+
+def initialize_results_arrays(evm, dims, directory=None):
+    """
+    Initializes the results arrays of an evaluation model like
+    `EvaluationModel.initialize_results_arrays`, but as memory maps.
+
+    Parameters
+    ----------
+    evm: bmlab.models.evaluation_model.EvaluationModel
+        The evaluation model
+    dims: dict
+        The dimensions of the results
+    directory: str
+        The directory to create the files in,
+        the temporary directory if not given
+    """
+    # The model knows the shape of the results of a single point
+    evm.initialize_results_arrays({**dims, 'dim_x': 1, 'dim_y': 1,
+                                   'dim_z': 1})
+    resolution = (dims['dim_x'], dims['dim_y'], dims['dim_z'])
+    for key, value in evm.results.items():
+        if value.ndim < 3:
+            continue
+        evm.results[key] = create_array((*resolution, *value.shape[3:]),
+                                        value.dtype, np.nan, directory)
+
+
+class SpectraStore(dict):
+    """
+    Lists of one-dimensional arrays by key, e.g. the spectra or frequency
+    axes of all measurement points, appended to a file.
+
+    It is a dictionary, so the evaluation model and the session file
+    handle it like the dictionaries it replaces. The dictionary itself
+    only holds where the arrays are stored, they are read from the file
+    on access. Replaced arrays stay in the file, so copies of the store
+    are cheap and keep returning the arrays stored when they were made.
+    """
+
+    def __init__(self, directory=None, path=None, lock=None):
+        """
+        Parameters
+        ----------
+        directory: str
+            The directory to create the file in,
+            the temporary directory if not given
+        path: str
+            The file of an existing store to share,
+            used by `copy`
+        lock: threading.Lock
+            The lock of the file to share
+        """
+        super().__init__()
+        if path is None:
+            path = _create_file(directory, '.spectra')
+            self._file = open(path, 'w+b')
+            weakref.finalize(self, _close, self._file, path)
+        self.path = path
+        # The arrays are stored while others are read,
+        # e.g. by the prefetch thread
+        self._lock = threading.Lock() if lock is None else lock
+
+    def _read(self, location):
+        offset, dtype, lengths = location
+        data = np.fromfile(self.path, dtype=dtype, count=sum(lengths),
+                           offset=offset)
+        return np.split(data, np.cumsum(lengths)[:-1])
+
+    def __setitem__(self, key, arrays):
+        arrays = [np.asarray(array) for array in arrays]
+        dtype = np.result_type(*arrays) if arrays else np.dtype(float)
+        with self._lock:
+            file = self._get_file()
+            file.seek(0, os.SEEK_END)
+            offset = file.tell()
+            for array in arrays:
+                file.write(np.ascontiguousarray(array, dtype).tobytes())
+            file.flush()
+        super().__setitem__(
+            key, (offset, dtype.str, tuple(len(array) for array in arrays)))
+
+    def _get_file(self):
+        # Copies share the file of the store they were made from
+        store = self
+        while not hasattr(store, '_file'):
+            store = store._origin
+        return store._file
+
+    def __getitem__(self, key):
+        location = super().__getitem__(key)
+        if not location[2]:
+            return []
+        return self._read(location)
+
+    def __reduce__(self):
+        # Sent to another process, it becomes a plain dictionary
+        return dict, (dict(self.items()),)
+
+    def __iter__(self):
+        # Defining this makes `dict(store)` read the arrays
+        return super().__iter__()
+
+    def get(self, key, default=None):
+        return self[key] if key in self else default
+
+    def items(self):
+        # The arrays are read one by one, e.g. when saving the session
+        return ((key, self[key]) for key in self)
+
+    def values(self):
+        return (self[key] for key in self)
+
+    def pop(self, key, *default):
+        if key not in self and default:
+            return default[0]
+        value = self[key]
+        super().__delitem__(key)
+        return value
+
+    def copy(self):
+        store = SpectraStore(path=self.path, lock=self._lock)
+        store._origin = self
+        dict.update(store, dict.items(self))
+        return store
+
+    def update(self, *args, **kwargs):
+        for key, value in dict(*args, **kwargs).items():
+            self[key] = value
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self[key] = default
+        return self[key]
+
+
+def _close(file, path):
+    file.close()
+    _remove(path)
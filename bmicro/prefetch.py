@@ -0,0 +1,128 @@
+"""
+Prefetching of the spectra of upcoming measurement points.
+
+Reading the images and extracting the spectra of a measurement point
+takes about as long as fitting them. Instead of doing both one after
+the other, a separate I/O thread extracts the spectra of the next
+measurement points while the current ones are fitted. How many points
+are extracted ahead is limited by the number of points and the memory
+their spectra take.
+"""
+import collections
+import logging
+import threading
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Number of measurement points to extract ahead
+PREFETCH_DEPTH = 16
+
+# Memory the prefetched spectra may take at most [MiB]
+PREFETCH_MEMORY = 256
+
+
+def _get_size(value):
+    """ Returns the memory [bytes] the arrays in a value take """
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, (list, tuple)):
+        return sum(_get_size(item) for item in value)
+    return 0
+
+
+class Prefetcher:
+    """
+    Extracts the spectra of measurement points on a separate
+    thread, in the order in which they are requested.
+    """
+
+    def __init__(self, extract, image_keys, depth=PREFETCH_DEPTH,
+                 max_memory=PREFETCH_MEMORY):
+        """
+        Parameters
+        ----------
+        extract: callable
+            Returns the spectra of the measurement point
+            with the given image key
+        image_keys: list
+            The image keys in the order they are requested
+        depth: int
+            The number of measurement points to extract ahead
+        max_memory: float
+            The memory the extracted spectra may take at most [MiB].
+            A single measurement point is always extracted ahead,
+            even if its spectra take more.
+        """
+        self.extract = extract
+        self.image_keys = list(image_keys)
+        self.depth = depth
+        self.max_bytes = max_memory * 2**20
+        self.queue = collections.deque()
+        self.nbytes = 0
+        self.stopped = False
+        self.condition = threading.Condition()
+        self.thread = threading.Thread(target=self._run, daemon=True,
+                                       name='bmicro-prefetch')
+        self.thread.start()
+
+    def _is_full(self, size):
+        return self.queue and (len(self.queue) >= self.depth or
+                               self.nbytes + size > self.max_bytes)
+
+    def _run(self):
+        for image_key in self.image_keys:
+            try:
+                result, error = self.extract(image_key), None
+            except Exception as e:
+                result, error = None, e
+            size = _get_size(result)
+            with self.condition:
+                while not self.stopped and self._is_full(size):
+                    self.condition.wait()
+                if self.stopped:
+                    return
+                self.queue.append((image_key, result, error, size))
+                self.nbytes += size
+                self.condition.notify_all()
+
+    def get(self, image_key):
+        """
+        Returns the extracted spectra of a measurement point.
+
+        Parameters
+        ----------
+        image_key: str
+            The image key of the measurement point
+
+        Returns
+        -------
+        result:
+            What `extract` returns for this image key
+        """
+        with self.condition:
+            while not self.queue and self.thread.is_alive():
+                self.condition.wait()
+            item = self.queue.popleft() if self.queue else None
+            if item is not None:
+                self.nbytes -= item[3]
+                self.condition.notify_all()
+        if item is None or item[0] != image_key:
+            # Requested out of order, so we cannot use the queue anymore
+            logger.debug(f'Image {image_key} was not prefetched')
+            self.close()
+            return self.extract(image_key)
+        if item[2] is not None:
+            raise item[2]
+        return item[1]
+
+    def close(self):
+        """ Stops the prefetching and waits for the thread to finish """
+        with self.condition:
+            self.stopped = True
+            self.queue.clear()
+            self.nbytes = 0
+            self.condition.notify_all()
+        if self.thread is not threading.current_thread():
+            self.thread.join()
@@ -0,0 +1,299 @@
+"""
+Profiling of BMicro sessions.
+
+Start BMicro with
+
+    python -m bmicro --profile
+
+(or `--profile=path/to/trace.json`) to record how long file I/O,
+extraction, calibration, evaluation, export and plotting take.
+When BMicro exits, a timeline in the Chrome trace event format
+(open it in chrome://tracing or https://ui.perfetto.dev) and an
+aggregated summary are written.
+"""
+import datetime
+import functools
+import importlib
+import inspect
+import json
+import logging
+import os
+import pathlib
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# The methods to instrument, grouped by category
+INSTRUMENTED = {
+    'gui': [
+        'bmicro.gui.main:BMicro.open_file',
+        'bmicro.gui.main:BMicro.export_file',
+        'bmicro.gui.main:BMicro.save_session',
+        'bmicro.gui.main:BMicro.evaluate_batch_file',
+        'bmicro.gui.data.data_view:DataView.update_preview',
+        'bmicro.gui.data.data_view:DataView.on_auto_evaluation',
+        'bmicro.gui.extraction.extraction_view:'
+        'ExtractionView.refresh_image_plot',
+        'bmicro.gui.extraction.extraction_view:'
+        'ExtractionView.find_points_all',
+        'bmicro.gui.calibration.calibration_view:'
+        'CalibrationView.refresh_plot',
+        'bmicro.gui.calibration.calibration_view:'
+        'CalibrationView.calibrate',
+        'bmicro.gui.calibration.calibration_view:'
+        'CalibrationView.calibrate_all',
+        'bmicro.gui.peak_selection.peak_selection_view:'
+        'PeakSelectionView.refresh_plot',
+        'bmicro.gui.evaluation.evaluation_view:EvaluationView.evaluate',
+        'bmicro.gui.evaluation.evaluation_view:'
+        'EvaluationView.refresh_plot',
+    ],
+    'bmlab': [
+        'bmlab.session:Session.set_file',
+        'bmlab.session:Session.save',
+        'bmlab.controllers:ExtractionController.find_points',
+        'bmlab.controllers:CalibrationController.find_peaks',
+        'bmlab.controllers:CalibrationController.calibrate',
+        'bmlab.controllers:ImageController.extract_spectra',
+        'bmlab.controllers:EvaluationController.evaluate',
+        'bmlab.controllers:EvaluationController.fit_spectra',
+        'bmlab.controllers:ExportController.export',
+        'bmicro.evaluation:ChunkedEvaluationController.evaluate',
+        'bmicro.evaluation:ChunkedEvaluationController.load_spectra',
+        'bmicro.evaluation:ChunkedEvaluationController.load_chunk',
+    ],
+}
+
+
+class Profiler(object):
+    """
+    Collects the durations of instrumented calls.
+
+    Use `Profiler.get_instance()` to access the profiler.
+    Recording is a no-op unless the profiler is enabled.
+    """
+
+    __instance = None
+
+    def __init__(self):
+        if Profiler.__instance is not None:
+            raise Exception('Profiler is a singleton!')
+        Profiler.__instance = self
+        self.enabled = False
+        self.events = []
+        self.lock = threading.Lock()
+        self.start = time.perf_counter()
+
+    @staticmethod
+    def get_instance():
+        if Profiler.__instance is None:
+            Profiler()
+        return Profiler.__instance
+
+    def enable(self):
+        self.clear()
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+
+    def clear(self):
+        with self.lock:
+            self.events = []
+        self.start = time.perf_counter()
+
+    def record(self, name, category, start, duration, args=None):
+        """
+        Records a finished call.
+
+        Parameters
+        ----------
+        name: str
+            The name of the call
+        category: str
+            The category the call belongs to
+        start: float
+            The start time as returned by `time.perf_counter`
+        duration: float
+            The duration of the call [s]
+        args: dict
+            Additional information to store with the event
+        """
+        if not self.enabled:
+            return
+        event = {
+            'name': name,
+            'cat': category,
+            'ph': 'X',
+            # The trace event format uses microseconds
+            'ts': 1e6 * (start - self.start),
+            'dur': 1e6 * duration,
+            'pid': os.getpid(),
+            'tid': threading.get_ident(),
+        }
+        if args:
+            event['args'] = args
+        with self.lock:
+            self.events.append(event)
+
+    def span(self, name, category='bmicro'):
+        """
+        Context manager recording the duration of its body.
+        """
+        return _Span(self, name, category)
+
+    def summary(self):
+        """
+        Aggregates the recorded events by name.
+
+        Returns
+        -------
+        summary: list of dict
+            The number of calls and the total, mean and maximum
+            duration [s] of every recorded call,
+            sorted by the total duration
+        """
+        with self.lock:
+            events = list(self.events)
+        stats = {}
+        for event in events:
+            entry = stats.setdefault(event['name'], {
+                'name': event['name'],
+                'category': event['cat'],
+                'calls': 0,
+                'total': 0.0,
+                'max': 0.0,
+            })
+            duration = 1e-6 * event['dur']
+            entry['calls'] += 1
+            entry['total'] += duration
+            entry['max'] = max(entry['max'], duration)
+        for entry in stats.values():
+            entry['mean'] = entry['total'] / entry['calls']
+        return sorted(stats.values(), key=lambda e: e['total'],
+                      reverse=True)
+
+    def format_summary(self):
+        lines = [f"{'call':<50}{'calls':>8}{'total [s]':>12}"
+                 f"{'mean [ms]':>12}{'max [ms]':>12}"]
+        for entry in self.summary():
+            lines.append(
+                f"{entry['name']:<50}{entry['calls']:>8}"
+                f"{entry['total']:>12.3f}{1e3 * entry['mean']:>12.1f}"
+                f"{1e3 * entry['max']:>12.1f}")
+        return '\n'.join(lines)
+
+    def write(self, path):
+        """
+        Writes the recorded timeline and the summary.
+
+        Parameters
+        ----------
+        path: str or pathlib.Path
+            The JSON file to write the trace events to.
+            The summary is written next to it with a `.txt` suffix.
+
+        Returns
+        -------
+        paths: tuple
+            The paths of the trace and the summary file
+        """
+        path = pathlib.Path(path)
+        with self.lock:
+            events = list(self.events)
+        with open(path, 'w') as f:
+            json.dump({
+                'traceEvents': events,
+                'displayTimeUnit': 'ms',
+                'otherData': {'summary': self.summary()},
+            }, f)
+        summary_path = path.with_suffix('.txt')
+        with open(summary_path, 'w') as f:
+            f.write(self.format_summary() + '\n')
+        return path, summary_path
+
+
+class _Span(object):
+
+    def __init__(self, profiler, name, category):
+        self.profiler = profiler
+        self.name = name
+        self.category = category
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *args):
+        self.profiler.record(self.name, self.category, self.start,
+                             time.perf_counter() - self.start)
+
+
+def profiled(func, name, category):
+    """
+    Wraps a function so that its calls are recorded
+    while profiling is enabled.
+    """
+    profiler = Profiler.get_instance()
+    # Qt passes the arguments of a signal (e.g. `checked`) to every
+    # slot accepting them. Since the wrapper accepts any argument,
+    # we only forward as many as the wrapped function takes.
+    code = func.__code__
+    nr_args = None if code.co_flags & inspect.CO_VARARGS\
+        else code.co_argcount
+
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        args = args[:nr_args]
+        if not profiler.enabled:
+            return func(*args, **kwargs)
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            profiler.record(name, category, start,
+                            time.perf_counter() - start)
+    wrapper.__profiled__ = True
+    return wrapper
+
+
+def instrument(targets=None):
+    """
+    Wraps the given methods so that their calls are recorded.
+
+    This has to happen before the instrumented classes
+    are instantiated, so that signal connections use the
+    wrapped methods as well.
+
+    Parameters
+    ----------
+    targets: dict
+        Lists of 'module:Class.method' strings by category,
+        `INSTRUMENTED` if not given
+    """
+    if targets is None:
+        targets = INSTRUMENTED
+    for category, methods in targets.items():
+        for target in methods:
+            module_name, qualname = target.split(':')
+            class_name, method_name = qualname.split('.')
+            try:
+                cls = getattr(importlib.import_module(module_name),
+                              class_name)
+                attribute = cls.__dict__[method_name]
+            except (ImportError, AttributeError, KeyError):
+                logger.warning(f'Cannot instrument {target}')
+                continue
+            is_static = isinstance(attribute, staticmethod)
+            func = attribute.__func__ if is_static else attribute
+            if getattr(func, '__profiled__', False):
+                continue
+            wrapper = profiled(func, qualname, category)
+            setattr(cls, method_name,
+                    staticmethod(wrapper) if is_static else wrapper)
+
+
+def default_trace_path():
+    timestamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    return pathlib.Path.cwd() / f'bmicro-profile-{timestamp}.json'
@@ -0,0 +1,178 @@
+"""
+Throughput and remaining time of long running tasks.
+
+The evaluation and calibration only report how many measurement points
+or spectra they processed. From this progress, the rate is estimated
+over a rolling time window, so it follows changes of the speed, e.g.
+when the images are read from a slow network file system. The
+remaining time is extrapolated from the current rate.
+"""
+import collections
+import math
+import threading
+import time
+
+# The time window the rate is estimated from [s]
+THROUGHPUT_WINDOW = 10.
+
+# Minimum time between two progress messages in the log [s]
+LOG_INTERVAL = 30.
+
+
+def format_duration(seconds):
+    """ Formats a duration [s] as hours, minutes and seconds """
+    if seconds is None or not math.isfinite(seconds):
+        return '--:--'
+    minutes, seconds = divmod(int(round(seconds)), 60)
+    hours, minutes = divmod(minutes, 60)
+    if hours:
+        return f'{hours}:{minutes:02d}:{seconds:02d}'
+    return f'{minutes}:{seconds:02d}'
+
+
+class Throughput:
+    """
+    Estimates the rate and the remaining time of a task from
+    its progress. Can be updated and read from different threads.
+    """
+
+    def __init__(self, total=0, nr_frames=1, unit='px',
+                 window=THROUGHPUT_WINDOW, clock=time.monotonic):
+        """
+        Parameters
+        ----------
+        total: int
+            The number of items to process, e.g. measurement points
+        nr_frames: int
+            The number of frames, i.e. images or spectra, per item
+        unit: str
+            The unit of the items shown in the summary
+        window: float
+            The time window the rate is estimated from [s]
+        clock: callable
+            Returns the current time [s]
+        """
+        self.unit = unit
+        self.window = window
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.reset(total, nr_frames)
+
+    def reset(self, total, nr_frames=1):
+        """ Restarts the estimation for a new task """
+        with self.lock:
+            self.total = total
+            self.nr_frames = nr_frames
+            self.done = 0
+            self.start = self.clock()
+            self.logged = self.start
+            self.samples = collections.deque([(self.start, 0)])
+            self.workers = {}
+
+    def update(self, done, total=None):
+        """
+        Records the progress.
+
+        Parameters
+        ----------
+        done: int
+            The number of items processed so far
+        total: int
+            The number of items to process, if it changed
+        """
+        with self.lock:
+            now = self.clock()
+            self.done = done
+            if total is not None:
+                self.total = total
+            self.samples.append((now, done))
+            # Keep the last sample before the window as reference
+            while len(self.samples) > 2 and\
+                    self.samples[1][0] < now - self.window:
+                self.samples.popleft()
+
+    def add_worker(self, worker, count):
+        """
+        Records the items a worker processed.
+
+        Parameters
+        ----------
+        worker:
+            Identifies the worker, e.g. its process id
+        count: int
+            The number of items the worker just processed
+        """
+        with self.lock:
+            self.workers[worker] = self.workers.get(worker, 0) + count
+
+    @property
+    def elapsed(self):
+        """ The time since the start [s] """
+        return self.clock() - self.start
+
+    @property
+    def rate(self):
+        """ The number of items processed per second """
+        with self.lock:
+            now = self.clock()
+            # The last sample before the window, so that
+            # the rate decreases if there is no progress
+            start, done = self.samples[0]
+            for sample in self.samples:
+                if sample[0] > now - self.window:
+                    break
+                start, done = sample
+            duration = now - start
+            if duration <= 0 or self.done <= done:
+                return math.nan if self.done == 0 else 0.
+            return (self.done - done) / duration
+
+    @property
+    def frame_rate(self):
+        """ The number of frames processed per second """
+        return self.rate * self.nr_frames
+
+    @property
+    def eta(self):
+        """ The estimated remaining time [s], None if unknown """
+        rate = self.rate
+        if not rate > 0:
+            return None
+        return max(self.total - self.done, 0) / rate
+
+    def get_worker_progress(self):
+        """
+        Returns the number of items every worker processed,
+        the workers are numbered in the order they reported.
+        """
+        with self.lock:
+            return {idx + 1: count for idx, count
+                    in enumerate(self.workers.values())}
+
+    def summary(self):
+        """ The rate and the remaining time as text """
+        rate = self.rate
+        if math.isnan(rate):
+            return 'ETA --:--'
+        text = f'{rate:.1f} {self.unit}/s'
+        if self.nr_frames != 1:
+            text += f', {self.frame_rate:.1f} frames/s'
+        return f'{text}, ETA {format_duration(self.eta)}'
+
+    def worker_summary(self):
+        """ The progress of every worker as text, one per line """
+        return '\n'.join(f'Worker {worker}: {count} {self.unit}'
+                         for worker, count
+                         in self.get_worker_progress().items())
+
+    def should_log(self, interval=LOG_INTERVAL):
+        """ Whether the progress was not logged for some time """
+        with self.lock:
+            now = self.clock()
+            if now - self.logged < interval:
+                return False
+            self.logged = now
+            return True
+
+    def __str__(self):
+        return f'{self.done}/{self.total} {self.unit}, {self.summary()}'
@@ -0,0 +1,128 @@
+"""
+Quick-look estimates of the Brillouin and Rayleigh peaks.
+
+Fitting Lorentzian peaks is accurate, but takes long for large maps.
+To check whether a measurement is sensible, the peaks of all spectra
+are instead estimated at once with a few non-iterative NumPy operations:
+
+- The offset is the mean of the first and the last value of the region,
+  like for the initial parameters of the fits.
+- The intensity is the vertex of the parabola through the maximum and
+  its two neighbours.
+- The center is the centroid of the peak above half maximum. If the peak
+  is wider than the region, it is the vertex of the parabola instead.
+- The full width at half maximum is the distance between the points
+  where the spectrum crosses half the intensity on either side of the
+  maximum. If the peak is wider than the region, it is calculated from
+  the area of the peak, i.e. its zeroth moment, instead.
+
+Noise and overlapping peaks bias these estimates, so the results are
+only approximate.
+"""
+import numpy as np
+
+from bmicro import batch_fits
+
+
+def _interpolate(x, y, rows, idx, level):
+    """ Returns where y crosses the level between idx and idx + 1 """
+    x_0, x_1 = x[rows, idx], x[rows, idx + 1]
+    y_0, y_1 = y[rows, idx], y[rows, idx + 1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return x_0 + (level - y_0) * (x_1 - x_0) / (y_1 - y_0)
+
+
+def estimate_peaks(region, frequencies, spectra):
+    """
+    Estimates a single Lorentzian peak in the given region of all
+    spectra, like `bmicro.batch_fits.fit_lorentz_regions` fits it.
+
+    Parameters
+    ----------
+    region: tuple
+        The section of the data to evaluate
+    frequencies: list
+        The x-data of every spectrum
+    spectra: list
+        The y-data of every spectrum
+
+    Returns
+    -------
+    w0: np.ndarray
+        The centers with the shape (nr_spectra, 1)
+    fwhm: np.ndarray
+        The full-width-half-maxima with the shape (nr_spectra, 1)
+    intensity: np.ndarray
+        The intensities with the shape (nr_spectra, 1)
+    offset: np.ndarray
+        The offsets with the shape (nr_spectra,)
+    All values are NaN where no peak could be estimated.
+    """
+    x, y, valid = batch_fits.get_region_data(region, frequencies, spectra)
+    nr_spectra, length = x.shape
+    w0, fwhm, intensity, offset = [np.nan * np.ones(nr_spectra)
+                                   for _ in range(4)]
+
+    counts = np.count_nonzero(valid, axis=1)
+    # We need at least the maximum and its neighbours
+    selected = np.flatnonzero(counts >= 3)
+    if not selected.size:
+        return (w0[:, np.newaxis], fwhm[:, np.newaxis],
+                intensity[:, np.newaxis], offset)
+    x, y, valid = x[selected], y[selected], valid[selected]
+    last = counts[selected] - 1
+    rows = np.arange(len(selected))
+
+    base = (y[:, 0] + y[rows, last]) / 2
+    peak = np.argmax(np.where(valid, y, -np.inf), axis=1)
+
+    # The vertex of the parabola through the maximum and its neighbours
+    left = np.maximum(peak - 1, 0)
+    right = np.minimum(peak + 1, last)
+    y_left, y_peak, y_right = y[rows, left], y[rows, peak], y[rows, right]
+    curvature = y_left - 2 * y_peak + y_right
+    inside = (left < peak) & (peak < right) & (curvature < 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = np.where(inside, (y_left - y_right) / (2 * curvature), 0)
+    height = y_peak - (y_left - y_right) * delta / 4
+    center = x[rows, peak] + np.where(
+        delta > 0, delta * (x[rows, right] - x[rows, peak]),
+        delta * (x[rows, peak] - x[rows, left]))
+    amplitude = height - base
+
+    # The last value below half maximum left of the maximum
+    # and the first one right of it
+    half = base + amplitude / 2
+    index = np.arange(length)
+    below = valid & (y < half[:, np.newaxis])
+    idx_left = np.max(np.where(below & (index < peak[:, np.newaxis]),
+                               index, -1), axis=1)
+    idx_right = np.min(np.where(below & (index > peak[:, np.newaxis]),
+                                index, length), axis=1)
+    crossed = (idx_left >= 0) & (idx_right <= last)
+    width = _interpolate(x, y, rows, np.clip(idx_right, 1, length - 1) - 1,
+                         half) -\
+        _interpolate(x, y, rows, np.clip(idx_left, 0, length - 2), half)
+
+    # The area of a Lorentzian peak is pi / 2 * intensity * fwhm
+    pairs = valid[:, 1:] & valid[:, :-1]
+    area = np.sum(np.where(
+        pairs, (y[:, 1:] + y[:, :-1] - 2 * base[:, np.newaxis]) / 2 *
+        np.diff(x, axis=1), 0), axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        width = np.where(crossed, width, 2 * area / (np.pi * amplitude))
+
+    # The centroid averages the noise of all points above half maximum
+    above = valid & (index > idx_left[:, np.newaxis]) &\
+        (index < idx_right[:, np.newaxis])
+    weight = np.where(above, y - half[:, np.newaxis], 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        centroid = np.sum(weight * x, axis=1) / np.sum(weight, axis=1)
+    center = np.where(crossed, centroid, center)
+    estimated = (amplitude > 0) & (width > 0)
+    w0[selected] = np.where(estimated, center, np.nan)
+    fwhm[selected] = np.where(estimated, width, np.nan)
+    intensity[selected] = np.where(estimated, amplitude, np.nan)
+    offset[selected] = np.where(estimated, base, np.nan)
+    return (w0[:, np.newaxis], fwhm[:, np.newaxis],
+            intensity[:, np.newaxis], offset)
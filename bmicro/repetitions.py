@@ -0,0 +1,237 @@
+"""
+Parallel evaluation of the repetitions of a file.
+
+The repetitions of a file are independent of each other, so every
+repetition is evaluated as a separate job in a worker process with a
+session of its own. The models of the evaluated repetitions are then
+merged into the session of the calling process, which is saved and
+exported once all repetitions are done.
+
+The jobs are configured with a dictionary in the layout of the batch
+evaluation configuration of the main window, see `get_default_config`.
+"""
+import copy
+import logging
+
+from bmlab.controllers import CalibrationController, EvaluationController, \
+    ExtractionController, PeakSelectionController
+from bmlab.models.setup import AVAILABLE_SETUPS
+from bmlab.session import Session
+
+from bmicro.evaluation import FIT_ENGINES, ChunkedEvaluationController
+from bmicro.workers import WorkerPool
+
+logger = logging.getLogger(__name__)
+
+# The session attributes holding the models of every repetition
+REPETITION_MODELS = ('extraction_models', 'calibration_models',
+                     'peak_selection_models', 'evaluation_models')
+
+
+def get_default_config():
+    """ Returns the configuration running all evaluation steps """
+    return {
+        'setup': {
+            'set': True,
+            'setup': AVAILABLE_SETUPS[0],
+        },
+        'orientation': {
+            'set': True,
+            'rotation': 0,
+            'reflection': {'vertically': False, 'horizontally': True},
+        },
+        'extraction': {
+            'extract': True,
+        },
+        'calibration': {
+            'find-peaks': True,
+            'calibrate': True,
+        },
+        'peak-selection': {
+            'select': True,
+            'brillouin_regions': [(4.0e9, 6.0e9), (9.0e9, 11.0e9)],
+            'rayleigh_regions': [(-2.0e9, 2.0e9), (13.0e9, 17.0e9)],
+        },
+        'evaluation': {
+            'evaluate': True,
+            'nr_brillouin_peaks': 1,
+            'bounds_w0': None,
+            'bounds_fwhm': None,
+            'engine': FIT_ENGINES[0],
+        },
+        'export': {
+            'export': False,
+        },
+    }
+
+
+def apply_global_config(config):
+    """
+    Applies the setup and orientation, which are shared
+    by all repetitions, to the session.
+
+    Parameters
+    ----------
+    config: dict
+        The evaluation configuration, see `get_default_config`
+    """
+    session = Session.get_instance()
+    cfg_setup = config['setup']
+    if cfg_setup['set']:
+        session.set_setup(cfg_setup['setup'])
+
+    cfg_orientation = config['orientation']
+    if cfg_orientation['set']:
+        session.set_rotation(cfg_orientation['rotation'])
+        session.set_reflection(
+            vertically=cfg_orientation['reflection']['vertically'],
+            horizontally=cfg_orientation['reflection']['horizontally']
+        )
+
+
+def evaluate_current_repetition(config):
+    """
+    Runs the configured evaluation steps for the current
+    repetition of the session.
+
+    Parameters
+    ----------
+    config: dict
+        The evaluation configuration, see `get_default_config`
+    """
+    session = Session.get_instance()
+    apply_global_config(config)
+
+    if config['extraction']['extract']:
+        ExtractionController().find_points_all()
+
+    cfg_calibration = config['calibration']
+    if cfg_calibration['find-peaks'] or cfg_calibration['calibrate']:
+        cc = CalibrationController()
+        for calib_key in session.get_calib_keys(sort_by_time=True):
+            if cfg_calibration['find-peaks']:
+                cc.find_peaks(calib_key)
+            if cfg_calibration['calibrate']:
+                cc.calibrate(calib_key)
+
+    cfg_peak_selection = config['peak-selection']
+    if cfg_peak_selection['select']:
+        psc = PeakSelectionController()
+        for region in cfg_peak_selection['brillouin_regions']:
+            psc.add_brillouin_region_frequency(region)
+        for region in cfg_peak_selection['rayleigh_regions']:
+            psc.add_rayleigh_region_frequency(region)
+
+    cfg_evaluation = config['evaluation']
+    if cfg_evaluation['evaluate']:
+        evc = EvaluationController()
+        evc.set_nr_brillouin_peaks(cfg_evaluation['nr_brillouin_peaks'])
+        evc.set_bounds(cfg_evaluation['bounds_w0'])
+        evc.set_bounds_fwhm(cfg_evaluation['bounds_fwhm'])
+        # The repetitions already run in parallel,
+        # so every repetition is fitted in a single process
+        ChunkedEvaluationController().evaluate(
+            engine=cfg_evaluation.get('engine', FIT_ENGINES[0]))
+
+
+def get_model_state(model):
+    """
+    Returns the state of a model that is sent between processes.
+
+    Like when the session is saved, callable attributes, e.g. the
+    interpolators of the calibration model, are left out, since
+    they cannot be pickled. `restore_model` recreates them.
+    """
+    return type(model), {name: value for name, value in vars(model).items()
+                         if not callable(value)}
+
+
+def restore_model(state):
+    """ Recreates a model from the state returned by `get_model_state` """
+    cls, attributes = state
+    model = cls.__new__(cls)
+    model.__dict__.update(attributes)
+    model.post_deserialize()
+    return model
+
+
+def evaluate_repetition(file_name, rep_key, config):
+    """
+    Evaluates a single repetition of a file in a session of its own.
+
+    This is the job run in the worker processes.
+
+    Parameters
+    ----------
+    file_name: str or pathlib.Path
+        The file to evaluate
+    rep_key: str
+        The repetition to evaluate
+    config: dict
+        The evaluation configuration, see `get_default_config`
+
+    Returns
+    -------
+    models: dict
+        The state of the models of the repetition for every
+        session attribute in `REPETITION_MODELS`
+    """
+    session = Session.get_instance()
+    try:
+        session.set_file(file_name)
+        session.set_current_repetition(rep_key)
+        evaluate_current_repetition(config)
+        return {name: get_model_state(getattr(session, name)[rep_key])
+                for name in REPETITION_MODELS}
+    finally:
+        session.clear()
+
+
+def merge_repetition(rep_key, models):
+    """
+    Replaces the models of a repetition of the session
+    with the ones returned by `evaluate_repetition`.
+    """
+    session = Session.get_instance()
+    for name, state in models.items():
+        getattr(session, name)[rep_key] = restore_model(state)
+
+
+def start_repetitions(file_name, rep_keys, config, nr_workers):
+    """
+    Starts evaluating the given repetitions of a file
+    in the worker processes of the `bmicro.workers.WorkerPool`.
+
+    Parameters
+    ----------
+    file_name: str or pathlib.Path
+        The file to evaluate
+    rep_keys: list
+        The repetitions to evaluate
+    config: dict
+        The evaluation configuration, see `get_default_config`
+    nr_workers: int
+        The number of worker processes
+
+    Returns
+    -------
+    futures: dict
+        The key of the repetition every future evaluates. The result
+        of a future are the models of its repetition. Cancel the
+        futures not needed anymore with `cancel_repetitions`.
+    """
+    # The jobs must not depend on later changes of the configuration
+    config = copy.deepcopy(config)
+    pool = WorkerPool.get_instance()
+    pool.start(nr_workers)
+    return {
+        pool.submit(evaluate_repetition, str(file_name), rep_key,
+                    config): rep_key
+        for rep_key in rep_keys
+    }
+
+
+def cancel_repetitions(futures):
+    """ Cancels the repetitions that have not been started yet """
+    for future in futures:
+        future.cancel()
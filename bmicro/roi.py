@@ -0,0 +1,127 @@
+"""
+Regions of interest restricting the evaluation to parts of a map.
+
+A region of interest is a boolean mask with the shape of the payload
+resolution. Only the measurement points inside the mask are evaluated.
+"""
+import warnings
+
+import numpy as np
+from matplotlib.path import Path
+
+
+def rectangle_mask(x, y, extent):
+    """
+    Returns which measurement points lie inside a rectangle.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        The horizontal positions of the measurement points
+    y: np.ndarray
+        The vertical positions of the measurement points,
+        ignored if None
+    extent: tuple
+        The rectangle as (x_min, x_max, y_min, y_max)
+    """
+    x_min, x_max, y_min, y_max = extent
+    mask = (x >= min(x_min, x_max)) & (x <= max(x_min, x_max))
+    if y is not None:
+        mask &= (y >= min(y_min, y_max)) & (y <= max(y_min, y_max))
+    return mask
+
+
+def polygon_mask(x, y, vertices):
+    """
+    Returns which measurement points lie inside a polygon.
+
+    Parameters
+    ----------
+    x: np.ndarray
+        The horizontal positions of the measurement points
+    y: np.ndarray
+        The vertical positions of the measurement points
+    vertices: list
+        The (x, y) vertices of the polygon
+    """
+    points = np.column_stack((np.ravel(x), np.ravel(y)))
+    return Path(vertices).contains_points(points).reshape(np.shape(x))
+
+
+def intensity_mask(intensity, threshold):
+    """
+    Returns which measurement points are at least as bright as
+    the threshold, e.g. to skip points in the empty medium.
+
+    Parameters
+    ----------
+    intensity: np.ndarray
+        The mean raw intensity of the measurement points
+    threshold: float
+        The minimum intensity
+    """
+    with np.errstate(invalid='ignore'):
+        return np.nan_to_num(intensity, nan=-np.inf) >= threshold
+
+
+def get_evaluated_intensity(evm, resolution):
+    """
+    Returns the mean raw intensity of every measurement point
+    the evaluation already stored, NaN for all other points.
+
+    Parameters
+    ----------
+    evm: bmlab.models.evaluation_model.EvaluationModel
+        The evaluation model of the repetition
+    resolution: tuple
+        The payload resolution
+
+    Returns
+    -------
+    intensity: np.ndarray
+        The intensities with the shape of the payload resolution
+    """
+    results = None if evm is None else evm.results.get('intensity')
+    if results is None or results.shape[:3] != tuple(resolution):
+        return np.nan * np.ones(resolution)
+    with warnings.catch_warnings():
+        warnings.filterwarnings(
+            action='ignore',
+            message='Mean of empty slice'
+        )
+        # The mean intensity of every image of a point
+        return np.nanmean(np.reshape(results, (*resolution, -1)), axis=-1)
+
+
+def get_intensity_map(session, intensity=None):
+    """
+    Returns the mean raw intensity of every measurement point
+    of the current repetition.
+
+    Parameters
+    ----------
+    session: bmlab.session.Session
+        The session to read the images from
+    intensity: np.ndarray
+        The intensities known already, e.g. as returned by
+        `get_evaluated_intensity`. Only the images of the
+        points which are NaN in it are read.
+
+    Returns
+    -------
+    intensity: np.ndarray
+        The intensities with the shape of the payload resolution
+    """
+    resolution = session.get_payload_resolution()
+    intensity = np.nan * np.ones(resolution) if intensity is None\
+        else np.array(intensity, dtype=float)
+    for image_key in session.get_image_keys():
+        # The image keys enumerate the points in Fortran order
+        ind = np.unravel_index(int(image_key), resolution, order='F')
+        if not np.isnan(intensity[ind]):
+            continue
+        image = session.get_payload_image(image_key)
+        if image is None or image.size == 0:
+            continue
+        intensity[ind] = np.nanmean(image)
+    return intensity
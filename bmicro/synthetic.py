@@ -0,0 +1,363 @@
+"""
+Generator for synthetic Brillouin microscopy data sets.
+
+The files written here are valid BMicro/bmlab source files with a
+known ground truth, so that the evaluation pipeline can be tested
+and benchmarked at realistic scale without real measurement data.
+Create a file from the console via
+
+    python -m bmicro.synthetic synthetic.h5 --resolution 32 32 1
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import pathlib
+import sys
+
+import h5py
+import numpy as np
+
+from bmlab.fits import fit_vipa, VIPA, lorentz
+from bmlab.geometry import Circle, discretize_arc
+from bmlab.models.setup import AVAILABLE_SETUPS
+
+# Group in which the ground truth is stored alongside the measurement
+GROUND_TRUTH_GROUP = 'GroundTruth'
+
+# Number of points bmlab discretizes the extraction arc with
+ARC_POINTS = 500
+
+
+def default_brillouin_shift(x, y, z):
+    """
+    A water-like background with a stiffer, round inclusion
+    in the center of the map.
+
+    Parameters
+    ----------
+    x, y, z: np.ndarray
+        The positions of the measurement points [µm]
+
+    Returns
+    -------
+    brillouin_shift: np.ndarray
+        The Brillouin shift [Hz] at the given positions
+    """
+    def normalized(pos):
+        extent = np.ptp(pos)
+        if extent == 0:
+            return np.zeros_like(pos)
+        return (pos - np.min(pos)) / extent - 0.5
+
+    r2 = normalized(x) ** 2 + normalized(y) ** 2 + normalized(z) ** 2
+    return 5.0e9 + 0.6e9 * np.exp(-r2 / (2 * 0.15 ** 2))
+
+
+class SpectrumRenderer(object):
+    """
+    Renders camera images of a VIPA spectrometer for given
+    spectra.
+
+    The spectrum lies on a circular arc along the anti-diagonal
+    of the (oriented) camera image, which is where bmlab
+    expects it.
+    """
+
+    def __init__(self, setup, image_shape, arc_sigma=1.0):
+        """
+
+        Parameters
+        ----------
+        setup: bmlab.models.setup.Setup
+            The setup whose frequency axis to model
+        image_shape: tuple
+            The size of the camera images
+        arc_sigma: float
+            The width of the spectrum perpendicular to the arc [pix]
+        """
+        self.setup = setup
+        self.image_shape = tuple(image_shape)
+        height, width = self.image_shape
+
+        center = np.array([2 * height, 2 * width], dtype=float)
+        radius = np.hypot(center[0], center[1] - width)
+        phis = discretize_arc(Circle(center, radius), self.image_shape,
+                              ARC_POINTS)
+
+        # Place the calibration peaks evenly along the arc
+        # and derive the frequency axis from them
+        calibration = setup.calibration.shifts\
+            + setup.calibration.orders * setup.vipa.FSR
+        margin = 0.12 * ARC_POINTS
+        peaks = margin\
+            + (ARC_POINTS - 2 * margin) * calibration / setup.vipa.FSR
+        # fit_vipa reports the optimizer status on stdout
+        with contextlib.redirect_stdout(io.StringIO()):
+            self.vipa_params = fit_vipa(peaks, setup)
+        xdata = np.arange(ARC_POINTS)
+        self.frequencies = VIPA(xdata, self.vipa_params) - setup.f0
+
+        rows, columns = np.mgrid[0:height, 0:width]
+        profile = np.exp(-0.5 * ((
+            np.hypot(rows - center[0], columns - center[1]) - radius
+        ) / arc_sigma) ** 2)
+        # We only need to evaluate the pixels close to the arc
+        self.mask = profile > 1e-4
+        self.profile = profile[self.mask]
+        phi = np.arctan2(columns[self.mask] - center[1],
+                         rows[self.mask] - center[0]) % (2 * np.pi)
+        self.pixel_frequencies = np.interp(
+            (phi - phis[0]) / (phis[-1] - phis[0]) * (ARC_POINTS - 1),
+            xdata, self.frequencies, left=np.nan, right=np.nan)
+
+    def render(self, peaks, nr_frames=1, background=100, noise=0,
+               rng=None):
+        """
+        Renders the camera images of a spectrum.
+
+        Parameters
+        ----------
+        peaks: list
+            (w0 [Hz], fwhm [Hz], intensity) of every Lorentzian peak
+        nr_frames: int
+            How many images to render
+        background: float
+            The camera background
+        noise: float
+            Standard deviation of the additive Gaussian noise
+        rng: np.random.Generator
+            The random generator to create the noise with
+
+        Returns
+        -------
+        imgs: np.ndarray
+            The images in the raw camera orientation
+        """
+        spectrum = np.zeros(self.pixel_frequencies.shape)
+        for w0, fwhm, intensity in peaks:
+            spectrum += lorentz(self.pixel_frequencies, w0, fwhm, intensity)
+
+        img = np.full(self.image_shape, float(background))
+        img[self.mask] += np.nan_to_num(spectrum) * self.profile
+
+        imgs = np.repeat(img[np.newaxis, ...], nr_frames, axis=0)
+        if noise:
+            if rng is None:
+                rng = np.random.default_rng()
+            imgs += rng.normal(0, noise, imgs.shape)
+        # BMicro reflects the raw images horizontally by default
+        imgs = np.flip(imgs, axis=2)
+        return np.clip(np.round(imgs), 0, np.iinfo(np.uint16).max)\
+            .astype(np.uint16)
+
+
+def _string_attribute(value):
+    # BrillouinAcquisition stores strings as arrays of ASCII bytes
+    return np.array([value.encode('ascii')])
+
+
+def write_dataset(path, resolution=(10, 10, 1), nr_repetitions=1,
+                  nr_calibrations=2, nr_frames=2,
+                  nr_calibration_frames=None, image_shape=(200, 200),
+                  step=1.0, noise=2.0, brillouin_shift=None,
+                  brillouin_fwhm=0.8e9, setup=None, seed=0):
+    """
+    Writes a synthetic Brillouin microscopy source file.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        The file to write
+    resolution: tuple
+        Number of measurement points in x, y and z direction
+    nr_repetitions: int
+        Number of repetitions of the measurement
+    nr_calibrations: int
+        Number of calibrations per repetition,
+        evenly spread over the measurement time
+    nr_frames: int
+        Number of images per measurement point
+    nr_calibration_frames: int
+        Number of images per calibration,
+        same as `nr_frames` if not given
+    image_shape: tuple
+        Size of the camera images
+    step: float
+        Distance between two measurement points [µm]
+    noise: float
+        Standard deviation of the camera noise
+    brillouin_shift: float, np.ndarray or callable
+        The Brillouin shift [Hz]. Either a constant, an array
+        of shape `resolution` or a function of the x, y and z
+        positions. Uses `default_brillouin_shift` if not given.
+    brillouin_fwhm: float
+        The width of the Brillouin peaks [Hz]
+    setup: bmlab.models.setup.Setup
+        The setup the data is acquired with,
+        the first available setup if not given
+    seed: int
+        Seed for the random generator
+
+    Returns
+    -------
+    ground_truth: dict
+        The Brillouin shift and FWHM [Hz] of every repetition,
+        arrays of shape `resolution`
+    """
+    if setup is None:
+        setup = AVAILABLE_SETUPS[0]
+    if nr_calibration_frames is None:
+        nr_calibration_frames = nr_frames
+    if brillouin_shift is None:
+        brillouin_shift = default_brillouin_shift
+
+    rng = np.random.default_rng(seed)
+    renderer = SpectrumRenderer(setup, image_shape)
+    fsr = setup.vipa.FSR
+    calibration = setup.calibration.shifts\
+        + setup.calibration.orders * fsr
+
+    resolution = tuple(int(r) for r in resolution)
+    positions = np.meshgrid(*[step * np.arange(r, dtype=float)
+                              for r in resolution], indexing='ij')
+    if callable(brillouin_shift):
+        shift = brillouin_shift(*positions)
+    else:
+        shift = brillouin_shift
+    shift = np.broadcast_to(np.asarray(shift, dtype=float), resolution)
+    nr_points = int(np.prod(resolution))
+
+    date = datetime.datetime(2024, 1, 1)
+    # Time [s] between two measurement points
+    interval = 1.0
+    ground_truth = {}
+    with h5py.File(path, 'w') as h5:
+        h5.attrs['version'] = _string_attribute('H5BM-v0.0.4')
+        h5.attrs['date'] = _string_attribute(date.isoformat())
+        h5.attrs['comment'] = _string_attribute('Synthetic data set')
+
+        for rep in range(nr_repetitions):
+            rep_key = str(rep)
+            rep_start = date + datetime.timedelta(
+                seconds=rep * (nr_points + 2) * interval)
+            repetition = h5.create_group(f'Brillouin/{rep_key}')
+            repetition.attrs['date'] =\
+                _string_attribute(rep_start.isoformat())
+
+            payload = repetition.create_group('payload')
+            for axis, res, pos in zip('xyz', resolution, positions):
+                payload.attrs[f'resolution-{axis}'] = np.array([res])
+                # Positions are stored in z-x-y order
+                payload[f'positions-{axis}'] = np.transpose(pos, (2, 0, 1))
+
+            for key in range(nr_points):
+                # The image keys run along x first, then y, then z
+                ind = np.unravel_index(key, resolution, order='F')
+                imgs = renderer.render([
+                    (0, 0.5e9, 800),
+                    (fsr, 0.5e9, 800),
+                    (shift[ind], brillouin_fwhm, 200),
+                    (fsr - shift[ind], brillouin_fwhm, 200),
+                ], nr_frames=nr_frames, noise=noise, rng=rng)
+                dataset = payload.create_dataset(f'data/{key}', data=imgs)
+                dataset.attrs['date'] = _string_attribute((
+                    rep_start + datetime.timedelta(
+                        seconds=(key + 1) * interval)).isoformat())
+                dataset.attrs['exposure'] = np.array([0.5])
+                dataset.attrs['binning'] = _string_attribute('1x1')
+
+            times = np.linspace(0, (nr_points + 1) * interval,
+                                max(nr_calibrations, 2))[:nr_calibrations]
+            for key, time in enumerate(times):
+                imgs = renderer.render(
+                    [(w0, 0.5e9, 500) for w0 in calibration],
+                    nr_frames=nr_calibration_frames, noise=noise, rng=rng)
+                dataset = repetition.create_dataset(
+                    f'calibration/data/{key}', data=imgs)
+                dataset.attrs['date'] = _string_attribute((
+                    rep_start + datetime.timedelta(seconds=time)
+                ).isoformat())
+                dataset.attrs['exposure'] = np.array([0.5])
+                dataset.attrs['binning'] = _string_attribute('1x1')
+
+            ground_truth[rep_key] = {
+                'brillouin_shift_f': np.array(shift),
+                'brillouin_peak_fwhm_f':
+                    np.full(resolution, float(brillouin_fwhm)),
+            }
+            group = h5.create_group(f'{GROUND_TRUTH_GROUP}/{rep_key}')
+            for parameter, value in ground_truth[rep_key].items():
+                group[parameter] = value
+
+    return ground_truth
+
+
+def read_ground_truth(path):
+    """
+    Reads the ground truth from a synthetic data set.
+
+    Parameters
+    ----------
+    path: str or pathlib.Path
+        The synthetic source file
+
+    Returns
+    -------
+    ground_truth: dict
+        The known parameters [Hz] of every repetition,
+        empty if the file has no ground truth
+    """
+    ground_truth = {}
+    with h5py.File(path, 'r') as h5:
+        group = h5.get(GROUND_TRUTH_GROUP)
+        if group is None:
+            return ground_truth
+        for rep_key, parameters in group.items():
+            ground_truth[rep_key] = {
+                parameter: np.array(value)
+                for parameter, value in parameters.items()
+            }
+    return ground_truth
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m bmicro.synthetic',
+        description='Write a synthetic Brillouin microscopy data set.')
+    parser.add_argument('path', type=pathlib.Path,
+                        help='the file to write')
+    parser.add_argument('--resolution', type=int, nargs=3,
+                        default=[10, 10, 1], metavar=('X', 'Y', 'Z'),
+                        help='number of measurement points')
+    parser.add_argument('--repetitions', type=int, default=1,
+                        help='number of repetitions')
+    parser.add_argument('--calibrations', type=int, default=2,
+                        help='number of calibrations per repetition')
+    parser.add_argument('--frames', type=int, default=2,
+                        help='number of images per measurement point')
+    parser.add_argument('--calibration-frames', type=int,
+                        help='number of images per calibration')
+    parser.add_argument('--camera', type=int, nargs=2, default=[200, 200],
+                        metavar=('HEIGHT', 'WIDTH'),
+                        help='size of the camera images')
+    parser.add_argument('--noise', type=float, default=2.0,
+                        help='standard deviation of the camera noise')
+    parser.add_argument('--seed', type=int, default=0,
+                        help='seed for the random generator')
+    args = parser.parse_args(argv)
+
+    write_dataset(args.path,
+                  resolution=args.resolution,
+                  nr_repetitions=args.repetitions,
+                  nr_calibrations=args.calibrations,
+                  nr_frames=args.frames,
+                  nr_calibration_frames=args.calibration_frames,
+                  image_shape=args.camera,
+                  noise=args.noise,
+                  seed=args.seed)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,239 @@
+"""
+Shared-memory transport of NumPy arrays between processes.
+
+Sending the spectra to the worker processes and the fit results back
+pickles and copies them several times. Instead, the arrays are placed
+in shared memory and only small descriptors, i.e. the name of the
+memory block, the data type and the shape, are sent. Both processes
+then access the arrays through NumPy views of the same memory.
+
+If no shared memory can be created, e.g. because it is exhausted,
+the arrays are sent as they are, so the receiving side has to
+handle both. `attach` does this transparently.
+
+Arrays that are already mapped from a file, see `bmicro.out_of_core`,
+are not copied. The other process maps the same file instead.
+"""
+import collections
+import contextlib
+import logging
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from bmicro import out_of_core
+
+logger = logging.getLogger(__name__)
+
+# Descriptor of a single array in shared memory
+SharedArray = collections.namedtuple('SharedArray',
+                                     ['name', 'dtype', 'shape'])
+
+# Descriptor of lists of one-dimensional arrays, e.g. the spectra
+# of several measurement points, packed into a single memory block
+PackedArrays = collections.namedtuple('PackedArrays',
+                                      ['name', 'dtype', 'lengths'])
+
+# Descriptor of an array mapped from a file
+MappedArray = collections.namedtuple('MappedArray',
+                                     ['name', 'dtype', 'shape'])
+
+# The shared arrays this process attached to permanently
+_attached = {}
+
+
+class SharedMemory(shared_memory.SharedMemory):
+    """
+    Shared memory block that can be closed while NumPy arrays
+    still use it.
+    """
+
+    def close(self):
+        # NumPy arrays of the memory block reference its memory map
+        # without locking it. Instead of closing the map, we only drop
+        # our reference, so it is unmapped when the arrays are gone.
+        self._mmap = None
+        super().close()
+
+
+def _get_arrays(shm, descriptor):
+    """ Returns NumPy views of the arrays in a memory block """
+    if isinstance(descriptor, MappedArray):
+        return np.memmap(descriptor.name, descriptor.dtype, mode='r+',
+                         shape=descriptor.shape)
+    if isinstance(descriptor, SharedArray):
+        return np.ndarray(descriptor.shape, descriptor.dtype,
+                          buffer=shm.buf)
+    sizes = [length for lengths in descriptor.lengths
+             for length in lengths]
+    data = np.ndarray((sum(sizes),), descriptor.dtype, buffer=shm.buf)
+    arrays = iter(np.split(data, np.cumsum(sizes)[:-1]) if sizes else [])
+    return [[next(arrays) for _ in lengths]
+            for lengths in descriptor.lengths]
+
+
+def is_shared(value):
+    """ Whether the given value is a descriptor of shared arrays """
+    return isinstance(value, (SharedArray, PackedArrays, MappedArray))
+
+
+@contextlib.contextmanager
+def attach(value):
+    """
+    Context manager giving access to the arrays described by
+    a descriptor, which are detached again afterwards.
+
+    Parameters
+    ----------
+    value: SharedArray, PackedArrays or MappedArray
+        The descriptor of the arrays. Any other value
+        is returned as is.
+
+    Yields
+    ------
+    arrays: np.ndarray or list
+        The array of a `SharedArray` or `MappedArray`,
+        or the lists of arrays of `PackedArrays`
+    """
+    if not is_shared(value):
+        yield value
+        return
+    if isinstance(value, MappedArray):
+        yield _get_arrays(None, value)
+        return
+    shm = SharedMemory(name=value.name)
+    try:
+        yield _get_arrays(shm, value)
+    finally:
+        shm.close()
+
+
+def get_array(descriptor):
+    """
+    Returns the array described by a `SharedArray` or `MappedArray`.
+    The array stays attached for the lifetime of this process, so this
+    is meant for arrays used repeatedly, like the fit results.
+    """
+    if descriptor.name not in _attached:
+        shm = None
+        if isinstance(descriptor, SharedArray):
+            shm = SharedMemory(name=descriptor.name)
+        _attached[descriptor.name] = (shm, _get_arrays(shm, descriptor))
+    return _attached[descriptor.name][1]
+
+
+def detach_unused(descriptors):
+    """
+    Detaches the arrays attached with `get_array`, except the given ones.
+    Processes that are reused for several tasks use this to free the
+    memory of arrays they don't need anymore.
+    """
+    names = {descriptor.name for descriptor in descriptors}
+    for name in list(_attached):
+        if name not in names:
+            shm, _ = _attached.pop(name)
+            if shm is not None:
+                shm.close()
+
+
+class SharedArrays:
+    """
+    Creates arrays in shared memory and frees the memory
+    when they are released or the context is left.
+    """
+
+    def __init__(self):
+        self._blocks = {}
+        self.available = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        for name in list(self._blocks):
+            self._release(name)
+
+    def _create(self, nbytes):
+        if not self.available:
+            return None
+        try:
+            shm = SharedMemory(create=True, size=max(nbytes, 1))
+        except OSError as e:
+            logger.warning('Unable to create shared memory, sending the'
+                           ' arrays to the worker processes instead: %s', e)
+            self.available = False
+            return None
+        self._blocks[shm.name] = shm
+        return shm
+
+    def _release(self, name):
+        shm = self._blocks.pop(name, None)
+        if shm is not None:
+            shm.close()
+            shm.unlink()
+
+    def create(self, array):
+        """
+        Copies an array to shared memory.
+
+        Parameters
+        ----------
+        array: np.ndarray
+            The array to copy
+
+        Returns
+        -------
+        shared: np.ndarray
+            The array in shared memory, or the given array if it is
+            mapped from a file or no shared memory is available
+        descriptor: SharedArray or MappedArray
+            The descriptor to attach to the array in
+            another process, None if it is not shared
+        """
+        if out_of_core.is_mapped(array):
+            return array, MappedArray(array.filename, array.dtype.str,
+                                      array.shape)
+        array = np.asarray(array)
+        shm = self._create(array.nbytes)
+        if shm is None:
+            return array, None
+        descriptor = SharedArray(shm.name, array.dtype.str, array.shape)
+        shared = _get_arrays(shm, descriptor)
+        shared[...] = array
+        return shared, descriptor
+
+    def pack(self, arrays):
+        """
+        Copies lists of one-dimensional arrays
+        into a single block of shared memory.
+
+        Parameters
+        ----------
+        arrays: list
+            Lists of one-dimensional arrays, e.g. the spectra
+            of all images of several measurement points
+
+        Returns
+        -------
+        packed: PackedArrays or list
+            The descriptor of the packed arrays, or the given
+            arrays if no shared memory is available
+        """
+        flat = [np.asarray(array) for values in arrays for array in values]
+        dtype = np.result_type(*flat) if flat else np.dtype(float)
+        shm = self._create(sum(array.size for array in flat) * dtype.itemsize)
+        if shm is None:
+            return arrays
+        descriptor = PackedArrays(
+            shm.name, dtype.str,
+            [[len(array) for array in values] for values in arrays])
+        if flat:
+            data = np.ndarray((sum(array.size for array in flat),), dtype,
+                              buffer=shm.buf)
+            np.concatenate(flat, out=data)
+        return descriptor
+
+    def release(self, descriptor):
+        """ Frees the shared memory of the described arrays """
+        if is_shared(descriptor):
+            self._release(descriptor.name)
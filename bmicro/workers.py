@@ -0,0 +1,219 @@
+"""
+Long-lived pool of worker processes.
+
+Starting a worker process with `spawn` imports NumPy, SciPy, h5py and
+bmlab again, which takes a few seconds every time an evaluation starts.
+Instead, the `WorkerPool` keeps its worker processes alive and is reused
+by every task running in worker processes. BMicro starts it in the
+background when the main window is shown, so the workers are warm when
+the first evaluation starts.
+
+Workers that crashed break the pool. The pool is restarted then, unless
+it crashed too often within a short time, which usually means that the
+tasks themselves crash the workers. `check_health` additionally restarts
+a pool that does not respond anymore.
+"""
+import collections
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+import logging
+import multiprocessing as mp
+import os
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# How long to wait for the workers to respond to a health check [s],
+# which includes starting them
+HEALTH_CHECK_TIMEOUT = 60
+
+# The pool is restarted at most this often within `RESTART_WINDOW` [s]
+MAX_RESTARTS = 3
+RESTART_WINDOW = 60
+
+
+def _warm_up():
+    """ Imports what the tasks need, so the first task runs fast """
+    from bmicro import evaluation, repetitions  # noqa: F401
+
+
+def _ping():
+    """ Answers a health check """
+    return os.getpid()
+
+
+def _terminate(executor):
+    """ Shuts down a pool without waiting for the running tasks """
+    if sys.version_info >= (3, 14):
+        executor.terminate_workers()
+        return
+    # Shutting down forgets the processes
+    processes = _get_processes(executor)
+    executor.shutdown(wait=False, cancel_futures=True)
+    # Workers hanging in a task would never exit otherwise
+    for process in processes:
+        if process.is_alive():
+            process.terminate()
+
+
+def _get_processes(executor):
+    """
+    Returns the worker processes of a pool before Python 3.14.
+
+    These versions offer no public way to terminate the workers, so we
+    use the private `_processes` of the pool. If it is missing, the
+    workers hanging in a task are left running, which we log.
+    """
+    processes = getattr(executor, '_processes', None)
+    if processes is None:
+        logger.warning('Cannot terminate the worker processes, '
+                       'they stop when their tasks are done')
+        return []
+    return list(processes.values())
+
+
+class WorkerPool(object):
+    """
+    Pool of worker processes, which is reused by all tasks
+    and restarted when the workers crash.
+    """
+
+    _instance = None
+
+    def __init__(self, max_restarts=MAX_RESTARTS,
+                 restart_window=RESTART_WINDOW):
+        """
+        Parameters
+        ----------
+        max_restarts: int
+            How often the pool may be restarted within `restart_window`
+        restart_window: float
+            The time span [s] the restarts are counted in
+        """
+        self.max_restarts = max_restarts
+        self.restart_window = restart_window
+        self.executor = None
+        self.nr_workers = 0
+        self.restarts = collections.deque()
+        # The pool is used from the GUI and the evaluation thread
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def get_instance():
+        if WorkerPool._instance is None:
+            WorkerPool._instance = WorkerPool()
+        return WorkerPool._instance
+
+    def start(self, nr_workers):
+        """
+        Starts the worker processes in the background,
+        unless the pool already runs with this number of workers.
+
+        Parameters
+        ----------
+        nr_workers: int
+            The number of worker processes
+
+        Returns
+        -------
+        executor: concurrent.futures.ProcessPoolExecutor
+            The pool
+        """
+        nr_workers = max(1, nr_workers)
+        with self._lock:
+            if self.executor is not None and\
+                    self.nr_workers == nr_workers:
+                return self.executor
+            if self.executor is not None:
+                _terminate(self.executor)
+            logger.debug(f'Starting {nr_workers} worker processes')
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=nr_workers,
+                mp_context=mp.get_context('spawn'),
+                initializer=_warm_up
+            )
+            self.nr_workers = nr_workers
+            # The first task starts all worker processes
+            self.executor.submit(_ping)
+            return self.executor
+
+    def restart(self):
+        """
+        Replaces the worker processes.
+
+        Raises
+        ------
+        RuntimeError
+            If the pool was restarted too often recently
+        """
+        with self._lock:
+            now = time.monotonic()
+            while self.restarts and\
+                    now - self.restarts[0] > self.restart_window:
+                self.restarts.popleft()
+            if len(self.restarts) >= self.max_restarts:
+                self.shutdown()
+                raise RuntimeError(
+                    f'The worker processes crashed {len(self.restarts)} '
+                    f'times within {self.restart_window} s.')
+            self.restarts.append(now)
+            logger.warning('Restarting the worker processes')
+            nr_workers = self.nr_workers
+            self.shutdown()
+            return self.start(nr_workers)
+
+    def submit(self, fn, *args, **kwargs):
+        """
+        Runs a task in a worker process, restarting
+        the pool if its workers crashed before.
+
+        Returns
+        -------
+        future: concurrent.futures.Future
+            The future of the task
+        """
+        with self._lock:
+            if self.executor is None:
+                self.start(os.cpu_count() or 1)
+            try:
+                return self.executor.submit(fn, *args, **kwargs)
+            except BrokenProcessPool:
+                return self.restart().submit(fn, *args, **kwargs)
+
+    def check_health(self, timeout=HEALTH_CHECK_TIMEOUT):
+        """
+        Checks that the workers respond and restarts
+        the pool if they don't.
+
+        Parameters
+        ----------
+        timeout: float
+            How long to wait for the workers [s]
+
+        Returns
+        -------
+        healthy: bool
+            Whether the workers responded, False if
+            the pool had to be restarted
+        """
+        with self._lock:
+            executor = self.executor
+        if executor is None:
+            return False
+        try:
+            executor.submit(_ping).result(timeout=timeout)
+            return True
+        except (BrokenProcessPool, concurrent.futures.TimeoutError):
+            logger.warning('The worker processes do not respond')
+        self.restart()
+        return False
+
+    def shutdown(self):
+        """ Stops the worker processes """
+        with self._lock:
+            if self.executor is not None:
+                _terminate(self.executor)
+            self.executor = None
+            self.nr_workers = 0
@@ -3,6 +3,7 @@ from os.path import exists
 import warnings
 
 from bmicro._version import version
+from bmicro.gui import ui
 
 NAME = "BMicro"
 
@@ -11,6 +12,10 @@ if not exists("../bmicro/__main__.py"):
     warnings.warn("Cannot find ../bmicro/__main__.py'! " +
                   "Please run pyinstaller from the 'build-recipes' directory.")
 
+# The app uses the modules compiled from the .ui files,
+# an editable install does not compile them
+ui.compile_all("../bmicro/gui")
+
 block_cipher = None
 
 a = Analysis(['../bmicro/__main__.py'],
@@ -1,8 +1,11 @@
 #!/usr/bin/env python
 # -*- coding: utf-8 -*-
-from os.path import exists, dirname, realpath
+import importlib.util
+from os.path import exists, dirname, join, realpath
 from setuptools import setup, find_packages
+from setuptools.command.build_py import build_py
 import sys
+import warnings
 
 author = u"BMicro developers"
 # authors in alphabetical order
@@ -24,6 +27,24 @@ except BaseException:
     version = "unknown"
 
 
+class BuildPyCompileUi(build_py):
+    """ Compiles the .ui files, so they don't need to be parsed at runtime """
+    def run(self):
+        super().run()
+        # Loaded from its file, since the package is not installed yet
+        spec = importlib.util.spec_from_file_location(
+            'ui', join(dirname(realpath(__file__)), name, 'gui', 'ui.py'))
+        try:
+            ui = importlib.util.module_from_spec(spec)
+            spec.loader.exec_module(ui)
+        except ImportError:
+            warnings.warn('PyQt6 is not available, the .ui files are '
+                          'parsed at runtime.')
+            return
+        for py_file in ui.compile_all(join(self.build_lib, name, 'gui')):
+            print(f'compiled {py_file}')
+
+
 setup(
     name=name,
     author=author,
@@ -56,4 +77,5 @@ setup(
                  'Intended Audience :: Science/Research',
                  ],
     platforms=['ALL'],
+    cmdclass={'build_py': BuildPyCompileUi},
 )
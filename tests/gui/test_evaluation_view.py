@@ -1,6 +1,8 @@
 import pathlib
 
+import numpy as np
 import pytest
+from PyQt6 import QtCore, QtWidgets
 
 from bmlab.session import Session
 
@@ -12,8 +14,24 @@ def data_file_path(file_name):
 
 
 @pytest.fixture
-def window(mocker):
+def settings_path(tmp_path):
+    # The tests must not change the settings of the user
+    default_format = QtCore.QSettings.defaultFormat()
+    QtCore.QSettings.setDefaultFormat(QtCore.QSettings.Format.IniFormat)
+    QtCore.QSettings.setPath(QtCore.QSettings.Format.IniFormat,
+                             QtCore.QSettings.Scope.UserScope, str(tmp_path))
+    yield tmp_path
+    QtCore.QSettings.setPath(
+        QtCore.QSettings.Format.IniFormat, QtCore.QSettings.Scope.UserScope,
+        QtCore.QStandardPaths.writableLocation(
+            QtCore.QStandardPaths.StandardLocation.GenericConfigLocation))
+    QtCore.QSettings.setDefaultFormat(default_format)
+
+
+@pytest.fixture
+def window(qtbot, mocker, settings_path):
     window = BMicro()
+    qtbot.add_widget(window)
     Session.get_instance().clear()
     file_name = data_file_path('Water.h5')
 
@@ -25,3 +43,93 @@ def window(mocker):
     window.open_file()
     yield window
     window.close()
+
+
+def set_value(widget, value):
+    if isinstance(widget, QtWidgets.QSpinBox):
+        widget.setValue(value)
+    elif isinstance(widget, QtWidgets.QComboBox):
+        widget.setCurrentIndex(widget.findData(value))
+    else:
+        widget.setChecked(value)
+
+
+@pytest.mark.parametrize('name, key, values', [
+    ('nr_workers', 'evaluation/workers', [3, 1]),
+    ('progressive', 'evaluation/progressive', [True, False]),
+    ('warm_start', 'evaluation/warm-start', [True, False]),
+    ('reuse_fits', 'evaluation/reuse-fits', [False, True]),
+    ('raster_map_enabled', 'evaluation/raster-map', [False, True]),
+    ('fit_engine', 'evaluation/engine', ['batched', 'sequential']),
+])
+def test_evaluation_settings(window, settings_path, name, key, values):
+    view = window.widget_evaluation_view
+    for value in values:
+        set_value(getattr(view, name), value)
+        assert QtCore.QSettings().value(key, type=type(value)) == value
+    # The settings are written to the temporary directory
+    assert QtCore.QSettings().fileName().startswith(str(settings_path))
+
+
+def test_evaluation_settings_used(window, mocker):
+    worker = mocker.patch('bmicro.gui.evaluation.evaluation_view.Worker')
+    view = window.widget_evaluation_view
+    set_value(view.nr_workers, 3)
+    set_value(view.progressive, True)
+    set_value(view.warm_start, True)
+    set_value(view.reuse_fits, False)
+    set_value(view.out_of_core, True)
+    set_value(view.fit_engine, 'batched')
+
+    assert view.evaluate()
+    view.evaluation_timer.stop()
+    view.thread.quit()
+    view.thread.wait()
+    view.evaluation_running = False
+
+    fkw = worker.call_args.kwargs['fkw']
+    assert fkw['nr_workers'] == 3
+    assert fkw['progressive']
+    assert fkw['warm_start']
+    assert not fkw['partial']
+    assert fkw['out_of_core']
+    assert fkw['engine'] == 'batched'
+
+
+def test_region_of_interest(qtbot, window):
+    view = window.widget_evaluation_view
+    assert view.roi_mask is None
+    assert view.label_roi.text() == 'All points'
+
+    # All points of the map lie inside a large rectangle
+    view.set_roi(('rectangle', (-1e6, 1e6, -1e6, 1e6)))
+    assert view.roi_mask.all()
+
+    # No point reaches this intensity
+    view.roi_threshold.setValue(65535)
+    view.roi_threshold_enabled.setChecked(True)
+    # The intensities are read in the background
+    assert view.label_roi.text() == 'Reading intensities...'
+    qtbot.waitUntil(lambda: view.roi_mask is not None)
+    assert not view.roi_mask.any()
+    assert view.label_roi.text() == f'0 of {view.roi_mask.size} points'
+
+    view.roi_threshold_enabled.setChecked(False)
+    view.clear_roi()
+    assert view.roi_mask is None
+
+
+def test_region_of_interest_repetition(qtbot, window):
+    view = window.widget_evaluation_view
+    view.roi_threshold.setValue(0)
+    view.roi_threshold_enabled.setChecked(True)
+    qtbot.waitUntil(lambda: view.roi_mask is not None)
+    assert view.roi_mask.all()
+
+    # The intensities of another repetition with the same resolution
+    shape = view.roi_mask.shape
+    view.intensity_map = (object(), np.full(shape, -1.))
+    view.update_ui()
+    qtbot.waitUntil(lambda: view.roi_mask is not None)
+    assert view.roi_mask.all()
+    view.roi_threshold_enabled.setChecked(False)
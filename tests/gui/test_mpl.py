@@ -0,0 +1,101 @@
+import numpy as np
+from matplotlib.backend_bases import MouseEvent
+from matplotlib.widgets import SpanSelector
+from PyQt6 import QtWidgets
+
+from bmicro.gui.mpl import MplCanvas, Overlays
+
+
+def test_draw_stats(qtbot):
+    MplCanvas.reset_draw_stats()
+    parent = QtWidgets.QWidget()
+    qtbot.addWidget(parent)
+    canvas = MplCanvas(parent, name='test_canvas')
+    canvas.get_figure().add_subplot(111).plot([0, 1], [1, 0])
+
+    canvas.draw()
+    canvas.draw()
+
+    stats = MplCanvas.get_draw_stats()['test_canvas']
+    assert stats['count'] == 2
+    assert stats['total'] > 0
+    assert stats['max'] >= stats['mean'] > 0
+    assert stats['over_budget'] == 0
+
+    # Every draw exceeds a budget of zero
+    canvas.draw_budget = 0
+    canvas.draw()
+    stats = MplCanvas.get_draw_stats()['test_canvas']
+    assert stats['count'] == 3
+    assert stats['over_budget'] == 1
+
+    MplCanvas.reset_draw_stats()
+    assert MplCanvas.get_draw_stats()['test_canvas']['count'] == 0
+    canvas.draw()
+    assert MplCanvas.get_draw_stats()['test_canvas']['count'] == 1
+
+
+def test_draw_stats_default_name(qtbot):
+    parent = QtWidgets.QWidget()
+    parent.setObjectName('named_widget')
+    qtbot.addWidget(parent)
+    canvas = MplCanvas(parent)
+    canvas.draw()
+    assert canvas.name == 'named_widget'
+    assert MplCanvas.get_draw_stats()['named_widget']['count'] >= 1
+
+
+def test_overlays(qtbot):
+    parent = QtWidgets.QWidget()
+    qtbot.addWidget(parent)
+    canvas = MplCanvas(parent, name='test_overlays')
+    plot = canvas.get_figure().add_subplot(111)
+    overlays = Overlays(canvas, plot)
+    regions = overlays.add_lines('regions', colors='r')
+    peaks = overlays.add_lines('peaks', colors='black')
+    selector = SpanSelector(plot, onselect=None, direction='horizontal',
+                            useblit=True)
+    overlays.add_widget(selector)
+
+    plot.plot(np.arange(10), np.arange(10))
+    canvas.draw()
+    assert overlays.background is not None
+    count = MplCanvas.get_draw_stats()['test_overlays']['count']
+    # The selector does not draw the figure again for the overlays
+    assert count == 1
+    assert regions.get_visible()
+
+    # Changing the overlays does not draw the canvas
+    overlays.set_segments('regions', [np.array([[1, 1], [2, 2], [3, 3]])])
+    overlays.set_vlines('peaks', [2, 5], 0, 9)
+    overlays.update()
+    assert MplCanvas.get_draw_stats()['test_overlays']['count'] == count
+    assert len(regions.get_segments()) == 1
+    np.testing.assert_array_equal(peaks.get_segments()[1], [[5, 0], [5, 9]])
+    assert overlays.widgets_stale
+
+    # The selector updates its background on the next click
+    event = MouseEvent('button_press_event', canvas,
+                       *plot.transData.transform((5, 5)), button=1)
+    canvas.callbacks.process('button_press_event', event)
+    assert MplCanvas.get_draw_stats()['test_overlays']['count'] == count + 1
+    assert not overlays.widgets_stale
+    assert regions.get_visible()
+    count += 1
+
+    # The overlays do not change the limits
+    assert plot.get_xlim() == (-0.45, 9.45)
+
+    # After clearing the axes, the overlays are added again
+    plot.cla()
+    assert regions not in plot.collections
+    overlays.attach()
+    assert regions in plot.collections
+    assert overlays.background is None
+    overlays.clear()
+    assert len(regions.get_segments()) == 0
+    # Without a background, the canvas is drawn
+    overlays.update()
+    assert MplCanvas.get_draw_stats()['test_overlays']['count'] == count + 1
+    assert overlays.background is not None
+    assert not overlays.widgets_stale
@@ -0,0 +1,105 @@
+import concurrent.futures
+import time
+
+import pytest
+from PyQt6 import QtCore
+
+from bmicro.BGThread import BGThread
+from bmicro.gui.pipeline import Pipeline
+
+
+class Emitter(QtCore.QObject):
+    signal = QtCore.pyqtSignal(int)
+    other = QtCore.pyqtSignal()
+
+
+def test_pipeline(qtbot):
+    emitter = Emitter()
+    thread = BGThread(func=lambda: 42, fkw={})
+    executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+    done = []
+
+    def stages():
+        yield
+        done.append('next')
+        QtCore.QTimer.singleShot(10, lambda: emitter.signal.emit(3))
+        done.append((yield emitter.signal))
+        thread.start()
+        yield thread
+        done.append(thread.result)
+        future = yield executor.submit(lambda: 'future')
+        done.append(future.result())
+        # Continue with whatever happens first
+        other = emitter.other
+        QtCore.QTimer.singleShot(10, other.emit)
+        item, value = yield [executor.submit(time.sleep, 2), other]
+        done.append(item is other)
+
+    pipeline = Pipeline(stages())
+    with qtbot.waitSignal(pipeline.finished, timeout=5000) as blocker:
+        pipeline.start()
+        # The stages run in the event loop
+        assert done == []
+    assert blocker.args == [None]
+    assert done == ['next', 3, 42, 'future', True]
+    assert not pipeline.running
+    executor.shutdown(wait=False)
+
+
+def test_pipeline_failed(qtbot):
+    def stages():
+        yield
+        raise ValueError('failed')
+
+    pipeline = Pipeline(stages())
+    with qtbot.waitSignal(pipeline.finished, timeout=1000) as blocker:
+        pipeline.start()
+    assert isinstance(blocker.args[0], ValueError)
+    assert pipeline.error is blocker.args[0]
+
+
+def test_pipeline_abort(qtbot):
+    emitter = Emitter()
+    done = []
+
+    def stages():
+        try:
+            yield emitter.signal
+            done.append('resumed')
+        finally:
+            done.append('closed')
+
+    pipeline = Pipeline(stages())
+    pipeline.start()
+    with qtbot.waitSignal(pipeline.finished, timeout=1000):
+        pipeline.abort()
+    # Later emissions are ignored
+    emitter.signal.emit(1)
+    qtbot.wait(10)
+    assert done == ['closed']
+
+
+def test_pipeline_unknown(qtbot):
+    def stages():
+        yield 'something'
+
+    pipeline = Pipeline(stages())
+    with qtbot.waitSignal(pipeline.finished, timeout=1000) as blocker:
+        pipeline.start()
+    assert isinstance(blocker.args[0], TypeError)
+
+
+@pytest.mark.parametrize('delay', [0, 50])
+def test_pipeline_thread(qtbot, delay):
+    # Threads finishing before or after we wait for them
+    thread = BGThread(func=lambda: time.sleep(delay / 1000), fkw={})
+
+    def stages():
+        thread.start()
+        thread.wait(100 - delay)
+        yield thread
+
+    pipeline = Pipeline(stages())
+    with qtbot.waitSignal(pipeline.finished, timeout=1000) as blocker:
+        pipeline.start()
+    assert blocker.args == [None]
@@ -0,0 +1,81 @@
+import numpy as np
+from PyQt6 import QtCore
+
+from bmicro.gui.raster import RasterMap, apply_lut, make_lut
+
+
+def test_make_lut():
+    lut = make_lut('gray', size=4, nan_color=0x12345678)
+    assert lut.dtype == np.uint32
+    assert len(lut) == 5
+    assert lut[0] == 0xff000000
+    assert lut[3] == 0xffffffff
+    assert lut[4] == 0x12345678
+
+
+def test_apply_lut():
+    lut = np.arange(5, dtype=np.uint32)
+    data = np.array([[-1., 0., 0.3], [0.6, 1., 2.], [np.nan, np.inf, 0.]])
+    argb = apply_lut(data, 0., 1., lut)
+    np.testing.assert_array_equal(
+        argb, [[0, 0, 1], [2, 3, 3], [4, 4, 0]])
+    # The data is not changed
+    assert data[0, 0] == -1.
+
+    # Without a range, all values get the first color
+    argb = apply_lut(data, 1., 1., lut)
+    np.testing.assert_array_equal(argb, [[0, 0, 0], [0, 0, 0], [4, 4, 0]])
+
+
+def test_raster_map(qtbot):
+    raster_map = RasterMap()
+    qtbot.addWidget(raster_map)
+    raster_map.resize(400, 300)
+    raster_map.set_keep_aspect(False)
+    raster_map.set_labels('Brillouin shift', 'x [µm]', 'y [µm]', 'ν [GHz]')
+
+    data = np.array([[1., 2., 3.], [4., np.nan, 6.]])
+    raster_map.set_data(data, (-1., 1., -2., 2.))
+    assert (raster_map.vmin, raster_map.vmax) == (1., 6.)
+    assert raster_map.image.width() == 3
+    assert raster_map.image.height() == 2
+    assert raster_map.image.pixel(0, 0) == raster_map.lut[0]
+    assert raster_map.image.pixel(2, 1) == raster_map.lut[-2]
+    assert raster_map.image.pixel(1, 1) == raster_map.lut[-1]
+
+    # Drawing does not fail
+    raster_map.grab()
+
+    # Clicks are reported in data coordinates
+    rect = raster_map.get_map_rect()
+    with qtbot.waitSignal(raster_map.clicked) as blocker:
+        qtbot.mouseClick(
+            raster_map, QtCore.Qt.MouseButton.LeftButton,
+            pos=QtCore.QPoint(round(rect.left() + 0.75 * rect.width()),
+                              round(rect.top() + 0.25 * rect.height())))
+    x, y = blocker.args
+    assert abs(x - 0.5) < 0.05
+    assert abs(y - 1.) < 0.05
+
+    # Views, e.g. rotated maps, are copied
+    raster_map.set_data(np.rot90(data), (-1., 1., -2., 2.))
+    assert raster_map.image.width() == 2
+    assert raster_map.image.pixel(1, 0) == raster_map.lut[-2]
+    raster_map.grab()
+
+    raster_map.clear()
+    assert raster_map.image is None
+    raster_map.grab()
+
+
+def test_raster_map_aspect(qtbot):
+    raster_map = RasterMap()
+    qtbot.addWidget(raster_map)
+    raster_map.resize(600, 300)
+    raster_map.set_data(np.zeros((10, 10)), (0., 1., 0., 1.), 0., 1.)
+    rect = raster_map.get_map_rect()
+    assert abs(rect.width() - rect.height()) < 1e-6
+
+    raster_map.set_keep_aspect(False)
+    rect = raster_map.get_map_rect()
+    assert rect.width() > rect.height()
@@ -0,0 +1,89 @@
+import time
+
+import pytest
+from PyQt6 import QtWidgets
+
+from bmicro.gui.redraw import RedrawScheduler
+
+
+def test_coalesce(qtbot):
+    scheduler = RedrawScheduler(frame_interval=50)
+    calls = []
+
+    def redraw():
+        calls.append(time.monotonic())
+
+    # Requests before the redraw ran only redraw once
+    for _ in range(10):
+        scheduler.request(redraw)
+    assert scheduler.is_pending(redraw)
+    assert not calls
+    qtbot.waitUntil(lambda: len(calls) == 1)
+    assert not scheduler.is_pending(redraw)
+
+    # The next redraw waits for the frame interval
+    scheduler.request(redraw)
+    qtbot.waitUntil(lambda: len(calls) == 2)
+    assert calls[1] - calls[0] >= 0.045
+
+    # Cancelled redraws don't run
+    scheduler.request(redraw)
+    scheduler.cancel(redraw)
+    qtbot.wait(100)
+    assert len(calls) == 2
+
+
+def test_hidden_widget(qtbot):
+    scheduler = RedrawScheduler(frame_interval=0)
+    widget = QtWidgets.QWidget()
+    qtbot.addWidget(widget)
+    calls = []
+
+    # Redraws of hidden widgets wait until they are shown
+    scheduler.request(lambda: calls.append('hidden'), widget)
+    scheduler.request(lambda: calls.append('other'))
+    qtbot.waitUntil(lambda: calls == ['other'])
+    qtbot.wait(20)
+    assert calls == ['other']
+
+    widget.show()
+    qtbot.waitUntil(lambda: calls == ['other', 'hidden'])
+
+
+def test_flush(qtbot):
+    scheduler = RedrawScheduler()
+    widget = QtWidgets.QWidget()
+    qtbot.addWidget(widget)
+    calls = []
+    scheduler.request(lambda: calls.append(1), widget)
+    scheduler.request(lambda: calls.append(2))
+    scheduler.flush()
+    assert calls == [1, 2]
+    assert not scheduler.pending
+
+
+def test_failing_redraw(qtbot):
+    scheduler = RedrawScheduler(frame_interval=0)
+    calls = []
+
+    def fail():
+        raise ValueError('redraw failed')
+
+    # The other redraws still run and the error is not swallowed
+    with qtbot.capture_exceptions() as exceptions:
+        scheduler.request(fail)
+        scheduler.request(lambda: calls.append(1))
+        qtbot.waitUntil(lambda: calls == [1])
+    assert len(exceptions) == 1
+    assert exceptions[0][0] is ValueError
+
+    scheduler.request(fail)
+    scheduler.request(lambda: calls.append(2))
+    with pytest.raises(ValueError):
+        scheduler.flush()
+    assert calls == [1, 2]
+    assert not scheduler.pending
+
+
+def test_get_instance():
+    assert RedrawScheduler.get_instance() is RedrawScheduler.get_instance()
@@ -0,0 +1,85 @@
+from importlib import resources
+import importlib.util
+import shutil
+
+from PyQt6 import QtWidgets, uic
+
+from bmicro.gui import ui
+
+
+def import_file(py_file):
+    spec = importlib.util.spec_from_file_location(py_file.stem, py_file)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def get_ui_file(tmp_path):
+    ref = resources.files('bmicro.gui.calibration') /\
+        'calibration_options.ui'
+    with resources.as_file(ref) as ui_file:
+        return shutil.copy(ui_file, tmp_path / 'options.ui')
+
+
+def test_compile_ui(qtbot, tmp_path):
+    ui_file = get_ui_file(tmp_path)
+    py_file = ui.compile_ui(ui_file)
+    assert py_file == tmp_path / 'ui_options.py'
+
+    module = import_file(py_file)
+    assert module.UI_HASH == ui.get_ui_hash(py_file.with_name(
+        'options.ui').read_bytes())
+
+    # The compiled module sets up the same widgets as the .ui file
+    compiled = ui.setup_compiled(module, QtWidgets.QDialog())
+    loaded = QtWidgets.QDialog()
+    uic.loadUi(ui_file, loaded)
+    qtbot.addWidget(compiled)
+    qtbot.addWidget(loaded)
+    for name in ['shift_0', 'shift_1', 'temperature', 'button_ok',
+                 'widget_plot']:
+        assert type(getattr(compiled, name)) is type(getattr(loaded, name))
+    assert compiled.shift_0.value() == loaded.shift_0.value()
+
+
+def test_compile_all(tmp_path):
+    (tmp_path / 'sub').mkdir()
+    shutil.move(get_ui_file(tmp_path), tmp_path / 'sub' / 'options.ui')
+    assert ui.compile_all(tmp_path) == [tmp_path / 'sub' / 'ui_options.py']
+
+
+def test_load_ui(qtbot, tmp_path, monkeypatch):
+    package = tmp_path / 'ui_test_package'
+    package.mkdir()
+    (package / '__init__.py').touch()
+    get_ui_file(package)
+    monkeypatch.syspath_prepend(str(tmp_path))
+
+    # Without a compiled module, the .ui file is parsed
+    calls = []
+    load = uic.loadUi
+    monkeypatch.setattr(uic, 'loadUi',
+                        lambda *args: calls.append(args) or load(*args))
+    dialog = QtWidgets.QDialog()
+    qtbot.addWidget(dialog)
+    ui.load_ui('ui_test_package', 'options', dialog)
+    assert len(calls) == 1
+    assert isinstance(dialog.shift_0, QtWidgets.QDoubleSpinBox)
+
+    # The up to date compiled module is used
+    py_file = ui.compile_ui(package / 'options.ui')
+    dialog = QtWidgets.QDialog()
+    qtbot.addWidget(dialog)
+    ui.load_ui('ui_test_package', 'options', dialog)
+    assert len(calls) == 1
+    assert isinstance(dialog.shift_0, QtWidgets.QDoubleSpinBox)
+
+    # An outdated compiled module is ignored
+    (package / 'options.ui').write_text(
+        (package / 'options.ui').read_text().replace(
+            'Calibration', 'Calibration '))
+    dialog = QtWidgets.QDialog()
+    qtbot.addWidget(dialog)
+    ui.load_ui('ui_test_package', 'options', dialog)
+    assert len(calls) == 2
+    assert py_file.exists()
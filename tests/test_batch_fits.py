@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+
+from bmlab import fits as bmlab_fits
+from bmlab.fits import lorentz
+
+from bmicro.batch_fits import fit_lorentz_regions, get_region_data
+
+
+def spectra(peaks, nr_spectra=5, offset=100):
+    rng = np.random.default_rng(42)
+    frequencies, intensities = [], []
+    for _ in range(nr_spectra):
+        # The frequency axes differ slightly between the spectra
+        x = np.linspace(0, 10e9, 300) + rng.normal(0, 20e6)
+        shift = rng.normal(0, 100e6)
+        y = offset + rng.normal(0, 2, x.shape)
+        for w0, fwhm, intensity in peaks:
+            y += lorentz(x, w0 + shift, fwhm, intensity)
+        frequencies.append(x)
+        intensities.append(y)
+    return frequencies, intensities
+
+
+PEAKS = {
+    1: [(5.1e9, 0.8e9, 200)],
+    2: [(4.6e9, 0.6e9, 200), (5.8e9, 0.6e9, 150)],
+    4: [(3.0e9, 0.5e9, 200), (4.5e9, 0.5e9, 180),
+        (6.0e9, 0.5e9, 160), (7.5e9, 0.5e9, 140)],
+}
+REGIONS = {1: (3e9, 7e9), 2: (3e9, 7.5e9), 4: (2e9, 8.5e9)}
+
+
+@pytest.mark.parametrize('nr_peaks', [1, 2, 4])
+@pytest.mark.parametrize('bounded', [False, True])
+def test_fit_lorentz_regions(nr_peaks, bounded):
+    frequencies, intensities = spectra(PEAKS[nr_peaks])
+    region = REGIONS[nr_peaks]
+    bounds_w0 = bounds_fwhm = None
+    if bounded and nr_peaks > 1:
+        centers = [peak[0] for peak in PEAKS[nr_peaks]]
+        bounds_w0 = np.array(len(frequencies) * [
+            [(center - 0.5e9, center + 0.5e9) for center in centers]])
+        bounds_fwhm = np.array(len(frequencies) * [
+            nr_peaks * [(0, np.inf)]])
+
+    w0, fwhm, intensity, offset = fit_lorentz_regions(
+        region, frequencies, intensities, nr_peaks, bounds_w0, bounds_fwhm)
+    assert w0.shape == fwhm.shape == intensity.shape ==\
+        (len(frequencies), nr_peaks)
+
+    # The results agree with the sequential fits
+    for idx, (x, y) in enumerate(zip(frequencies, intensities)):
+        expected = bmlab_fits.fit_lorentz_region(
+            region, x, y, nr_peaks,
+            None if bounds_w0 is None else bounds_w0[idx],
+            None if bounds_fwhm is None else bounds_fwhm[idx])
+        assert np.allclose(w0[idx], expected[0], rtol=0, atol=1e6)
+        assert np.allclose(fwhm[idx], expected[1], rtol=1e-3)
+        assert np.allclose(intensity[idx], expected[2], rtol=1e-3)
+        assert np.isclose(offset[idx], expected[3], rtol=1e-2)
+
+
+def test_fit_lorentz_regions_guesses():
+    frequencies, intensities = spectra(PEAKS[1], nr_spectra=3)
+    guesses = np.array([(5e9, 1e9, 150, 90),
+                        (np.nan, np.nan, np.nan, np.nan),
+                        (20e9, 1e9, 150, 90)])
+    w0, fwhm, intensity, offset = fit_lorentz_regions(
+        REGIONS[1], frequencies, intensities, guesses=guesses)
+    reference = fit_lorentz_regions(REGIONS[1], frequencies, intensities)
+    # Invalid guesses are replaced by the usual estimates
+    # and guesses outside of the bounds are clipped
+    assert np.allclose(w0, reference[0], rtol=0, atol=1e6)
+    assert np.allclose(fwhm, reference[1], rtol=1e-3)
+
+
+def test_fit_lorentz_regions_failed():
+    frequencies, intensities = spectra(PEAKS[2], nr_spectra=3)
+    # Empty region
+    frequencies[0] = np.nan * frequencies[0]
+    # Only a single peak, so we cannot estimate the second one
+    intensities[1] = 100 + lorentz(frequencies[1], *PEAKS[1][0])
+
+    w0, fwhm, intensity, offset = fit_lorentz_regions(
+        REGIONS[2], frequencies, intensities, nr_peaks=2)
+    assert np.isnan(w0[0:2]).all()
+    assert np.isnan(offset[0:2]).all()
+    assert np.isfinite(w0[2]).all()
+
+
+def test_get_region_data():
+    x = np.linspace(0, 10, 11)
+    y = x ** 2
+    y_nan = y.copy()
+    y_nan[4] = np.nan
+    x_region, y_region, valid = get_region_data(
+        (2, 7), [x, x + 0.2], [y_nan, y])
+    assert x_region.shape == y_region.shape == valid.shape == (2, 5)
+    assert x_region[0, valid[0]].tolist() == [2, 3, 5, 6]
+    assert x_region[1, valid[1]].tolist() == pytest.approx(
+        [2.2, 3.2, 4.2, 5.2, 6.2])
+    assert np.isfinite(x_region).all()
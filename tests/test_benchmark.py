@@ -0,0 +1,39 @@
+import numpy as np
+
+from bmicro.benchmark import STAGES, compare_results, run_benchmark
+
+
+def test_run_benchmark():
+    results = run_benchmark(sizes=[2], nr_frames=1)
+    assert len(results['runs']) == 1
+    run = results['runs'][0]
+    assert run['resolution'] == [2, 2, 1]
+    assert list(run['stages'].keys()) == STAGES
+    assert all(np.isfinite(list(run['stages'].values())))
+    # The evaluation recovers the ground truth
+    assert run['error'] < 0.05e9
+    # Comparing against itself never reports a regression
+    assert compare_results(results, results) == []
+
+
+def test_compare_results():
+    def results(evaluate, peak_selection):
+        return {'runs': [{
+            'resolution': [4, 4, 1],
+            'nr_frames': 2,
+            'stages': {
+                'evaluate': evaluate,
+                'peak_selection': peak_selection,
+            },
+        }]}
+
+    baseline = results(1.0, 1e-4)
+    # Slowdowns within the tolerance are accepted
+    assert compare_results(results(1.2, 1e-4), baseline, 0.25) == []
+    # Very short stages are not compared at all
+    assert compare_results(results(1.0, 1e-2), baseline, 0.25) == []
+
+    regressions = compare_results(results(1.5, 1e-4), baseline, 0.25)
+    assert len(regressions) == 1
+    assert regressions[0]['stage'] == 'evaluate'
+    assert np.isclose(regressions[0]['ratio'], 1.5)
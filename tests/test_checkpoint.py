@@ -0,0 +1,96 @@
+import h5py
+import numpy as np
+
+from bmicro.checkpoint import Checkpoint, get_checkpoint_path
+
+RESOLUTION = (3, 2, 1)
+
+
+def create_results():
+    return {
+        'time': np.full((*RESOLUTION, 2, 1, 1), np.nan),
+        'brillouin_peak_position_f': np.full((*RESOLUTION, 2, 2, 3),
+                                             np.nan),
+    }
+
+
+def get_values(image_keys):
+    return {
+        'time': np.ones((len(image_keys), 2, 1, 1)),
+        'brillouin_peak_position_f': np.array(
+            [np.full((2, 2, 3), int(key)) for key in image_keys],
+            dtype=float),
+    }
+
+
+def test_get_checkpoint_path(tmp_path):
+    assert get_checkpoint_path(tmp_path / 'data.h5', '1') ==\
+        tmp_path / 'data.session.checkpoint-1.h5'
+    raw_data = tmp_path / 'RawData'
+    raw_data.mkdir()
+    assert get_checkpoint_path(raw_data / 'data.h5', '0') ==\
+        tmp_path / 'EvalData' / 'data.checkpoint-0.h5'
+
+
+def test_checkpoint(tmp_path):
+    path = tmp_path / 'checkpoint.h5'
+    checkpoint = Checkpoint(path, 'a', interval=3600)
+    checkpoint.append(['0', '1'], get_values(['0', '1']))
+    # Nothing is written before the interval passed
+    assert not path.exists()
+    checkpoint.flush()
+    checkpoint.append(['1', '4'], get_values(['1', '4']))
+    checkpoint.flush()
+
+    results = create_results()
+    assert Checkpoint(path, 'a').load(results, RESOLUTION) == ['0', '1', '4']
+    # The image keys enumerate the points in Fortran order
+    position = results['brillouin_peak_position_f']
+    assert (position[0, 0, 0] == 0).all()
+    assert (position[1, 0, 0] == 1).all()
+    assert (position[1, 1, 0] == 4).all()
+    assert np.isfinite(results['time']).sum() == 3 * 2
+    assert np.isnan(position[2, 0, 0]).all()
+
+    checkpoint.remove()
+    assert not path.exists()
+
+
+def test_checkpoint_interval(tmp_path):
+    path = tmp_path / 'checkpoint.h5'
+    checkpoint = Checkpoint(path, 'a', interval=0)
+    checkpoint.append(['2'], get_values(['2']))
+    assert Checkpoint(path, 'a').load(create_results(), RESOLUTION) == ['2']
+
+
+def test_checkpoint_configuration(tmp_path):
+    path = tmp_path / 'checkpoint.h5'
+    Checkpoint(path, 'a', interval=0).append(['2'], get_values(['2']))
+
+    # A checkpoint of another configuration is discarded
+    results = create_results()
+    checkpoint = Checkpoint(path, 'b', interval=0)
+    assert checkpoint.load(results, RESOLUTION) == []
+    assert np.isnan(results['time']).all()
+    assert not path.exists()
+    checkpoint.append(['3'], get_values(['3']))
+    assert Checkpoint(path, 'b').load(create_results(), RESOLUTION) == ['3']
+
+
+def test_checkpoint_interrupted(tmp_path):
+    path = tmp_path / 'checkpoint.h5'
+    Checkpoint(path, 'a', interval=0).append(['2'], get_values(['2']))
+    # Results written without their keys are ignored
+    with h5py.File(path, 'a') as file:
+        file['time'].resize(2, axis=0)
+    checkpoint = Checkpoint(path, 'a', interval=0)
+    assert checkpoint.load(create_results(), RESOLUTION) == ['2']
+    checkpoint.append(['2', '5'], get_values(['2', '5']))
+    results = create_results()
+    assert Checkpoint(path, 'a').load(results, RESOLUTION) == ['2', '5']
+    assert (results['brillouin_peak_position_f'][2, 1, 0] == 5).all()
+
+    # An unreadable checkpoint is discarded
+    path.write_bytes(b'broken')
+    assert Checkpoint(path, 'a').load(create_results(), RESOLUTION) == []
+    assert not path.exists()
@@ -0,0 +1,96 @@
+import concurrent.futures
+import multiprocessing as mp
+import pickle
+
+import numpy as np
+import pytest
+
+from bmlab.controllers import CalibrationController, EvaluationController, \
+    ExtractionController
+from bmlab.models.setup import AVAILABLE_SETUPS
+from bmlab.session import Session
+
+from bmicro.context import EvaluationContext, apply_context, \
+    create_context, get_settings, open_file
+from bmicro.repetitions import get_model_state
+from bmicro.synthetic import write_dataset
+
+SETTINGS = {
+    'brillouin_regions': [(4e9, 6e9)],
+    'rayleigh_regions': [(-2e9, 2e9)],
+    'nr_brillouin_peaks': 1,
+    'bounds_w0': None,
+    'bounds_fwhm': None,
+    'warm_start': False,
+    'engine': 'sequential',
+}
+
+
+@pytest.fixture
+def session(tmp_path):
+    path = tmp_path / 'synthetic.h5'
+    write_dataset(path, resolution=(3, 2, 1), nr_frames=2)
+
+    session = Session.get_instance()
+    session.set_file(path)
+    session.set_current_repetition('0')
+    session.set_setup(AVAILABLE_SETUPS[0])
+    session.set_rotation(0)
+    session.set_reflection(vertically=False, horizontally=True)
+
+    ExtractionController().find_points_all()
+    cc = CalibrationController()
+    for calib_key in session.get_calib_keys():
+        cc.find_peaks(calib_key)
+        cc.calibrate(calib_key)
+    yield session
+    session.clear()
+
+
+def extract(context, image_key):
+    """ Extracts a measurement point in a worker process """
+    apply_context(context)
+    session = Session.get_instance()
+    with open_file(context):
+        spectra, times, _ = EvaluationController().extract_spectra(image_key)
+    # The file is closed again
+    assert session.file is None
+    frequencies = session.calibration_model().get_frequencies_by_time(times)
+    return spectra, frequencies, get_settings(context)
+
+
+def test_create_context(session):
+    context = create_context(SETTINGS)
+    assert isinstance(context, EvaluationContext)
+    assert context.rep_key == '0'
+    assert context.orientation == (0, False, True)
+    assert get_settings(context) == SETTINGS
+
+    # The context can't be changed
+    with pytest.raises(AttributeError):
+        context.rep_key = '1'
+    for _, positions in context.arcs:
+        assert not positions.flags.writeable
+
+    # It is smaller than the models it is created from
+    models = pickle.dumps([get_model_state(session.extraction_model()),
+                           get_model_state(session.calibration_model())])
+    assert len(pickle.dumps(context)) < len(models)
+
+    # Every context has its own token
+    assert create_context(SETTINGS).token != context.token
+
+
+def test_apply_context(session):
+    context = create_context(SETTINGS)
+    evc = EvaluationController()
+    spectra, times, _ = evc.extract_spectra('3')
+    frequencies = session.calibration_model().get_frequencies_by_time(times)
+
+    # A worker process evaluates without the session
+    with concurrent.futures.ProcessPoolExecutor(
+            max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+        result = pool.submit(extract, context, '3').result()
+    np.testing.assert_allclose(result[0], spectra)
+    np.testing.assert_allclose(result[1], frequencies)
+    assert result[2] == SETTINGS
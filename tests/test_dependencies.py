@@ -0,0 +1,55 @@
+from bmicro.dependencies import get_inputs, get_reusable
+
+
+def settings(**kwargs):
+    settings = {
+        'brillouin_regions': [(4e9, 6e9), (9e9, 11e9)],
+        'rayleigh_regions': [(-2e9, 2e9), (13e9, 17e9)],
+        'nr_brillouin_peaks': 2,
+        'bounds_w0': [['min', '5'], ['5', 'max']],
+        'bounds_fwhm': [['0', 'inf'], ['0', 'inf']],
+        'engine': 'sequential',
+    }
+    settings.update(kwargs)
+    return settings
+
+
+def test_get_reusable():
+    previous = get_inputs(settings())
+    assert get_reusable(None, previous) == {
+        'rayleigh': [None, None],
+        'brillouin': [None, None],
+        'multi_peak': [None, None],
+    }
+    assert get_reusable(previous, previous) == {
+        'rayleigh': [0, 1],
+        'brillouin': [0, 1],
+        'multi_peak': [0, 1],
+    }
+
+    # A new region is fitted, the others are reused
+    inputs = get_inputs(settings(
+        brillouin_regions=[(1e9, 3e9), (4e9, 6e9), (9e9, 11e9)]))
+    reusable = get_reusable(previous, inputs)
+    assert reusable['brillouin'] == [None, 0, 1]
+    assert reusable['multi_peak'] == [None, 0, 1]
+    assert reusable['rayleigh'] == [0, 1]
+
+    # The bounds only affect the multi-peak fits
+    inputs = get_inputs(settings(bounds_w0=[['min', '6'], ['6', 'max']]))
+    reusable = get_reusable(previous, inputs)
+    assert reusable['brillouin'] == [0, 1]
+    assert reusable['multi_peak'] == [None, None]
+
+    # The multi-peak fits depend on the Rayleigh peaks
+    inputs = get_inputs(settings(rayleigh_regions=[(-2e9, 2e9),
+                                                   (13e9, 16e9)]))
+    reusable = get_reusable(previous, inputs)
+    assert reusable['rayleigh'] == [0, None]
+    assert reusable['brillouin'] == [0, 1]
+    assert reusable['multi_peak'] == [None, None]
+
+    # Nothing is reused with another fit engine
+    inputs = get_inputs(settings(engine='batched'))
+    reusable = get_reusable(previous, inputs)
+    assert all(old is None for stage in reusable.values() for old in stage)
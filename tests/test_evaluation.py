@@ -0,0 +1,434 @@
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+from bmlab.controllers import ExtractionController, CalibrationController, \
+    PeakSelectionController, EvaluationController
+from bmlab.models.setup import AVAILABLE_SETUPS
+from bmlab.session import Session
+
+from bmicro.evaluation import ChunkedEvaluationController, \
+    fill_nearest, get_chunk_size, get_decimation, get_neighbour_offsets, \
+    get_progressive_order
+from bmicro.out_of_core import SpectraStore
+from bmicro.progress import Throughput
+from bmicro.synthetic import write_dataset
+
+
+@pytest.fixture
+def session(tmp_path):
+    path = tmp_path / 'synthetic.h5'
+    ground_truth = write_dataset(path, resolution=(3, 2, 1), nr_frames=2)
+
+    session = Session.get_instance()
+    session.set_file(path)
+    session.set_current_repetition('0')
+    session.set_setup(AVAILABLE_SETUPS[0])
+    session.set_rotation(0)
+    session.set_reflection(vertically=False, horizontally=True)
+
+    ExtractionController().find_points_all()
+    cc = CalibrationController()
+    for calib_key in session.get_calib_keys():
+        cc.find_peaks(calib_key)
+        cc.calibrate(calib_key)
+    psc = PeakSelectionController()
+    for region in [(4e9, 6e9), (9e9, 11e9)]:
+        psc.add_brillouin_region_frequency(region)
+    for region in [(-2e9, 2e9), (13e9, 17e9)]:
+        psc.add_rayleigh_region_frequency(region)
+
+    session.ground_truth = ground_truth['0']
+    yield session
+    session.clear()
+
+
+def evaluate_reference(session):
+    EvaluationController().evaluate()
+    results = session.evaluation_model().results
+    return {key: value.copy() for key, value in results.items()}
+
+
+def assert_results_equal(results, reference):
+    assert results.keys() == reference.keys()
+    for key, value in reference.items():
+        np.testing.assert_allclose(results[key], value, equal_nan=True,
+                                   err_msg=key)
+
+
+@pytest.mark.parametrize('nr_brillouin_peaks', [1, 2])
+def test_evaluate_serial(session, nr_brillouin_peaks):
+    session.evaluation_model().setNrBrillouinPeaks(nr_brillouin_peaks)
+    reference = evaluate_reference(session)
+
+    count = mp.Value('I', 0, lock=True)
+    max_count = mp.Value('i', 0, lock=True)
+    ChunkedEvaluationController().evaluate(count=count, max_count=max_count,
+                                           chunk_size=4)
+    assert count.value == max_count.value == 6
+    assert_results_equal(session.evaluation_model().results, reference)
+
+
+def test_evaluate_pool(session):
+    reference = evaluate_reference(session)
+
+    count = mp.Value('I', 0, lock=True)
+    max_count = mp.Value('i', 0, lock=True)
+    throughput = Throughput()
+    ChunkedEvaluationController().evaluate(count=count, max_count=max_count,
+                                           nr_workers=2, chunk_size=2,
+                                           throughput=throughput)
+    assert count.value == max_count.value == 6
+    assert throughput.done == throughput.total == 6
+    assert throughput.nr_frames == 2
+    assert sum(throughput.get_worker_progress().values()) == 6
+    results = session.evaluation_model().results
+    assert_results_equal(results, reference)
+
+    # The workers extracted the spectra
+    evm = session.evaluation_model()
+    assert len(evm.spectra) == len(evm.frequencies) == 6
+    spectra, _, _ = EvaluationController().extract_spectra('4')
+    np.testing.assert_allclose(evm.spectra['4'], spectra)
+
+    # The evaluation recovers the ground truth
+    shift = np.nanmean(results['brillouin_shift_f'], axis=(3, 4, 5))
+    assert np.nanmax(np.abs(
+        shift - session.ground_truth['brillouin_shift_f'])) < 0.05e9
+
+
+def test_evaluate_pool_partial(session):
+    reference = evaluate_reference(session)
+
+    # The spectra are compared in this process, the workers only fit
+    ChunkedEvaluationController().evaluate(nr_workers=2, partial=True)
+    assert_results_equal(session.evaluation_model().results, reference)
+    session.peak_selection_model().set_brillouin_region(1, (8.9e9, 11e9))
+    ChunkedEvaluationController().evaluate(nr_workers=2, partial=True)
+    results = session.evaluation_model().results
+    results = {key: value.copy() for key, value in results.items()}
+    assert_results_equal(results, evaluate_reference(session))
+
+
+@pytest.mark.parametrize('prefetch_depth', [0, 1, 16])
+def test_evaluate_prefetch(session, prefetch_depth):
+    reference = evaluate_reference(session)
+
+    evc = ChunkedEvaluationController()
+    evc.evaluate(chunk_size=2, progressive=True, prefetch_depth=prefetch_depth,
+                 prefetch_memory=0.001)
+    assert evc.prefetcher is None
+    assert_results_equal(session.evaluation_model().results, reference)
+
+
+def test_load_spectra(session):
+    spectra, times, intensities = EvaluationController().extract_spectra('4')
+    evm = session.evaluation_model()
+    evm.spectra.clear()
+
+    # The prefetch thread must not store the spectra
+    evc = ChunkedEvaluationController()
+    loaded = evc.load_spectra('4')
+    assert '4' not in evm.spectra
+    for value, expected in zip(loaded, (spectra, times, intensities)):
+        np.testing.assert_allclose(value, expected)
+
+    # They are stored while evaluating the prefetched points
+    evc.evaluate(chunk_size=2, prefetch_depth=16)
+    np.testing.assert_allclose(evm.spectra['4'], spectra)
+
+
+def test_evaluate_progressive(session):
+    reference = evaluate_reference(session)
+
+    ChunkedEvaluationController().evaluate(progressive=True, chunk_size=1)
+    assert_results_equal(session.evaluation_model().results, reference)
+
+
+@pytest.mark.parametrize('nr_workers', [1, 2])
+def test_evaluate_warm_start(session, nr_workers):
+    reference = evaluate_reference(session)
+
+    ChunkedEvaluationController().evaluate(
+        nr_workers=nr_workers, chunk_size=2, progressive=True,
+        warm_start=True)
+    results = session.evaluation_model().results
+    # The fits converge to the same peaks
+    for key in ['brillouin_peak_position_f', 'brillouin_shift_f',
+                'rayleigh_peak_position_f']:
+        np.testing.assert_allclose(results[key], reference[key],
+                                   rtol=0, atol=5e6, err_msg=key)
+
+
+def test_evaluate_abort(session):
+    abort = mp.Value('I', True, lock=True)
+    count = mp.Value('I', 0, lock=True)
+    max_count = mp.Value('i', 0, lock=True)
+    ChunkedEvaluationController().evaluate(abort=abort, count=count,
+                                           max_count=max_count, nr_workers=2)
+    assert max_count.value == -1
+    assert count.value == 0
+    assert np.isnan(
+        session.evaluation_model().results['brillouin_shift_f']).all()
+
+
+def test_evaluate_mask(session):
+    mask = np.zeros((3, 2, 1), dtype=bool)
+    mask[1:, 0, 0] = True
+
+    count = mp.Value('I', 0, lock=True)
+    max_count = mp.Value('i', 0, lock=True)
+    ChunkedEvaluationController().evaluate(count=count, max_count=max_count,
+                                           mask=mask)
+    assert count.value == max_count.value == 2
+    results = session.evaluation_model().results
+    # Only the points inside the mask are evaluated
+    shift = np.nanmean(results['brillouin_shift_f'], axis=(3, 4, 5))
+    assert np.array_equal(np.isfinite(shift), mask)
+    assert np.isnan(results['time'][~mask]).all()
+
+
+def test_get_chunk_size():
+    assert get_chunk_size(1, 4) == 1
+    assert get_chunk_size(100, 1) == 13
+    assert get_chunk_size(100, 4) == 4
+    assert get_chunk_size(100000, 4) == 50
+
+
+def test_get_progressive_order():
+    image_keys = [str(key) for key in range(8 * 5)]
+    order = get_progressive_order(image_keys, (8, 5, 1), strides=(4, 2))
+    assert sorted(order, key=int) == image_keys
+    # The coarse grid comes first, then the points of the finer grid
+    assert order[:4] == ['0', '4', '32', '36']
+    assert order[4:12] == ['2', '6', '16', '18', '20', '22', '34', '38']
+    assert order[12:15] == ['1', '3', '5']
+
+
+def test_fill_nearest():
+    data = np.nan * np.ones((4, 3, 1))
+    data[0, 0, 0] = 1
+    data[3, 2, 0] = 5
+    filled = fill_nearest(data)
+    assert np.isfinite(filled).all()
+    assert filled[1, 0, 0] == 1
+    assert filled[3, 1, 0] == 5
+    # Points outside the mask are not filled
+    mask = np.ones(data.shape, dtype=bool)
+    mask[0, 2, 0] = False
+    filled = fill_nearest(data, mask)
+    assert np.isnan(filled[0, 2, 0])
+    assert np.isfinite(filled[mask]).all()
+
+
+def test_get_neighbour_offsets():
+    offsets = get_neighbour_offsets((10, 1, 5), max_distance=2)
+    assert offsets.shape == (24, 3)
+    assert not np.any(offsets[:, 1])
+    assert not np.any(np.all(offsets == 0, axis=1))
+    # The direct neighbours come first
+    assert np.sum(np.abs(offsets[:4]), axis=1).tolist() == [1, 1, 1, 1]
+
+
+@pytest.mark.parametrize('nr_brillouin_peaks', [1, 2, 4])
+def test_evaluate_batched(session, nr_brillouin_peaks):
+    session.evaluation_model().setNrBrillouinPeaks(nr_brillouin_peaks)
+    reference = evaluate_reference(session)
+
+    count = mp.Value('I', 0, lock=True)
+    max_count = mp.Value('i', 0, lock=True)
+    ChunkedEvaluationController().evaluate(count=count, max_count=max_count,
+                                           chunk_size=4, engine='batched')
+    assert count.value == max_count.value == 6
+    results = session.evaluation_model().results
+    # The fits converge to the same peaks
+    for key in ['brillouin_peak_position_f', 'brillouin_peak_fwhm_f',
+                'brillouin_shift_f', 'rayleigh_peak_position_f']:
+        np.testing.assert_allclose(results[key], reference[key],
+                                   rtol=0, atol=5e6, err_msg=key)
+
+
+@pytest.fixture
+def fitted_regions(monkeypatch):
+    fitted = []
+    fit_spectra = ChunkedEvaluationController.fit_spectra
+
+    def counting_fit_spectra(spectra, frequencies, region, *args):
+        fitted.append((tuple(region), args[0] if args else 1))
+        return fit_spectra(spectra, frequencies, region, *args)
+
+    monkeypatch.setattr(ChunkedEvaluationController, 'fit_spectra',
+                        staticmethod(counting_fit_spectra))
+    return fitted
+
+
+def test_evaluate_partial(session, fitted_regions):
+    session.evaluation_model().setNrBrillouinPeaks(2)
+    ChunkedEvaluationController().evaluate(partial=True)
+    # Nothing to reuse for the first evaluation
+    assert len(fitted_regions) == 6 * (2 + 2 + 2)
+
+    # Nothing changed, so nothing is fitted
+    fitted_regions.clear()
+    ChunkedEvaluationController().evaluate(partial=True)
+    assert not fitted_regions
+
+    # Only the changed Brillouin region is fitted again
+    fitted_regions.clear()
+    session.peak_selection_model().set_brillouin_region(1, (8.9e9, 11e9))
+    ChunkedEvaluationController().evaluate(partial=True)
+    assert set(fitted_regions) == {((8.9e9, 11e9), 1), ((8.9e9, 11e9), 2)}
+    assert len(fitted_regions) == 6 * 2
+    results = session.evaluation_model().results
+    results = {key: value.copy() for key, value in results.items()}
+
+    # The results are the same as after a full evaluation
+    fitted_regions.clear()
+    reference = evaluate_reference(session)
+    assert len(fitted_regions) == 0
+    assert_results_equal(results, reference)
+
+
+def test_evaluate_partial_bounds(session, fitted_regions):
+    session.evaluation_model().setNrBrillouinPeaks(2)
+    ChunkedEvaluationController().evaluate(partial=True)
+
+    # Changing the bounds only affects the multi-peak fits
+    fitted_regions.clear()
+    session.evaluation_model().set_bounds([['min', '5'], ['5', 'max']])
+    ChunkedEvaluationController().evaluate(partial=True)
+    assert len(fitted_regions) == 6 * 2
+    assert all(nr_peaks == 2 for _, nr_peaks in fitted_regions)
+
+
+def test_evaluate_partial_mask(session, fitted_regions):
+    mask = np.zeros((3, 2, 1), dtype=bool)
+    mask[0, :, 0] = True
+    ChunkedEvaluationController().evaluate(mask=mask, partial=True)
+
+    # Points not evaluated before are fitted completely
+    fitted_regions.clear()
+    ChunkedEvaluationController().evaluate(partial=True)
+    assert len(fitted_regions) == 4 * (2 + 2)
+    shift = session.evaluation_model().results['brillouin_shift_f']
+    assert np.isfinite(shift).all()
+
+
+def test_evaluate_checkpoint(session, fitted_regions, monkeypatch):
+    # Abort the evaluation after the first chunk
+    abort = mp.Value('I', False, lock=True)
+    store_chunk = ChunkedEvaluationController.store_chunk
+
+    def aborting_store_chunk(self, *args):
+        store_chunk(self, *args)
+        abort.value = True
+
+    monkeypatch.setattr(ChunkedEvaluationController, 'store_chunk',
+                        aborting_store_chunk)
+    ChunkedEvaluationController().evaluate(abort=abort, chunk_size=2,
+                                           checkpoint_interval=0)
+    assert len(fitted_regions) == 2 * (2 + 2)
+    path = session.file.path.with_suffix('.session.checkpoint-0.h5')
+    assert path.exists()
+
+    # Only the missing points are fitted when resuming
+    monkeypatch.setattr(ChunkedEvaluationController, 'store_chunk',
+                        store_chunk)
+    fitted_regions.clear()
+    ChunkedEvaluationController().evaluate(chunk_size=2,
+                                           checkpoint_interval=0)
+    assert len(fitted_regions) == 4 * (2 + 2)
+    assert not path.exists()
+    results = session.evaluation_model().results
+    results = {key: value.copy() for key, value in results.items()}
+    assert_results_equal(results, evaluate_reference(session))
+
+
+@pytest.mark.parametrize('nr_workers', [1, 2])
+def test_evaluate_out_of_core(session, tmp_path, nr_workers):
+    session.evaluation_model().setNrBrillouinPeaks(2)
+    reference = evaluate_reference(session)
+
+    ChunkedEvaluationController().evaluate(
+        nr_workers=nr_workers, chunk_size=2, out_of_core=True,
+        scratch_directory=tmp_path)
+    evm = session.evaluation_model()
+    assert isinstance(evm.results['brillouin_shift_f'], np.memmap)
+    assert isinstance(evm.spectra, SpectraStore)
+    assert_results_equal(evm.results, reference)
+    spectra, _, _ = EvaluationController().extract_spectra('4')
+    np.testing.assert_allclose(evm.spectra['4'], spectra)
+
+    # The session file is written from the files
+    session.save()
+    evm = session.evaluation_model()
+    session.load(session.file.path)
+    assert session.evaluation_model() is not evm
+    assert_results_equal(session.evaluation_model().results, reference)
+    np.testing.assert_allclose(session.evaluation_model().spectra['4'],
+                               spectra)
+
+
+@pytest.mark.parametrize('nr_brillouin_peaks', [1, 2])
+def test_evaluate_quick_look(session, nr_brillouin_peaks):
+    session.evaluation_model().setNrBrillouinPeaks(nr_brillouin_peaks)
+    reference = evaluate_reference(session)
+
+    count = mp.Value('I', 0, lock=True)
+    max_count = mp.Value('i', 0, lock=True)
+    ChunkedEvaluationController().evaluate(count=count, max_count=max_count,
+                                           chunk_size=4, engine='quick-look')
+    assert count.value == max_count.value == 6
+    evm = session.evaluation_model()
+    assert evm.approximate
+    results = evm.results
+    # The estimates are close to the fits
+    for key in ['brillouin_peak_position_f', 'brillouin_shift_f',
+                'rayleigh_peak_position_f']:
+        np.testing.assert_allclose(results[key][..., 0],
+                                   reference[key][..., 0],
+                                   rtol=0, atol=0.05e9, err_msg=key)
+    np.testing.assert_allclose(results['brillouin_peak_fwhm_f'][..., 0],
+                               reference['brillouin_peak_fwhm_f'][..., 0],
+                               rtol=0.2, err_msg='brillouin_peak_fwhm_f')
+    # Overlapping peaks are not estimated
+    assert np.all(np.isnan(results['brillouin_peak_position_f'][..., 1:]))
+
+    # Fitting again clears the flag
+    ChunkedEvaluationController().evaluate(chunk_size=4)
+    assert not evm.approximate
+
+
+def test_get_data(session):
+    session.evaluation_model().setNrBrillouinPeaks(2)
+    ChunkedEvaluationController().evaluate()
+
+    evc = ChunkedEvaluationController()
+    for parameter_key in session.evaluation_model().get_parameter_keys():
+        for brillouin_peak_index in range(5):
+            data, positions, dimensionality, labels = evc.get_data(
+                parameter_key, brillouin_peak_index)
+            reference = EvaluationController().get_data(
+                parameter_key, brillouin_peak_index)
+            np.testing.assert_allclose(data, reference[0], equal_nan=True)
+            for position, expected in zip(positions, reference[1]):
+                np.testing.assert_allclose(position, expected)
+            assert dimensionality == reference[2]
+            assert labels == reference[3]
+
+    # Large maps are decimated
+    data, positions, _, _ = evc.get_data('brillouin_shift_f', 0,
+                                         max_points=2)
+    reference = EvaluationController().get_data('brillouin_shift_f', 0)
+    np.testing.assert_allclose(data, reference[0][::2, ::2])
+    assert positions[0].shape == data.shape
+
+
+def test_get_decimation():
+    assert get_decimation((3, 2, 1), None) == (1, 1, 1)
+    assert get_decimation((3, 2, 1), 6) == (1, 1, 1)
+    assert get_decimation((3, 2, 1), 5) == (2, 2, 1)
+    assert get_decimation((1000, 1, 1), 10) == (100, 1, 1)
+    assert get_decimation((1000, 1000, 10), 10 ** 6) == (3, 3, 3)
+    assert get_decimation((1, 1, 1), 0) == (1, 1, 1)
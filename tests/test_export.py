@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+from bmlab.controllers import ExportController
+from bmlab.session import Session
+
+from bmicro.export import APPROXIMATE_SUFFIX, export, flag_approximate
+from bmicro.repetitions import evaluate_current_repetition, \
+    get_default_config
+from bmicro.synthetic import write_dataset
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'synthetic.h5'
+    write_dataset(path, resolution=(3, 2, 1), nr_repetitions=2, nr_frames=1)
+    yield path
+    Session.get_instance().clear()
+
+
+def exported_files(path, rep_key):
+    return sorted(file.name for file in path.parent.iterdir()
+                  if file.name.startswith(f'{path.stem}_BMrep{rep_key}_'))
+
+
+def evaluate(session, engines):
+    config = get_default_config()
+    for rep_key, engine in engines.items():
+        config['evaluation']['engine'] = engine
+        session.set_current_repetition(rep_key)
+        evaluate_current_repetition(config)
+
+
+def is_flagged(file):
+    name, _ = os.path.splitext(file)
+    return name.endswith(APPROXIMATE_SUFFIX)
+
+
+def test_export(path):
+    session = Session.get_instance()
+    session.set_file(path)
+    # Only the second repetition is approximate
+    evaluate(session, {'0': 'batched', '1': 'quick-look'})
+    export(ExportController.get_configuration())
+
+    files = exported_files(path, '0')
+    assert files and not any(map(is_flagged, files))
+    approximate = exported_files(path, '1')
+    assert approximate and all(map(is_flagged, approximate))
+
+    # Exporting exact results removes the flagged files
+    evaluate(session, {'1': 'batched'})
+    export(ExportController.get_configuration())
+    files = exported_files(path, '1')
+    assert files and not any(map(is_flagged, files))
+    assert len(files) == len(approximate)
+
+    # And exporting approximate results again replaces the exact ones
+    evaluate(session, {'1': 'quick-look'})
+    export(ExportController.get_configuration())
+    assert exported_files(path, '1') == approximate
+
+
+def test_flag_approximate(tmp_path):
+    path = tmp_path / 'Water.h5'
+    names = ['Water_BMrep0_brillouin_shift_f.png',
+             'Water_BMrep0_brillouin_shift_f_approximate.png',
+             'Water_BMrep1_brillouin_shift_f.png',
+             'Water_BMrep1_brillouin_shift_f_approximate.png',
+             'Water_BMrep10_brillouin_shift_f.png',
+             'Water_BMrep1_old.csv',
+             'Water_fluorescence.png']
+    for name in names:
+        (tmp_path / name).touch()
+
+    # Only the written files are flagged, and the outdated
+    # flagged files of the other repetitions are removed
+    written = [tmp_path / name for name in names
+               if name != 'Water_BMrep1_old.csv' and
+               APPROXIMATE_SUFFIX not in name]
+    renamed = flag_approximate(path, written, ['1'])
+    assert [file.name for file in renamed] ==\
+        ['Water_BMrep1_brillouin_shift_f_approximate.png']
+    assert sorted(file.name for file in tmp_path.iterdir()) == [
+        'Water_BMrep0_brillouin_shift_f.png',
+        'Water_BMrep10_brillouin_shift_f.png',
+        'Water_BMrep1_brillouin_shift_f_approximate.png',
+        'Water_BMrep1_old.csv',
+        'Water_fluorescence.png',
+    ]
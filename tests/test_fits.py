@@ -0,0 +1,45 @@
+import numpy as np
+
+from bmlab import fits as bmlab_fits
+from bmlab.fits import lorentz
+
+from bmicro.fits import fit_lorentz_region
+
+
+def spectrum(x, peaks, offset=100):
+    y = offset * np.ones(x.shape)
+    for w0, fwhm, intensity in peaks:
+        y += lorentz(x, w0, fwhm, intensity)
+    return y
+
+
+def test_fit_lorentz_region_warm_start():
+    x = np.linspace(0, 10e9, 300)
+    y = spectrum(x, [(5.1e9, 0.8e9, 200)])
+    region = (3e9, 7e9)
+
+    w0, fwhm, intensity, offset = fit_lorentz_region(
+        region, x, y, guess=(5e9, 1e9, 150, 90))
+    assert np.isclose(w0, 5.1e9, rtol=1e-4)
+    assert np.isclose(fwhm, 0.8e9, rtol=1e-3)
+    assert np.isclose(intensity, 200, rtol=1e-3)
+
+    # Without valid initial parameters, we start from the usual estimates
+    expected = bmlab_fits.fit_lorentz_region(region, x, y)
+    for guess in [None, (np.nan, 1e9, 150, 90)]:
+        assert fit_lorentz_region(region, x, y, guess=guess) == expected
+
+
+def test_fit_lorentz_region_warm_start_multi_peak():
+    x = np.linspace(0, 10e9, 400)
+    y = spectrum(x, [(4.6e9, 0.6e9, 200), (5.6e9, 0.6e9, 150)])
+
+    w0s, fwhms, intensities, offset = fit_lorentz_region(
+        (3e9, 7e9), x, y, nr_peaks=2,
+        bounds_w0=[(3e9, 5e9), (5e9, 7e9)],
+        bounds_fwhm=[(0, np.inf), (0, np.inf)],
+        guess=((4.5e9, 5.5e9), (0.5e9, 0.5e9), (180, 180), 90))
+    assert np.allclose(w0s, (4.6e9, 5.6e9), rtol=1e-4)
+    assert np.allclose(fwhms, (0.6e9, 0.6e9), rtol=1e-3)
+    assert np.allclose(intensities, (200, 150), rtol=1e-3)
+    assert np.isclose(offset, 100, rtol=1e-3)
@@ -0,0 +1,80 @@
+import os
+
+import h5py
+import numpy as np
+import pytest
+
+from bmlab.file import BrillouinFile
+
+from bmicro import hdf5
+from bmicro.synthetic import write_dataset
+
+
+@pytest.fixture
+def brillouin_file(tmp_path):
+    path = tmp_path / 'synthetic.h5'
+    write_dataset(path, resolution=(3, 2, 1), nr_frames=2)
+    brillouin_file = BrillouinFile(path)
+    yield brillouin_file
+    brillouin_file.close()
+
+
+def test_set_chunk_cache(brillouin_file):
+    image = brillouin_file.get_repetition('0').payload.get_image('1')
+
+    hdf5.set_chunk_cache(brillouin_file, 16, 10007)
+    cache = brillouin_file.file.id.get_access_plist().get_cache()
+    assert cache[1:3] == (10007, 16 * 2**20)
+    # The data can still be read through bmlab
+    assert brillouin_file.repetition_keys() == ['0']
+    payload = brillouin_file.get_repetition('0').payload
+    assert np.array_equal(payload.get_image('1'), image)
+
+    # The defaults keep the current settings
+    file = brillouin_file.file
+    hdf5.set_chunk_cache(brillouin_file, 0)
+    assert brillouin_file.file is file
+
+
+def test_get_byte_ranges(tmp_path):
+    path = tmp_path / 'data.h5'
+    data = np.arange(24, dtype='<u2').reshape(2, 3, 4)
+    with h5py.File(path, 'w') as h5:
+        h5.create_dataset('contiguous', data=data)
+        h5.create_dataset('chunked', data=data, chunks=(1, 3, 4))
+
+    with h5py.File(path, 'r') as h5:
+        ranges = {name: hdf5.get_byte_ranges(h5[name])
+                  for name in ['contiguous', 'chunked']}
+    assert len(ranges['contiguous']) == 1
+    assert len(ranges['chunked']) == 2
+
+    with open(path, 'rb') as f:
+        for name, expected in [('contiguous', [data]),
+                               ('chunked', [data[0], data[1]])]:
+            for (offset, size), values in zip(ranges[name], expected):
+                f.seek(offset)
+                assert np.array_equal(
+                    np.frombuffer(f.read(size), dtype='<u2'), values.ravel())
+
+
+@pytest.mark.skipif(not hasattr(os, 'posix_fadvise'),
+                    reason='read-ahead needs posix_fadvise')
+def test_read_ahead(brillouin_file):
+    payload = brillouin_file.get_repetition('0').payload
+    image_keys = payload.image_keys()
+    read_ahead = hdf5.ReadAhead(brillouin_file, payload, image_keys, 2)
+    assert read_ahead.fd is not None
+    read_ahead(image_keys[0])
+    assert read_ahead.advised == 3
+    read_ahead(image_keys[1])
+    assert read_ahead.advised == 4
+    read_ahead(image_keys[-1])
+    assert read_ahead.advised == len(image_keys)
+    read_ahead.close()
+    assert read_ahead.fd is None
+
+    # No read-ahead at all
+    read_ahead = hdf5.ReadAhead(brillouin_file, payload, image_keys, 0)
+    assert read_ahead.fd is None
+    read_ahead(image_keys[0])
@@ -0,0 +1,97 @@
+import gc
+import os
+import threading
+
+import numpy as np
+
+from bmlab.models.evaluation_model import EvaluationModel
+
+from bmicro import out_of_core
+
+
+def test_create_array(tmp_path):
+    array = out_of_core.create_array((3, 2), directory=tmp_path)
+    assert out_of_core.is_mapped(array)
+    assert not out_of_core.is_mapped(array[0])
+    assert np.isnan(array).all()
+    path = array.filename
+    assert os.path.dirname(path) == str(tmp_path)
+
+    like = out_of_core.full_like(array, 1)
+    assert out_of_core.is_mapped(like)
+    assert os.path.dirname(like.filename) == str(tmp_path)
+    assert (like == 1).all()
+    assert not out_of_core.is_mapped(out_of_core.full_like(np.ones(2)))
+
+    # The file is removed with the array
+    del array
+    gc.collect()
+    assert not os.path.exists(path)
+
+    assert out_of_core.create_array((0, 2)).shape == (0, 2)
+
+
+def test_initialize_results_arrays(tmp_path):
+    dims = {
+        'dim_x': 3,
+        'dim_y': 2,
+        'dim_z': 1,
+        'nr_images': 2,
+        'nr_brillouin_regions': 2,
+        'nr_brillouin_peaks': 2,
+        'nr_rayleigh_regions': 1,
+    }
+    expected = EvaluationModel()
+    expected.initialize_results_arrays(dims)
+    evm = EvaluationModel()
+    out_of_core.initialize_results_arrays(evm, dims, tmp_path)
+    assert evm.results.keys() == expected.results.keys()
+    for key, value in expected.results.items():
+        assert evm.results[key].shape == value.shape
+        if value.size:
+            assert out_of_core.is_mapped(evm.results[key])
+            assert np.isnan(evm.results[key]).all()
+
+
+def test_spectra_store(tmp_path):
+    store = out_of_core.SpectraStore(tmp_path)
+    assert isinstance(store, dict)
+    store['0'] = [np.arange(3.), np.arange(4.)]
+    store['1'] = []
+    assert len(store) == 2
+    assert '0' in store
+    assert store.get('2') is None
+    assert store['1'] == []
+    assert [value.tolist() for value in store['0']] == [[0, 1, 2],
+                                                        [0, 1, 2, 3]]
+
+    # Copies keep the arrays stored when they were made
+    copy = store.copy()
+    store['0'] = [np.ones(2)]
+    assert store['0'][0].tolist() == [1, 1]
+    assert copy['0'][0].tolist() == [0, 1, 2]
+    copy['3'] = [np.zeros(1)]
+    assert '3' not in store
+
+    plain = dict(copy)
+    assert type(plain) is dict
+    assert plain['3'][0].tolist() == [0]
+    assert [key for key, _ in store.items()] == ['0', '1']
+    assert store.pop('1') == []
+    assert store.pop('1', None) is None
+
+    # The arrays are stored while others are read
+    threads = [threading.Thread(
+        target=store.__setitem__, args=(str(idx), [np.full(100, idx)]))
+        for idx in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for idx in range(8):
+        assert (store[str(idx)][0] == idx).all()
+
+    path = store.path
+    del store, copy
+    gc.collect()
+    assert not os.path.exists(path)
@@ -0,0 +1,56 @@
+import numpy as np
+import pytest
+
+from bmicro.prefetch import Prefetcher
+
+
+def test_prefetcher():
+    image_keys = [str(idx) for idx in range(10)]
+
+    def extract(image_key):
+        return [np.full(4, int(image_key), dtype=float)]
+
+    prefetcher = Prefetcher(extract, image_keys, depth=3)
+    try:
+        for image_key in image_keys:
+            # Never more points than the depth are extracted ahead
+            assert len(prefetcher.queue) <= 3
+            assert prefetcher.get(image_key)[0][0] == int(image_key)
+    finally:
+        prefetcher.close()
+    assert not prefetcher.thread.is_alive()
+
+
+def test_prefetcher_memory():
+    image_keys = [str(idx) for idx in range(5)]
+    prefetcher = Prefetcher(lambda image_key: np.zeros(2**17), image_keys,
+                            depth=10, max_memory=1.5)
+    try:
+        prefetcher.get('0')
+        prefetcher.thread.join(0.2)
+        # A single point of 1 MiB fits into the memory limit
+        assert len(prefetcher.queue) == 1
+        assert prefetcher.nbytes == 2**20
+        for image_key in image_keys[1:]:
+            assert prefetcher.get(image_key).size == 2**17
+    finally:
+        prefetcher.close()
+
+
+def test_prefetcher_errors():
+    def extract(image_key):
+        if image_key == '1':
+            raise ValueError(image_key)
+        return image_key
+
+    prefetcher = Prefetcher(extract, ['0', '1', '2', '3'])
+    try:
+        assert prefetcher.get('0') == '0'
+        with pytest.raises(ValueError):
+            prefetcher.get('1')
+        # Points requested out of order are extracted directly
+        assert prefetcher.get('3') == '3'
+        assert not prefetcher.thread.is_alive()
+        assert prefetcher.get('2') == '2'
+    finally:
+        prefetcher.close()
@@ -0,0 +1,64 @@
+import json
+
+import pytest
+
+from bmicro.profiling import Profiler, instrument
+
+
+class Dummy(object):
+
+    def work(self, value):
+        return 2 * value
+
+    @staticmethod
+    def static_work(value):
+        return 3 * value
+
+
+@pytest.fixture
+def profiler():
+    profiler = Profiler.get_instance()
+    profiler.enable()
+    yield profiler
+    profiler.disable()
+    profiler.clear()
+
+
+def test_instrument(profiler):
+    instrument({'test': [f'{__name__}:Dummy.work',
+                         f'{__name__}:Dummy.static_work']})
+    # Instrumenting twice must not wrap twice
+    instrument({'test': [f'{__name__}:Dummy.work']})
+
+    dummy = Dummy()
+    assert dummy.work(2) == 4
+    assert dummy.work(3) == 6
+    assert Dummy.static_work(2) == 6
+
+    summary = {entry['name']: entry for entry in profiler.summary()}
+    assert summary['Dummy.work']['calls'] == 2
+    assert summary['Dummy.work']['category'] == 'test'
+    assert summary['Dummy.static_work']['calls'] == 1
+
+    # Surplus arguments, e.g. from Qt signals, are dropped
+    assert Dummy.static_work(2, False) == 6
+
+    # Nothing is recorded when profiling is disabled
+    profiler.disable()
+    dummy.work(1)
+    assert len(profiler.events) == 4
+
+
+def test_write(profiler, tmp_path):
+    with profiler.span('outer', 'test'):
+        with profiler.span('inner', 'test'):
+            pass
+
+    trace_path, summary_path = profiler.write(tmp_path / 'trace.json')
+    with open(trace_path) as f:
+        trace = json.load(f)
+    events = trace['traceEvents']
+    assert [event['name'] for event in events] == ['inner', 'outer']
+    assert all(event['ph'] == 'X' for event in events)
+    assert events[1]['dur'] >= events[0]['dur']
+    assert 'inner' in summary_path.read_text()
@@ -0,0 +1,70 @@
+import math
+
+from bmicro.progress import Throughput, format_duration
+
+
+class Clock:
+    def __init__(self):
+        self.time = 100.
+
+    def __call__(self):
+        return self.time
+
+
+def test_throughput():
+    clock = Clock()
+    throughput = Throughput(100, nr_frames=2, window=10, clock=clock)
+    assert math.isnan(throughput.rate)
+    assert throughput.eta is None
+    assert throughput.summary() == 'ETA --:--'
+
+    clock.time += 5
+    throughput.update(10)
+    assert throughput.rate == 2
+    assert throughput.frame_rate == 4
+    assert throughput.eta == 45
+    assert throughput.summary() == '2.0 px/s, 4.0 frames/s, ETA 0:45'
+
+    # Only the progress within the window counts
+    clock.time += 10
+    throughput.update(60)
+    clock.time += 5
+    throughput.update(70)
+    assert throughput.rate == 4
+    assert throughput.eta == 7.5
+
+    # Stalling slows the rate down
+    clock.time += 5
+    assert throughput.rate == 1
+    clock.time += 10
+    assert throughput.rate == 0
+    assert throughput.eta is None
+    throughput.reset(10)
+    assert throughput.done == 0
+    assert math.isnan(throughput.rate)
+
+
+def test_throughput_workers():
+    throughput = Throughput(unit='frames')
+    throughput.add_worker(1234, 5)
+    throughput.add_worker(42, 3)
+    throughput.add_worker(1234, 2)
+    assert throughput.get_worker_progress() == {1: 7, 2: 3}
+    assert throughput.worker_summary() ==\
+        'Worker 1: 7 frames\nWorker 2: 3 frames'
+
+
+def test_throughput_should_log():
+    clock = Clock()
+    throughput = Throughput(clock=clock)
+    assert not throughput.should_log(30)
+    clock.time += 31
+    assert throughput.should_log(30)
+    assert not throughput.should_log(30)
+
+
+def test_format_duration():
+    assert format_duration(None) == '--:--'
+    assert format_duration(math.inf) == '--:--'
+    assert format_duration(59.6) == '1:00'
+    assert format_duration(3723) == '1:02:03'
@@ -0,0 +1,63 @@
+import numpy as np
+
+from bmlab.fits import lorentz
+
+from bmicro.batch_fits import fit_lorentz_regions
+from bmicro.quick_look import estimate_peaks
+
+
+def spectra(w0=5.1e9, fwhm=0.8e9, intensity=200, offset=100,
+            nr_spectra=20):
+    rng = np.random.default_rng(42)
+    frequencies, intensities, centers = [], [], []
+    for _ in range(nr_spectra):
+        x = np.linspace(0, 10e9, 300) + rng.normal(0, 20e6)
+        center = w0 + rng.normal(0, 100e6)
+        y = offset + lorentz(x, center, fwhm, intensity) +\
+            rng.normal(0, 2, x.shape)
+        frequencies.append(x)
+        intensities.append(y)
+        centers.append(center)
+    return frequencies, intensities, np.array(centers)
+
+
+def test_estimate_peaks():
+    frequencies, intensities, centers = spectra()
+    w0, fwhm, intensity, offset = estimate_peaks(
+        (3e9, 7e9), frequencies, intensities)
+    assert w0.shape == fwhm.shape == intensity.shape == (20, 1)
+    assert offset.shape == (20,)
+    np.testing.assert_allclose(w0[:, 0], centers, rtol=0, atol=10e6)
+    np.testing.assert_allclose(fwhm, 0.8e9, rtol=0.1)
+    np.testing.assert_allclose(intensity, 200, rtol=0.1)
+    np.testing.assert_allclose(offset, 100, rtol=0.2)
+
+    # The estimates are close to the fits
+    fitted = fit_lorentz_regions((3e9, 7e9), frequencies, intensities)
+    np.testing.assert_allclose(w0, fitted[0], rtol=0.01)
+    np.testing.assert_allclose(fwhm, fitted[1], rtol=0.1)
+
+
+def test_estimate_peaks_wide():
+    # The spectra don't fall below half maximum inside the region
+    frequencies, intensities, centers = spectra(fwhm=2e9, offset=0)
+    w0, fwhm, _, _ = estimate_peaks((4e9, 6.2e9), frequencies, intensities)
+    np.testing.assert_allclose(w0[:, 0], centers, rtol=0, atol=50e6)
+    assert np.all(np.isfinite(fwhm[np.isfinite(w0)]))
+
+
+def test_estimate_peaks_invalid():
+    x = np.linspace(0, 10e9, 300)
+    frequencies = [x, x, x]
+    intensities = [np.full(x.shape, 100.), 100 - lorentz(x, 5e9, 1e9, 50),
+                   100 + lorentz(x, 5e9, 1e9, 50)]
+    w0, fwhm, intensity, offset = estimate_peaks(
+        (3e9, 7e9), frequencies, intensities)
+    # A flat spectrum or a dip has no peak
+    assert np.all(np.isnan(w0[:2])) and np.all(np.isnan(offset[:2]))
+    assert np.isfinite(w0[2, 0])
+
+    # Regions without data
+    w0, fwhm, intensity, offset = estimate_peaks(
+        (20e9, 30e9), frequencies, intensities)
+    assert np.all(np.isnan(w0)) and np.all(np.isnan(offset))
@@ -0,0 +1,84 @@
+import concurrent.futures
+
+import numpy as np
+import pytest
+
+from bmlab.session import Session
+
+from bmicro.repetitions import REPETITION_MODELS, cancel_repetitions, \
+    evaluate_current_repetition, get_default_config, merge_repetition, \
+    start_repetitions
+from bmicro.synthetic import write_dataset
+
+
+@pytest.fixture
+def path(tmp_path):
+    path = tmp_path / 'synthetic.h5'
+    write_dataset(path, resolution=(2, 2, 1), nr_repetitions=3, nr_frames=1)
+    yield path
+    Session.get_instance().clear()
+
+
+def evaluate_serial(path, config):
+    session = Session.get_instance()
+    session.set_file(path)
+    results = {}
+    for rep_key in session.file.repetition_keys():
+        session.set_current_repetition(rep_key)
+        evaluate_current_repetition(config)
+        results[rep_key] = {
+            key: value.copy() for key, value
+            in session.evaluation_models[rep_key].results.items()}
+    session.clear()
+    return results
+
+
+def test_evaluate_repetitions(path):
+    config = get_default_config()
+    reference = evaluate_serial(path, config)
+
+    session = Session.get_instance()
+    session.set_file(path)
+    rep_keys = session.file.repetition_keys()
+    pending = start_repetitions(path, rep_keys, config, 2)
+    finished = []
+    # The repetitions are merged as they finish, like the GUI does
+    for future in concurrent.futures.as_completed(list(pending)):
+        rep_key = pending.pop(future)
+        merge_repetition(rep_key, future.result())
+        finished.append(rep_key)
+    assert sorted(finished) == sorted(rep_keys)
+
+    # Every repetition has the same results as in the serial evaluation
+    for rep_key in rep_keys:
+        session.set_current_repetition(rep_key)
+        assert session.peak_selection_model().get_brillouin_regions()
+        results = session.evaluation_model().results
+        for key, value in reference[rep_key].items():
+            np.testing.assert_allclose(results[key], value, equal_nan=True,
+                                       err_msg=key)
+    assert np.isfinite(session.evaluation_model().results[
+        'brillouin_shift_f']).all()
+
+    # The merged session can be saved and loaded again
+    session.save()
+    session.clear()
+    session.set_file(path)
+    session.set_current_repetition(rep_keys[-1])
+    np.testing.assert_allclose(
+        session.evaluation_model().results['brillouin_shift_f'],
+        reference[rep_keys[-1]]['brillouin_shift_f'], equal_nan=True)
+
+
+def test_cancel_repetitions(path):
+    config = get_default_config()
+    pending = start_repetitions(path, ['0', '1', '2'], config, 1)
+    futures = list(pending)
+    # The repetitions not started yet are cancelled
+    cancel_repetitions(futures)
+    assert futures[-1].cancelled()
+    concurrent.futures.wait(futures)
+    for future in futures:
+        assert future.cancelled() or\
+            set(future.result()) == set(REPETITION_MODELS)
+    assert start_repetitions(path, [], config, 2) == {}
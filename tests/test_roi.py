@@ -0,0 +1,66 @@
+import types
+
+import numpy as np
+
+from bmicro.roi import rectangle_mask, polygon_mask, intensity_mask, \
+    get_evaluated_intensity, get_intensity_map
+
+
+def test_rectangle_mask():
+    x, y = np.meshgrid(np.arange(4), np.arange(3), indexing='ij')
+    mask = rectangle_mask(x, y, (2.5, 0.5, 0, 1))
+    assert mask.shape == (4, 3)
+    assert np.array_equal(np.argwhere(mask),
+                          [[1, 0], [1, 1], [2, 0], [2, 1]])
+    # Line scans only have a horizontal extent
+    mask = rectangle_mask(np.arange(4), None, (0.5, 2.5, 0, 0))
+    assert np.array_equal(mask, [False, True, True, False])
+
+
+def test_polygon_mask():
+    x, y = np.meshgrid(np.arange(4), np.arange(4), indexing='ij')
+    mask = polygon_mask(x, y, [(-0.5, -0.5), (4, -0.5), (-0.5, 4)])
+    assert np.array_equal(mask, x + y <= 3)
+
+
+def test_intensity_mask():
+    intensity = np.array([[100, np.nan], [150, 120]])
+    mask = intensity_mask(intensity, 120)
+    assert np.array_equal(mask, [[False, False], [True, True]])
+
+
+def test_get_evaluated_intensity():
+    # Two points with two images each, the second one is not evaluated
+    evm = types.SimpleNamespace(results={'intensity': np.reshape(
+        [10, 20, np.nan, np.nan], (2, 1, 1, 2, 1, 1))})
+    intensity = get_evaluated_intensity(evm, (2, 1, 1))
+    np.testing.assert_array_equal(intensity, [[[15]], [[np.nan]]])
+    # The results belong to another resolution
+    assert np.isnan(get_evaluated_intensity(evm, (1, 2, 1))).all()
+    assert np.isnan(get_evaluated_intensity(None, (1, 2, 1))).all()
+
+
+def test_get_intensity_map():
+    class Session:
+        read = []
+
+        def get_payload_resolution(self):
+            return 2, 1, 1
+
+        def get_image_keys(self):
+            return ['0', '1']
+
+        def get_payload_image(self, image_key):
+            self.read.append(image_key)
+            return np.full((2, 3, 3), 10. * (int(image_key) + 1))
+
+    session = Session()
+    intensity = get_intensity_map(session)
+    np.testing.assert_array_equal(intensity, [[[10]], [[20]]])
+    assert session.read == ['0', '1']
+
+    # Only the points not known yet are read
+    session.read = []
+    intensity = get_intensity_map(session, np.array([[[5]], [[np.nan]]]))
+    np.testing.assert_array_equal(intensity, [[[5]], [[20]]])
+    assert session.read == ['1']
@@ -0,0 +1,52 @@
+import numpy as np
+
+from bmlab.file import is_source_file
+from bmlab.session import Session
+
+from bmicro.synthetic import write_dataset, read_ground_truth
+
+
+def test_write_dataset(tmp_path):
+    path = tmp_path / 'synthetic.h5'
+    ground_truth = write_dataset(
+        path, resolution=(3, 2, 2), nr_repetitions=2, nr_calibrations=3,
+        nr_frames=1, nr_calibration_frames=2, image_shape=(120, 150))
+    assert is_source_file(path)
+
+    session = Session.get_instance()
+    try:
+        session.set_file(path)
+        assert session.file.repetition_keys() == ['0', '1']
+        session.set_current_repetition('1')
+        assert session.get_payload_resolution() == (3, 2, 2)
+        assert session.get_image_keys() ==\
+            [str(key) for key in range(12)]
+        assert session.get_calib_keys() == ['0', '1', '2']
+        assert session.get_calibration_image('0').shape == (2, 120, 150)
+        assert session.get_payload_image('11').shape == (1, 120, 150)
+        positions = session.get_payload_positions()
+        assert positions['x'].shape == (3, 2, 2)
+        assert np.all(positions['x'][2, :, :] == 2)
+        assert np.all(positions['z'][:, :, 1] == 1)
+    finally:
+        session.clear()
+
+    stored = read_ground_truth(path)
+    assert stored.keys() == ground_truth.keys()
+    for rep_key, parameters in ground_truth.items():
+        for parameter, value in parameters.items():
+            assert value.shape == (3, 2, 2)
+            assert np.array_equal(stored[rep_key][parameter], value)
+
+
+def test_write_dataset_brillouin_shift(tmp_path):
+    path = tmp_path / 'synthetic.h5'
+    ground_truth = write_dataset(path, resolution=(2, 2, 1),
+                                 brillouin_shift=5.5e9)
+    assert np.all(ground_truth['0']['brillouin_shift_f'] == 5.5e9)
+
+    ground_truth = write_dataset(
+        path, resolution=(3, 2, 1), step=0.5,
+        brillouin_shift=lambda x, y, z: 5e9 + 1e9 * x - 1e8 * y)
+    assert np.isclose(ground_truth['0']['brillouin_shift_f'][2, 1, 0],
+                      6e9 - 0.5e8)
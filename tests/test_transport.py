@@ -0,0 +1,90 @@
+import concurrent.futures
+import multiprocessing as mp
+
+import numpy as np
+import pytest
+
+from bmicro import out_of_core, transport
+
+
+def square(packed, result):
+    with transport.attach(packed) as arrays:
+        transport.get_array(result)[:] = [
+            sum(np.sum(array ** 2) for array in values) for values in arrays]
+    return len(arrays)
+
+
+def assert_freed(descriptor):
+    with pytest.raises(FileNotFoundError):
+        transport.SharedMemory(name=descriptor.name)
+
+
+def test_shared_arrays():
+    spectra = [[np.arange(3.), np.arange(4.)], [np.arange(2.)], []]
+    with transport.SharedArrays() as shared:
+        result, descriptor = shared.create(np.zeros(3))
+        packed = shared.pack(spectra)
+        assert transport.is_shared(packed)
+
+        with transport.attach(packed) as arrays:
+            assert [[array.tolist() for array in values]
+                    for values in arrays] ==\
+                [[array.tolist() for array in values] for values in spectra]
+
+        # Another process reads the arrays and writes the results
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+            assert pool.submit(square, packed, descriptor).result() == 3
+        assert result.tolist() == [5 + 14, 1, 0]
+
+        shared.release(packed)
+        assert_freed(packed)
+    # The shared memory is freed, but the array can still be used
+    assert_freed(descriptor)
+    result += 1
+    assert result.tolist() == [20, 2, 1]
+
+
+def test_shared_arrays_unavailable():
+    spectra = [[np.arange(3.)]]
+    with transport.SharedArrays() as shared:
+        shared.available = False
+        array, descriptor = shared.create(np.ones(2))
+        assert descriptor is None
+        assert shared.pack(spectra) is spectra
+        # Values not shared are passed through
+        with transport.attach(spectra) as arrays:
+            assert arrays is spectra
+
+
+def test_mapped_arrays(tmp_path):
+    mapped = out_of_core.create_array((3,), directory=tmp_path)
+    packed = [[np.arange(2.)], [np.ones(2)], []]
+    with transport.SharedArrays() as shared:
+        # Arrays mapped from a file are not copied
+        result, descriptor = shared.create(mapped)
+        assert result is mapped
+        assert isinstance(descriptor, transport.MappedArray)
+
+        with concurrent.futures.ProcessPoolExecutor(
+                max_workers=1, mp_context=mp.get_context('spawn')) as pool:
+            assert pool.submit(square, packed, descriptor).result() == 3
+        assert mapped.tolist() == [1, 2, 0]
+        with transport.attach(descriptor) as array:
+            assert array.tolist() == [1, 2, 0]
+    transport.detach_unused([])
+
+
+def test_detach_unused():
+    with transport.SharedArrays() as shared:
+        _, first = shared.create(np.zeros(3))
+        _, second = shared.create(np.ones(2))
+        transport.get_array(first)
+        array = transport.get_array(second)
+        transport.detach_unused([second])
+        assert first.name not in transport._attached
+        assert second.name in transport._attached
+        transport.detach_unused([])
+        assert not transport._attached
+        # Arrays attached before stay usable
+        assert array.tolist() == [1., 1.]
@@ -0,0 +1,72 @@
+import os
+import time
+
+from concurrent.futures.process import BrokenProcessPool
+import pytest
+
+from bmicro.workers import WorkerPool
+
+
+@pytest.fixture
+def pool():
+    pool = WorkerPool(max_restarts=1)
+    yield pool
+    pool.shutdown()
+
+
+def test_reuse(pool):
+    executor = pool.start(2)
+    pids = {pool.submit(os.getpid).result() for _ in range(10)}
+    assert os.getpid() not in pids
+    assert len(pids) <= 2
+
+    # Starting again keeps the workers
+    assert pool.start(2) is executor
+    assert pool.submit(os.getpid).result() in pids
+    assert pool.check_health()
+
+    # Changing the number of workers replaces them
+    assert pool.start(1) is not executor
+    assert pool.nr_workers == 1
+
+
+def test_restart(pool):
+    pool.start(1)
+    pid = pool.submit(os.getpid).result()
+
+    # A crashing worker breaks the pool
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+
+    # The next task restarts it
+    assert pool.submit(os.getpid).result() != pid
+    assert len(pool.restarts) == 1
+
+    # Crashing too often is an error
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+    with pytest.raises(RuntimeError):
+        pool.submit(os.getpid)
+    assert pool.executor is None
+
+
+def test_check_health(pool):
+    assert not pool.check_health()
+    pool.start(1)
+    assert pool.check_health()
+    with pytest.raises(BrokenProcessPool):
+        pool.submit(os._exit, 1).result()
+    assert not pool.check_health()
+    assert pool.check_health()
+
+
+def test_shutdown_hanging(pool):
+    pool.start(1)
+    pool.submit(os.getpid).result()
+    pool.submit(time.sleep, 60)
+    processes = list(pool.executor._processes.values())
+    pool.shutdown()
+    # The worker hanging in its task is terminated
+    for process in processes:
+        process.join(10)
+        assert not process.is_alive()